@@ -1,15 +1,22 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from db import SYNC_DATABASE_URI
 from models import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
+# DATABASE_URL / ALEMBIC_DATABASE_URL (env or .env) take precedence over alembic.ini,
+# so migrations run against the same database as the bot and the dashboard.
+if os.getenv("DATABASE_URL") or os.getenv("ALEMBIC_DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", SYNC_DATABASE_URI.replace("%", "%%"))
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
@@ -0,0 +1,27 @@
+"""index conversation_state by provider and age for the TTL sweeper
+
+Revision ID: a7c3e9d2f416
+Revises: e5f2a7c1d803
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c3e9d2f416"
+down_revision: Union[str, Sequence[str], None] = "e5f2a7c1d803"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_conversation_state_provider_updated_at", "conversation_state", ["provider", "updated_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_conversation_state_provider_updated_at", table_name="conversation_state")
@@ -0,0 +1,44 @@
+"""add registry counter table
+
+Revision ID: b7d41c2e9a10
+Revises: 6f0f3d0d8d6a
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7d41c2e9a10"
+down_revision: Union[str, Sequence[str], None] = "6f0f3d0d8d6a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "registry_counter",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+    registry_counter_table = sa.table(
+        "registry_counter",
+        sa.column("name", sa.String()),
+        sa.column("value", sa.BigInteger()),
+        sa.column("updated_at", sa.DateTime()),
+    )
+    op.bulk_insert(
+        registry_counter_table,
+        [{"name": "data_revision", "value": 0, "updated_at": datetime.utcnow()}],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("registry_counter")
@@ -0,0 +1,35 @@
+"""add event rollup table
+
+Revision ID: c3e8f51a7b24
+Revises: b7d41c2e9a10
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3e8f51a7b24"
+down_revision: Union[str, Sequence[str], None] = "b7d41c2e9a10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "event_rollup",
+        sa.Column("granularity", sa.String(length=8), nullable=False),
+        sa.Column("event", sa.String(length=32), nullable=False),
+        sa.Column("dimension", sa.String(length=32), nullable=False),
+        sa.Column("dimension_value", sa.String(length=64), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("granularity", "event", "dimension", "dimension_value", "bucket_start"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("event_rollup")
@@ -0,0 +1,79 @@
+"""add fts5 trigram search index for users and companies
+
+Revision ID: d1a4b6c9e352
+Revises: c3e8f51a7b24
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d1a4b6c9e352"
+down_revision: Union[str, Sequence[str], None] = "c3e8f51a7b24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# SQLite only: names are case-folded by the trigram tokenizer, ё -> е by replace().
+UPGRADE_STATEMENTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(name, phone, tokenize = 'trigram case_sensitive 0')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS company_search USING fts5(name, tokenize = 'trigram case_sensitive 0')",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_search(rowid, name, phone)
+        VALUES (new.id, replace(replace(trim(coalesce(new.last_name, '') || ' ' || coalesce(new.first_name, '') || ' ' || coalesce(new.father_name, '')), 'ё', 'е'), 'Ё', 'Е'), coalesce(new.phone_number, ''));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON "user" BEGIN
+        DELETE FROM user_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_au
+    AFTER UPDATE OF last_name, first_name, father_name, phone_number ON "user" BEGIN
+        DELETE FROM user_search WHERE rowid = old.id;
+        INSERT INTO user_search(rowid, name, phone)
+        VALUES (new.id, replace(replace(trim(coalesce(new.last_name, '') || ' ' || coalesce(new.first_name, '') || ' ' || coalesce(new.father_name, '')), 'ё', 'е'), 'Ё', 'Е'), coalesce(new.phone_number, ''));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS company_search_ai AFTER INSERT ON company BEGIN
+        INSERT INTO company_search(rowid, name) VALUES (new.id, replace(replace(coalesce(new.name, ''), 'ё', 'е'), 'Ё', 'Е'));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS company_search_ad AFTER DELETE ON company BEGIN
+        DELETE FROM company_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS company_search_au AFTER UPDATE OF name ON company BEGIN
+        DELETE FROM company_search WHERE rowid = old.id;
+        INSERT INTO company_search(rowid, name) VALUES (new.id, replace(replace(coalesce(new.name, ''), 'ё', 'е'), 'Ё', 'Е'));
+    END""",
+    "DELETE FROM user_search",
+    """INSERT INTO user_search(rowid, name, phone)
+    SELECT u.id, replace(replace(trim(coalesce(u.last_name, '') || ' ' || coalesce(u.first_name, '') || ' ' || coalesce(u.father_name, '')), 'ё', 'е'), 'Ё', 'Е'), coalesce(u.phone_number, '') FROM "user" AS u""",
+    "DELETE FROM company_search",
+    """INSERT INTO company_search(rowid, name)
+    SELECT c.id, replace(replace(coalesce(c.name, ''), 'ё', 'е'), 'Ё', 'Е') FROM company AS c""",
+)
+
+DOWNGRADE_STATEMENTS = (
+    "DROP TRIGGER IF EXISTS user_search_ai",
+    "DROP TRIGGER IF EXISTS user_search_ad",
+    "DROP TRIGGER IF EXISTS user_search_au",
+    "DROP TRIGGER IF EXISTS company_search_ai",
+    "DROP TRIGGER IF EXISTS company_search_ad",
+    "DROP TRIGGER IF EXISTS company_search_au",
+    "DROP TABLE IF EXISTS user_search",
+    "DROP TABLE IF EXISTS company_search",
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for statement in UPGRADE_STATEMENTS:
+        op.execute(sa.text(statement))
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for statement in DOWNGRADE_STATEMENTS:
+        op.execute(sa.text(statement))
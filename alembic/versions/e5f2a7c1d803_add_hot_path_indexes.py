@@ -0,0 +1,46 @@
+"""add indexes for hot lookups
+
+Revision ID: e5f2a7c1d803
+Revises: d1a4b6c9e352
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e5f2a7c1d803"
+down_revision: Union[str, Sequence[str], None] = "d1a4b6c9e352"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_user_tg_id", "user", ["tg_id"],
+        sqlite_where=sa.text("tg_id IS NOT NULL"), postgresql_where=sa.text("tg_id IS NOT NULL"),
+    )
+    op.create_index("ix_user_status", "user", ["status"])
+    op.create_index("ix_user_status_registered_at", "user", ["status", "registered_at"])
+    op.create_index("ix_user_company_name", "user", ["company_id", "last_name", "first_name"])
+    op.create_index(
+        "ix_user_volunteer_status", "user", ["volunteer_id", "status"],
+        sqlite_where=sa.text("volunteer_id IS NOT NULL"), postgresql_where=sa.text("volunteer_id IS NOT NULL"),
+    )
+    op.create_index("ix_user_volunteer_tg_id", "user_volunteer", ["tg_id"])
+    op.create_index("ix_user_identity_user_id", "user_identity", ["user_id"])
+    op.create_index("ix_volunteer_identity_volunteer_id", "volunteer_identity", ["volunteer_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_volunteer_identity_volunteer_id", table_name="volunteer_identity")
+    op.drop_index("ix_user_identity_user_id", table_name="user_identity")
+    op.drop_index("ix_user_volunteer_tg_id", table_name="user_volunteer")
+    op.drop_index("ix_user_volunteer_status", table_name="user")
+    op.drop_index("ix_user_company_name", table_name="user")
+    op.drop_index("ix_user_status_registered_at", table_name="user")
+    op.drop_index("ix_user_status", table_name="user")
+    op.drop_index("ix_user_tg_id", table_name="user")
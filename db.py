@@ -1,12 +1,232 @@
+import logging
+import os
+from dataclasses import dataclass
+
+from sqlalchemy import create_engine, event, make_url, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
-DATABASE_URI = "sqlite+aiosqlite:///app.db"
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+logger = logging.getLogger(__name__)
+
+# db is imported before vars.py loads .env, so read it here as well.
+if load_dotenv is not None:
+    load_dotenv()
+
+# Async driver -> sync driver for scripts and Alembic.
+_SYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql+asyncpg": "postgresql+psycopg",
+}
+
+
+def sync_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = _SYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+DATABASE_URI = os.getenv("DATABASE_URL") or "sqlite+aiosqlite:///app.db"
+SYNC_DATABASE_URI = os.getenv("ALEMBIC_DATABASE_URL") or sync_database_url(DATABASE_URI)
+
+SQLITE_MAINTENANCE_SECONDS = 600.0
+# Free pages handed back to the file system per maintenance run.
+SQLITE_VACUUM_PAGES = 1000
+
+
+@dataclass(frozen=True)
+class SqliteProfile:
+    """PRAGMAs applied to every SQLite connection.
+
+    app.db is opened at the same time by the bot, the dashboard and import scripts:
+    WAL lets readers and the writer work concurrently, busy_timeout makes a writer
+    wait for the lock instead of failing with "database is locked".
+
+    auto_vacuum=INCREMENTAL applies to a new database right away; an existing one
+    switches on its next manual ``VACUUM``. After that ``sqlite_maintenance`` returns
+    pages freed by deletes to the file system a few at a time.
+    """
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    busy_timeout_ms: int = 5000
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size_kib: int = 64 * 1024
+    temp_store: str = "MEMORY"
+    auto_vacuum: str = "INCREMENTAL"
+
+    @classmethod
+    def from_env(cls) -> "SqliteProfile":
+        defaults = cls()
+        return cls(
+            journal_mode=os.getenv("SQLITE_JOURNAL_MODE", defaults.journal_mode),
+            synchronous=os.getenv("SQLITE_SYNCHRONOUS", defaults.synchronous),
+            busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", defaults.busy_timeout_ms)),
+            mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", defaults.mmap_size)),
+            cache_size_kib=int(os.getenv("SQLITE_CACHE_SIZE_KIB", defaults.cache_size_kib)),
+            temp_store=os.getenv("SQLITE_TEMP_STORE", defaults.temp_store),
+            auto_vacuum=os.getenv("SQLITE_AUTO_VACUUM", defaults.auto_vacuum),
+        )
+
+    def pragmas(self) -> list[str]:
+        return [
+            # busy_timeout first: switching to WAL itself needs the lock.
+            f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}",
+            f"PRAGMA auto_vacuum = {self.auto_vacuum}",
+            f"PRAGMA journal_mode = {self.journal_mode}",
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA mmap_size = {int(self.mmap_size)}",
+            # Negative cache_size is in KiB rather than pages.
+            f"PRAGMA cache_size = {-int(self.cache_size_kib)}",
+            f"PRAGMA temp_store = {self.temp_store}",
+        ]
+
+
+SQLITE_PROFILE = SqliteProfile.from_env()
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+@dataclass(frozen=True)
+class PoolProfile:
+    """Connection pool for a server database (PostgreSQL).
+
+    Several bot and dashboard workers share one server, so each process keeps a
+    bounded pool; pre-ping drops connections the server closed while idle.
+    ``statement_cache_size`` is asyncpg's per-connection prepared statement cache,
+    set it to 0 behind pgbouncer in transaction mode.
+    """
 
-engine = create_async_engine(DATABASE_URI, echo=False, future=True)
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    pre_ping: bool = True
+    statement_cache_size: int = 500
+    application_name: str = "lgzt_registry"
+
+    @classmethod
+    def from_env(cls) -> "PoolProfile":
+        defaults = cls()
+        return cls(
+            pool_size=int(os.getenv("DB_POOL_SIZE", defaults.pool_size)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", defaults.max_overflow)),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", defaults.pool_timeout)),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", defaults.pool_recycle)),
+            pre_ping=_env_flag("DB_POOL_PRE_PING", defaults.pre_ping),
+            statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", defaults.statement_cache_size)),
+            application_name=os.getenv("DB_APPLICATION_NAME", defaults.application_name),
+        )
+
+    def engine_kwargs(self, url: str) -> dict:
+        """Keyword arguments for ``create_engine`` / ``create_async_engine`` with ``url``."""
+        parsed = make_url(url)
+        if parsed.get_backend_name() == "sqlite":
+            return {}
+        kwargs = {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pre_ping,
+        }
+        if parsed.get_driver_name() == "asyncpg":
+            kwargs["connect_args"] = {
+                "prepared_statement_cache_size": self.statement_cache_size,
+                "server_settings": {"application_name": self.application_name},
+            }
+        return kwargs
+
+
+POOL_PROFILE = PoolProfile.from_env()
+
+
+def install_sqlite_profile(target, profile: SqliteProfile = SQLITE_PROFILE, *, read_only: bool = False):
+    """Apply ``profile`` on every new connection of a sync or async SQLite engine.
+
+    ``read_only`` also sets ``query_only`` so a pool meant for queries can never take
+    the write lock by accident.
+    """
+    sync_engine = getattr(target, "sync_engine", target)
+    if sync_engine.dialect.name != "sqlite":
+        return target
+
+    pragmas = profile.pragmas()
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_profile(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return target
+
+
+def create_sync_engine(url: str = SYNC_DATABASE_URI, **kwargs):
+    """Engine for the synchronous import / seed scripts, with the same storage profile."""
+    kwargs.setdefault("future", True)
+    for key, value in POOL_PROFILE.engine_kwargs(url).items():
+        kwargs.setdefault(key, value)
+    return install_sqlite_profile(create_engine(url, **kwargs))
+
+
+def create_app_engine(url: str = DATABASE_URI, *, read_only: bool = False, **kwargs):
+    """Async engine for ``url``: SQLite gets the storage profile, a server database the pool profile."""
+    kwargs.setdefault("echo", False)
+    kwargs.setdefault("future", True)
+    for key, value in POOL_PROFILE.engine_kwargs(url).items():
+        kwargs.setdefault(key, value)
+    return install_sqlite_profile(create_async_engine(url, **kwargs), read_only=read_only)
+
+
+engine = create_app_engine()
 
 # scoped_session so you can safely use it in multi‑threaded contexts
 SessionLocal = async_sessionmaker(
     bind=engine,
     expire_on_commit=False,
     class_=AsyncSession,
-)
\ No newline at end of file
+)
+
+# Separate pool for pure reads (lists, profiles, dashboard tables). In WAL mode these
+# connections never wait on the writer; writes go through services.write_coordinator.
+# A server database handles concurrent readers itself, so there it is the main pool.
+read_engine = create_app_engine(read_only=True) if engine.dialect.name == "sqlite" else engine
+
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+)
+
+
+async def sqlite_maintenance() -> None:
+    """Periodic housekeeping: fold the WAL back into the database without blocking, refresh
+    stats and, with auto_vacuum=INCREMENTAL, release a bounded number of free pages."""
+    if engine.dialect.name != "sqlite":
+        return
+    async with engine.connect() as conn:
+        if (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() == 2:
+            # Executed as a statement the driver steps the PRAGMA once and frees a single
+            # page; executescript runs it to completion.
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({SQLITE_VACUUM_PAGES});")
+        busy, wal_pages, checkpointed = (await conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))).one()
+        await conn.execute(text("PRAGMA optimize"))
+        await conn.commit()
+    logger.debug("WAL checkpoint: busy=%s, wal pages=%s, checkpointed=%s", busy, wal_pages, checkpointed)
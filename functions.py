@@ -1,14 +1,18 @@
-from db import SessionLocal, engine
 from models import User, Company, User_who_blocked, User_volunteer
-from sqlalchemy import select, update, MetaData, func, insert
-from datetime import datetime, timedelta
-import aiohttp
-import pandas as pd
-from random import randint
+from sqlalchemy import select, update, insert
+from datetime import datetime
 from pprint import pprint
 import logging
 import asyncio
 from services.platform import IdentityService, PlatformSchemaUnavailable
+from services.company_catalog import CatalogCompany, company_catalog
+from services.excel_export import DEFAULT_EXPORT_PATH, export_registry
+from services.identity_cache import MISSING, USER, VOLUNTEER, identity_cache, last_seen_updater
+from services.read_models import load_user_profile
+from services.roster_index import roster_index
+from services.sms_gateway import sms_gateway
+from services.stats import registry_stats
+from services.unit_of_work import defer_write, read_session, submit_write
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +21,7 @@ async def _link_telegram_user_identity(session, user: User, payload: dict | None
     if user is None or user.tg_id is None:
         return None
     try:
-        return await IdentityService.link_user_identity(
+        identity = await IdentityService.link_user_identity(
             session=session,
             user_id=user.id,
             provider="telegram",
@@ -26,13 +30,15 @@ async def _link_telegram_user_identity(session, user: User, payload: dict | None
         )
     except PlatformSchemaUnavailable:
         return None
+    identity_cache.invalidate(USER, "telegram", user.tg_id)
+    return identity
 
 
 async def _link_telegram_volunteer_identity(session, volunteer: User_volunteer, payload: dict | None = None):
     if volunteer is None or volunteer.tg_id is None:
         return None
     try:
-        return await IdentityService.link_volunteer_identity(
+        identity = await IdentityService.link_volunteer_identity(
             session=session,
             volunteer_id=volunteer.id,
             provider="telegram",
@@ -41,170 +47,113 @@ async def _link_telegram_volunteer_identity(session, volunteer: User_volunteer,
         )
     except PlatformSchemaUnavailable:
         return None
+    identity_cache.invalidate(VOLUNTEER, "telegram", volunteer.tg_id)
+    return identity
 
 async def check_surname(surname):
 
-    stmt = select(User).where(User.last_name == surname)
-
-    async with SessionLocal() as session:
-
-        result = await session.execute(stmt)
-
-        user_result = result.scalars().all()
-
-        if len(user_result) == 0:
-
-            return False
-        else:
-            return True
+    return await roster_index.surname_exists(surname)
 
 
 async def check_dob_and_status(dob, surname):
 
-    print('checking user with dob', dob)
-
-    stmt = select(User).where(User.date_of_birth == dob).where(User.last_name == surname)
-
-    async with SessionLocal() as session:
-
-        result = await session.execute(stmt)
-
-        result = result.scalars().all()
-
-        if len(result) == 0:
-
-            return False
-        else:
+    entry = await roster_index.find(surname, dob)
 
-            return result[0]
+    if entry is None:
 
+        return False
+    else:
 
+        return entry
 
 
 async def send_code(phone_number):
 
-    code = randint(10, 99)
-
-    message = f"Ваш код для подтверждения: {code}"
-    timeout = aiohttp.ClientTimeout(total=10, connect=5, sock_read=5)
-    sms_url = "https://smsc.ru/sys/send.php"
-    params = {
-        "login": "lgjt",
-        "psw": "123456",
-        "phones": phone_number,
-        "mes": message,
-        "sender": "kotelnikiru",
-    }
-
-    try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url=sms_url, params=params) as response:
-                response_text = (await response.text()).strip()
-                if response.status != 200:
-                    logger.error("SMS API HTTP %s: %s", response.status, response_text)
-                    return None
-                logger.info("SMS API response: %s", response_text)
-                if not response_text:
-                    return None
-                return str(code)
-    except aiohttp.ClientError as e:
-        logger.error("SMS API network error: %s", e)
-        return None
-    except asyncio.TimeoutError:
-        logger.error("SMS API timeout for phone %s", phone_number)
-        return None
-    except Exception as e:
-        logger.error("SMS API unexpected error: %s", e, exc_info=True)
-        return None
+    # Кулдаун и дедупликация повторных нажатий - внутри шлюза
+    return await sms_gateway.send_code(phone_number)
 
 async def get_company_list() -> str:
 
-    stmt = select(Company)
-
-    async with SessionLocal() as session:
-
-        result = await session.execute(stmt)
-
-        companies_objects = result.scalars().all()
-
-        mystr = ''
-
-        for i in companies_objects:
-            mystr = f"{mystr}\n{i.id} - {i.name}"
-
-        return mystr
-
+    return await company_catalog.listing_text()
 
 
-async def check_if_company_exists(company_id: int) -> Company | None:
+async def check_if_company_exists(company_id: int) -> CatalogCompany | None:
 
-    async with SessionLocal() as session:
-
-        return await session.get(Company, company_id)
+    return await company_catalog.get(company_id)
 
 async def find_user_by_tg_id(user_tg_id):
 
-    async with SessionLocal() as session:
+    cached_user_id = identity_cache.get(USER, "telegram", user_tg_id)
+    if cached_user_id is not MISSING:
+        if cached_user_id is None:
+            return False
+        last_seen_updater.touch(USER, "telegram", user_tg_id)
+        return cached_user_id
+
+    async with read_session() as session:
         try:
             user = await IdentityService.get_user_by_identity(session, "telegram", user_tg_id)
             if user:
-                await _link_telegram_user_identity(
-                    session,
-                    user,
-                    payload={"source": "identity_lookup"},
-                )
-                await session.commit()
+                identity_cache.set(USER, "telegram", user_tg_id, user.id)
+                last_seen_updater.touch(USER, "telegram", user_tg_id)
                 return user.id
         except PlatformSchemaUnavailable:
             pass
 
-        stmt = select(User).where(User.tg_id == user_tg_id)
+        stmt = select(User.id).where(User.tg_id == user_tg_id)
 
         query = await session.execute(stmt)
 
-        user = query.scalars().first()
-        if user:
-            linked = await _link_telegram_user_identity(
+        user_id = query.scalars().first()
+
+    if user_id:
+
+        async def write(session):
+            user = await session.get(User, user_id)
+            await _link_telegram_user_identity(
                 session,
                 user,
                 payload={"source": "legacy_tg_id_lookup"},
             )
-            if linked is not None:
-                await session.commit()
 
-            return user.id
-        else:
-            print('no such registered user in db!')
-            return False
+        # Привязка ответ не меняет - уходит общим коммитом в конце обновления
+        await defer_write(write)
+        identity_cache.set(USER, "telegram", user_tg_id, user_id)
 
+        return user_id
+    else:
+        identity_cache.set(USER, "telegram", user_tg_id, None)
+        logger.debug("No user linked to Telegram id %s", user_tg_id)
+        return False
 
-async def assign_company(user_id, company_id):
-
-    stmt = select(User).where(User.id == user_id)
 
-    async with SessionLocal() as session:
+async def assign_company(user_id, company_id):
 
-        result = await session.execute(stmt)
+    async with read_session() as session:
 
-        user = result.scalars().one_or_none()
+        user = await session.get(User, user_id)
+        company = await session.get(Company, company_id) if user is not None else None
 
-        if user is not None:
+    if user is None:
 
-            company = await session.get(Company, company_id)
+        logger.debug("assign_company: user %s not found", user_id)
+        return False
 
-            if company is None:
+    if company is None:
 
-                print("Tried to assign a company, but company is None...")
-                return False
-            else:
-                user.company = company
-                await session.commit()
-                return True
+        logger.debug("assign_company: company %s not found", company_id)
+        return False
 
-        else:
+    async def write(session):
+        # Через ORM, а не Core update: счётчики статистики и ревизия данных
+        # обновляются хуками сессии
+        user = await session.get(User, user_id)
+        if user is not None:
+            user.company_id = company_id
 
-            print("User is none in assign company function!")
-            return False
+    # За выбором предприятия сразу идёт register_user - запишутся одним коммитом
+    await defer_write(write)
+    return True
 
 async def register_user(user_botdata) -> True | False:
 
@@ -215,94 +164,78 @@ async def register_user(user_botdata) -> True | False:
     home_address = user_botdata['home_address']
     registered_at = datetime.now()
     tg_id = user_botdata['user_tg_id']
+    current_status = None
+
+    async def write(session):
+        nonlocal current_status
+
+        # Статус перечитывается в транзакции записи (с блокировкой строки на PostgreSQL):
+        # индекс реестра в памяти мог не увидеть регистрацию через MAX
+        user = await session.get(User, user_id, with_for_update=True)
+
+        if not user:
+            return None
+
+        # Как и в MAX: заблокированный профиль регистрировать нельзя
+        if user.status in ('registered', 'blocked'):
+            current_status = user.status
+            return None
+
+        user.status = 'registered'
+        user.first_name = name
+        user.father_name = father_name
+        user.phone_number = phone_number
+        user.address = home_address
+        user.registered_at = registered_at
+        user.tg_id = tg_id
+        user.volunteer_id = user_botdata.get('volunteer_id')
+        user.sms_code = user_botdata.get('sms_code')
+        sms_ts = user_botdata.get('sms_confirmed_at')
+        if sms_ts:
+            user.sms_confirmed_at = datetime.fromisoformat(sms_ts)
+
+        await _link_telegram_user_identity(
+            session,
+            user,
+            payload={
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "father_name": user.father_name,
+                "phone_number": user.phone_number,
+            },
+        )
+        return user
 
-    async with SessionLocal() as session:
-
-        user = await session.get(User, user_id)
-
-        if user:
+    # Коммит общий с другими записями из той же пачки; вернётся уже после него
+    user = await submit_write(write)
 
-            print(f'\nUser before registration:\n')
-            print(f"User id: {user.id}")
-            print(f"User name: {user.first_name}")
-            print(f"User last name: {user.last_name}")
-            print(f"User father name: {user.father_name}")
-            print(f"User phone_number: {user.phone_number}")
-            print(f"User dob: {user.date_of_birth}")
-            print(f"User status: {user.status}")
-            print(f"User address: {user.address}")
-            print(f"User registered at: {user.registered_at}")
-            print(f"User tg id: {user.tg_id}")
-
-
-            user.status = 'registered'
-            user.first_name = name
-            user.father_name = father_name
-            user.phone_number = phone_number
-            user.address = home_address
-            user.registered_at = registered_at
-            user.tg_id = tg_id
-            user.volunteer_id = user_botdata.get('volunteer_id')
-            user.sms_code = user_botdata.get('sms_code')
-            sms_ts = user_botdata.get('sms_confirmed_at')
-            if sms_ts:
-                user.sms_confirmed_at = datetime.fromisoformat(sms_ts)
+    if current_status is not None:
+        logger.warning("User %s is already %s, registration skipped", user_id, current_status)
+        roster_index.set_status(user_id, current_status)
 
-            await _link_telegram_user_identity(
-                session,
-                user,
-                payload={
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "father_name": user.father_name,
-                    "phone_number": user.phone_number,
-                },
-            )
-            await session.commit()
-
-            await session.refresh(user)
-
-            print("\n\nUser after registration:\n")
-            print(f"User id: {user.id}")
-            print(f"User name: {user.first_name}")
-            print(f"User last name: {user.last_name}")
-            print(f"User father name: {user.father_name}")
-            print(f"User phone_number: {user.phone_number}")
-            print(f"User dob: {user.date_of_birth}")
-            print(f"User status: {user.status}")
-            print(f"User address: {user.address}")
-            print(f"User registered at: {user.registered_at}")
-            print(f"User tg id: {user.tg_id}")
-
-            return True
-        else:
-            print('no such user with id', user_id, 'in function register user')
-            return False
+    if user:
+        roster_index.set_status(user.id, user.status)
+        logger.debug("User %s registered, company %s", user.id, user.company_id)
+        return True
+    elif current_status is None:
+        logger.debug("register_user: user %s not found", user_id)
+    return False
 
 
 async def prepare_user_info(user_id):
 
-    async with SessionLocal() as session:
-
-        user = await session.get(User, user_id)
-
-        if user:
+    user = await load_user_profile(user_id)
 
-            user_company_id = user.company_id
-            user_company_query = await session.get(Company, user_company_id)
-            company_name = user_company_query.name
+    if user:
 
-            registered_at = datetime.strftime(user.registered_at, "%d %m %Y %H:%M")
+        registered_at = datetime.strftime(user.registered_at, "%d %m %Y %H:%M")
 
-            user_info = f"ID - {user.id}\n\nФИО - {user.last_name} {user.first_name} {user.father_name}\n\nДата рождения - {user.date_of_birth}\n\nНомер телефона - {user.phone_number}\n\nАдрес - {user.address}\n\nПредприятие - {company_name}\n\nВремя и дата регистрации - {registered_at}"
+        user_info = f"ID - {user.id}\n\nФИО - {user.last_name} {user.first_name} {user.father_name}\n\nДата рождения - {user.date_of_birth}\n\nНомер телефона - {user.phone_number}\n\nАдрес - {user.address}\n\nПредприятие - {user.company_name}\n\nВремя и дата регистрации - {registered_at}"
 
-            if user.volunteer_id:
-                volunteer = await session.get(User_volunteer, user.volunteer_id)
-                if volunteer:
-                    vol_name = volunteer.name or f"#{volunteer.id}"
-                    user_info += f"\n\nВолонтёр - {vol_name}"
+        if user.volunteer_name:
+            user_info += f"\n\nВолонтёр - {user.volunteer_name}"
 
-            return user_info
+        return user_info
 
 async def extract_name_father_name(mlist: list):
 
@@ -320,184 +253,31 @@ async def extract_name_father_name(mlist: list):
     return name, father_name
 
 
-async def generate_excel():
-    TABLE_EXPORT_CONFIG = {
-        "user": {
-            "sheet_name": "Пользователи",
-            "column_order": [
-                "id", "last_name", "first_name", "father_name",
-                "passport_number", "date_of_birth", "counter",
-                "address", "phone_number", "status", "registered_at",
-                "blocked_at", "company_id"
-            ],
-            "rename": {
-                "id": "ID",
-                "last_name": "Фамилия",
-                "first_name": "Имя",
-                "father_name": "Отчество",
-                "passport_number": "Серия номер паспорта",
-                "date_of_birth": "Дата рождения",
-                "counter": "Порядковый номер",
-                "address": "Адрес",
-                "phone_number": "Номер телефона",
-                "status": "Статус",
-                "registered_at": "Дата время регистрации",
-                "blocked_at": "Дата время блокировки",
-                "company_id": "ID предприятия",
-            },
-        },
-        "company": {
-            "sheet_name": "Предприятия",
-            "column_order": ["id", "name"],
-            "rename": {
-                "id": "ID",
-                "name": "Название",
-            },
-        },
-    }
-
-    EXTRA_USER_SHEETS = {
-        "blocked": "Заблокировали после регистрации",
-        "deleted": "Удалены",
-    }
-
-    USER_WHO_BLOCKED_SHEET_NAME = "Заблокировали до регистрации"
-    EXCLUDED_TABLES = ["alembic_version", "user_who_blocked"]
-
-    metadata = MetaData()
-
-    async with engine.begin() as conn:
-        await conn.run_sync(metadata.reflect)
-
-    async with SessionLocal() as session:
-        with pd.ExcelWriter("excel_dump.xlsx", engine="openpyxl") as writer:
-            for idx, table in enumerate(metadata.sorted_tables, start=1):
-                if table.name in EXCLUDED_TABLES:
-                    continue
-
-                config = TABLE_EXPORT_CONFIG.get(table.name, {})
-                column_order = config.get("column_order")
-                rename_map = config.get("rename", {})
-                sheet_name = config.get("sheet_name", table.name.title())
-                sheet_name = (sheet_name or f"table_{idx}")[:31]
-
-                result = await session.execute(select(table))
-                rows = result.mappings().all()
-
-                if rows:
-                    df_raw = pd.DataFrame(rows)
-                else:
-                    source_cols = [column.name for column in table.columns]
-                    use_cols = column_order or source_cols
-                    df_raw = pd.DataFrame(
-                        columns=[col for col in use_cols if col in source_cols]
-                    )
-
-                df_export = df_raw.copy()
-                if column_order:
-                    df_export = df_export[
-                        [col for col in column_order if col in df_export.columns]
-                    ]
-
-                if rename_map:
-                    df_export.rename(columns=rename_map, inplace=True)
-
-                df_export.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                if table.name == "user" and "status" in df_raw.columns:
-                    for status_value, extra_sheet_name in EXTRA_USER_SHEETS.items():
-                        filtered = df_raw[df_raw["status"] == status_value].copy()
-
-                        if column_order:
-                            filtered = filtered[
-                                [col for col in column_order if col in filtered.columns]
-                            ]
-
-                        if rename_map:
-                            filtered.rename(columns=rename_map, inplace=True)
-
-                        filtered.to_excel(
-                            writer,
-                            sheet_name=extra_sheet_name[:31],
-                            index=False,
-                        )
-
-                print("Done")
-
-            user_who_blocked_table = metadata.tables.get("user_who_blocked")
-            if user_who_blocked_table is not None:
-                result = await session.execute(
-                    select(
-                        user_who_blocked_table.c.tg_id,
-                        user_who_blocked_table.c.blocked_at,
-                    )
-                )
-                rows = result.mappings().all()
-
-                if rows:
-                    df_uwb = pd.DataFrame(rows)
-                else:
-                    df_uwb = pd.DataFrame(columns=["tg_id", "blocked_at"])
-
-                df_uwb.rename(
-                    columns={
-                        "tg_id": "ID телеграм",
-                        "blocked_at": "Время и дата блокировки",
-                    },
-                    inplace=True,
-                )
+async def generate_excel(path: str = DEFAULT_EXPORT_PATH):
 
-                df_uwb.to_excel(
-                    writer,
-                    sheet_name=USER_WHO_BLOCKED_SHEET_NAME[:31],
-                    index=False,
-                )
+    return await export_registry(path)
 
 
 async def gather_company_stats():
 
-    async with SessionLocal() as session:
-        stmt = (
-            select(
-                Company.id,
-                Company.name,
-                func.count(User.id).label("user_count"),
-            )
-            .outerjoin(User)
-            .group_by(Company.id, Company.name)
-            .order_by(func.count(User.id).desc(), Company.name)  # secondary sort keeps deterministic order
-        )
+    stats = await registry_stats.snapshot()
+    companies = await company_catalog.all()
 
-        result = await session.execute(stmt)
-        rows = result.all()
+    rows = sorted(
+        ((company["name"], stats.company_users.get(company["id"], 0)) for company in companies),
+        key=lambda row: (-row[1], row[0]),  # secondary sort keeps deterministic order
+    )
 
-        result_str = ''
+    result_str = ''
 
-        for company_id, company_name, user_count in rows:
-
-            result_str = f"{result_str}\n{company_name}: {user_count}"
+    for company_name, user_count in rows:
 
+        result_str = f"{result_str}\n{company_name}: {user_count}"
 
     return result_str
 
 async def get_user_stats():
-    async with SessionLocal() as session:
-        now = datetime.utcnow()
-
-        stmt = select(
-            func.count(User.id)
-            .filter(User.registered_at >= now - timedelta(hours=24))
-            .label("last_24h"),
-            func.count(User.id)
-            .filter(User.registered_at >= now - timedelta(days=7))
-            .label("last_7d"),
-            func.count(User.id)
-            .filter(User.registered_at >= now - timedelta(days=30))  # or use relativedelta for calendar month
-            .label("last_30d"),
-        ).where(User.status == 'registered')
-
-        result = await session.execute(stmt)
-        counts = result.one()
+    counts = await registry_stats.registration_windows()
 
     output_str = f"Кол-во регистраций за последнее время\n\nСутки - {counts.last_24h}\n\nНеделя - {counts.last_7d}\n\nМесяц - {counts.last_30d}"
 
@@ -505,45 +285,30 @@ async def get_user_stats():
 
 async def prepare_user_info_for_admin(user_id):
 
-    async with SessionLocal() as session:
-
-        user = await session.get(User, user_id)
-
-        if user:
-
-            print("User found")
-
-            user_company_id = user.company_id
-            user_company_query = await session.get(Company, user_company_id)
+    user = await load_user_profile(user_id)
 
-            print("User company query - ", user_company_query)
+    if user:
 
-            if user_company_query is None:
-                company_name = 'Не назначено'
-            else:
-                company_name = user_company_query.name
+        company_name = user.company_name if user.company_name is not None else 'Не назначено'
 
-            if user.registered_at is not None:
-                registered_at = datetime.strftime(user.registered_at, "%d %m %Y %H:%M")
-            else:
-                registered_at = 'Еще не загеристрирован'
+        if user.registered_at is not None:
+            registered_at = datetime.strftime(user.registered_at, "%d %m %Y %H:%M")
+        else:
+            registered_at = 'Еще не загеристрирован'
 
-            user_info = f"ID - {user.id}\n\nФИО - {user.last_name} {user.first_name} {user.father_name}\n\nСерия номер паспорта - {user.passport_number}\n\nДата рождения - {user.date_of_birth}\n\nНомер телефона - {user.phone_number}\n\nАдрес - {user.address}\n\n<b>Предприятие - {company_name}</b>\n\nВремя и дата регистрации - {registered_at}\n\n<b>Статус - {user.status}</b>"
+        user_info = f"ID - {user.id}\n\nФИО - {user.last_name} {user.first_name} {user.father_name}\n\nСерия номер паспорта - {user.passport_number}\n\nДата рождения - {user.date_of_birth}\n\nНомер телефона - {user.phone_number}\n\nАдрес - {user.address}\n\n<b>Предприятие - {company_name}</b>\n\nВремя и дата регистрации - {registered_at}\n\n<b>Статус - {user.status}</b>"
 
-            if user.volunteer_id:
-                volunteer = await session.get(User_volunteer, user.volunteer_id)
-                if volunteer:
-                    vol_name = volunteer.name or f"#{volunteer.id}"
-                    user_info += f"\n\nВолонтёр - {vol_name}"
+        if user.volunteer_name:
+            user_info += f"\n\nВолонтёр - {user.volunteer_name}"
 
-            return user_info
+        return user_info
 
 async def remove_user(user_id):
 
     # set status to deleted
     # set company to none
 
-    async with SessionLocal() as session:
+    async def write(session):
 
         user = await session.get(User, user_id)
 
@@ -551,64 +316,67 @@ async def remove_user(user_id):
 
             user.status = 'deleted'
             user.company = None
-            await session.commit()
-            await session.refresh(user)
 
-            print(f"Removed user with id {user_id}")
-            print(f"Status: {user.status}")
-            print(f"Company: {user.company}")
+        return user
+
+    user = await submit_write(write)
+
+    if user:
+
+        roster_index.set_status(user.id, user.status)
+        logger.debug("User %s marked deleted", user_id)
 
 async def reassign_company(user_id, new_company_id):
 
-    async with SessionLocal() as session:
+    async def write(session):
 
         user = await session.get(User, user_id)
         company = await session.get(Company, new_company_id)
 
         user.company = company
 
-        await session.commit()
+    await submit_write(write)
 
 async def record_block(user_tg_id):
 
     timenow = datetime.now()
 
-    async with SessionLocal() as session:
-
-        print('437')
+    async def write(session):
 
         stmt = select(User).where(User.tg_id == user_tg_id)
         query = await session.execute(stmt)
-        print('441')
         user = query.scalars().one_or_none()
 
         if user:
-            print('445')
             user.status = 'blocked'
             user.blocked_at = timenow
-
-            print('User status updated to blocked.')
         else:
-            print("No registered user to update for blocked.")
+            logger.debug("Telegram id %s blocked the bot, no user to mark blocked", user_tg_id)
 
         user_who_blocked = User_who_blocked(tg_id=user_tg_id, blocked_at=timenow)
         session.add(user_who_blocked)
 
         try:
-            await IdentityService.record_blocked_identity_event(
-                session=session,
-                provider="telegram",
-                external_user_id=user_tg_id,
-                blocked_at=timenow,
-                user_id=user.id if user else None,
-                payload={"source": "record_block"},
-            )
+            # Своя точка сохранения: без таблиц платформы откатывается только событие
+            async with session.begin_nested():
+                await IdentityService.record_blocked_identity_event(
+                    session=session,
+                    provider="telegram",
+                    external_user_id=user_tg_id,
+                    blocked_at=timenow,
+                    user_id=user.id if user else None,
+                    payload={"source": "record_block"},
+                )
         except PlatformSchemaUnavailable:
             pass
 
-        print("Added user to blocked table")
+        return user.id if user else None
+
+    # Блокировки приходят пачками при рассылках - коммитим их группой через общий writer
+    user_id = await submit_write(write)
 
-        await session.commit()
+    if user_id is not None:
+        roster_index.set_status(user_id, 'blocked')
 
 async def add_volunteer(user_tg_id: int, added_by: int = None, name: str = None):
     """
@@ -624,7 +392,7 @@ async def add_volunteer(user_tg_id: int, added_by: int = None, name: str = None)
     """
     stmt = select(User_volunteer).where(User_volunteer.tg_id == user_tg_id)
 
-    async with SessionLocal() as session:
+    async def write(session):
         query = await session.execute(stmt)
         volunteer = query.scalars().one_or_none()
 
@@ -641,16 +409,23 @@ async def add_volunteer(user_tg_id: int, added_by: int = None, name: str = None)
                 volunteer,
                 payload={"name": volunteer.name, "added_by": added_by},
             )
-            await session.commit()
-            await session.refresh(volunteer)
             return volunteer.id
         else:
             return False
 
+    return await submit_write(write)
+
 
 async def is_volunteer(user_tg_id):
 
-    async with SessionLocal() as session:
+    cached_volunteer_id = identity_cache.get(VOLUNTEER, "telegram", user_tg_id)
+    if cached_volunteer_id is not MISSING:
+        if cached_volunteer_id is None:
+            return False
+        last_seen_updater.touch(VOLUNTEER, "telegram", user_tg_id)
+        return True
+
+    async with read_session() as session:
         try:
             volunteer = await IdentityService.get_volunteer_by_identity(
                 session,
@@ -658,38 +433,39 @@ async def is_volunteer(user_tg_id):
                 user_tg_id,
             )
             if volunteer is not None:
-                await _link_telegram_volunteer_identity(
-                    session,
-                    volunteer,
-                    payload={"source": "identity_lookup"},
-                )
-                await session.commit()
+                identity_cache.set(VOLUNTEER, "telegram", user_tg_id, volunteer.id)
+                last_seen_updater.touch(VOLUNTEER, "telegram", user_tg_id)
                 return True
         except PlatformSchemaUnavailable:
             pass
 
-        stmt = select(User_volunteer).where(User_volunteer.tg_id == user_tg_id)
+        stmt = select(User_volunteer.id).where(User_volunteer.tg_id == user_tg_id)
 
         query = await session.execute(stmt)
 
-        volunteer = query.scalars().one_or_none()
+        volunteer_id = query.scalars().one_or_none()
 
-        if volunteer is None:
-            return False
-        else:
-            linked = await _link_telegram_volunteer_identity(
+    if volunteer_id is None:
+        identity_cache.set(VOLUNTEER, "telegram", user_tg_id, None)
+        return False
+    else:
+
+        async def write(session):
+            volunteer = await session.get(User_volunteer, volunteer_id)
+            await _link_telegram_volunteer_identity(
                 session,
                 volunteer,
                 payload={"source": "legacy_tg_id_lookup"},
             )
-            if linked is not None:
-                await session.commit()
-            return True
+
+        await defer_write(write)
+        identity_cache.set(VOLUNTEER, "telegram", user_tg_id, volunteer_id)
+        return True
 
 
 async def update_volunteer_tg_name(tg_id: int, first_name: str, last_name: str = None):
     """Обновить имя волонтёра из Telegram, если оно не задано вручную"""
-    async with SessionLocal() as session:
+    async with read_session() as session:
         try:
             volunteer = await IdentityService.get_volunteer_by_identity(session, "telegram", tg_id)
         except PlatformSchemaUnavailable:
@@ -700,17 +476,29 @@ async def update_volunteer_tg_name(tg_id: int, first_name: str, last_name: str =
             result = await session.execute(stmt)
             volunteer = result.scalars().one_or_none()
 
-        if volunteer and not volunteer.name_manual:
-            tg_name = first_name
-            if last_name:
-                tg_name += f" {last_name}"
-            volunteer.name = tg_name
-            await _link_telegram_volunteer_identity(
-                session,
-                volunteer,
-                payload={"name": tg_name},
-            )
-            await session.commit()
+    if not volunteer or volunteer.name_manual:
+        return
+
+    tg_name = first_name
+    if last_name:
+        tg_name += f" {last_name}"
+    if volunteer.name == tg_name:
+        return
+    volunteer_id = volunteer.id
+
+    async def write(session):
+        volunteer = await session.get(User_volunteer, volunteer_id)
+        if volunteer is None or volunteer.name_manual:
+            return
+        volunteer.name = tg_name
+        await _link_telegram_volunteer_identity(
+            session,
+            volunteer,
+            payload={"name": tg_name},
+        )
+
+    # Ответ на /start уже не ждёт этой записи: коммит в конце обновления
+    await defer_write(write)
 
 
 async def check_volunteer_exists(volunteer_id: int) -> bool:
@@ -723,7 +511,7 @@ async def check_volunteer_exists(volunteer_id: int) -> bool:
     Returns:
         True если существует, False если нет
     """
-    async with SessionLocal() as session:
+    async with read_session() as session:
         volunteer = await session.get(User_volunteer, volunteer_id)
         return volunteer is not None
         
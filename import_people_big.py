@@ -1,16 +1,17 @@
 # import_users_optimized.py
 import pandas as pd
-from sqlalchemy import create_engine, select
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from db import SYNC_DATABASE_URI, create_sync_engine
 from models import Base, User
 
-def load_users_from_excel(excel_path, sqlite_url: str = "sqlite:///app.db", batch_size: int = 5000):
+def load_users_from_excel(excel_path, sqlite_url: str = SYNC_DATABASE_URI, batch_size: int = 5000):
     """
     Load users from Excel into the SQLite database efficiently.
     """
 
-    engine = create_engine(sqlite_url, echo=False, future=True)
+    engine = create_sync_engine(sqlite_url, echo=False)
 
     # Ensure tables exist
     Base.metadata.create_all(engine)
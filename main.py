@@ -6,7 +6,7 @@ from vars import PRODUCTION_MODE
 from functions import *
 from functions import check_volunteer_exists
 from modules.auth import (
-    is_developer, get_developer_role, set_developer_role, should_show_as_admin
+    is_developer, is_superadmin, get_developer_role, set_developer_role, should_show_as_admin
 )
 from modules.logger import log_role_switch, setup_logging
 from modules.admin_ui import (
@@ -20,49 +20,49 @@ from modules.user_ui import (
     show_company_selection, get_step_text
 )
 from modules.auto_migrate import check_and_migrate
-from services.platform import sync_telegram_platform_data
+from modules.update_context import StateDispatcher, update_text
+from db import SQLITE_MAINTENANCE_SECONDS, sqlite_maintenance
+from services.background import background
+from services.conversation_state_cache import STATE_FLUSH_SECONDS
+from services.data_revision import install_revision_tracking
+from services.event_rollup import ROLLUP_PRUNE_SECONDS, event_rollups
+from services.export_jobs import export_jobs
+from services.http_client import http_client
+from services.idempotency import SingleFlight
+from services.platform import PlatformSchemaUnavailable, sync_telegram_platform_data
+from services.query_plans import log_query_plan_violations
+from services.identity_cache import (
+    IDENTITY_REVISION_POLL_SECONDS,
+    LAST_SEEN_FLUSH_SECONDS,
+    identity_cache,
+    last_seen_updater,
+)
+from services.role_index import ROLE_INDEX_POLL_SECONDS, role_index
+from services.roster_index import ROSTER_REFRESH_SECONDS, roster_index
+from services.sms_gateway import SMS_STATUS_POLL_SECONDS, sms_gateway
+from services.state_sweeper import STATE_SWEEP_SECONDS, state_sweeper
+from services.stats import STATS_REBUILD_SECONDS, registry_stats
+from services.write_coordinator import write_coordinator
+
+EXPORT_PROGRESS_EDIT_SECONDS = 3
 
 # Настройка логирования
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
-def _repair_text_encoding(text: str) -> str:
-    """
-    Попытаться восстановить типичную mojibake-перекодировку (UTF-8 -> latin1/cp1251).
-    """
-    if not text:
-        return ""
-
-    candidates = [text]
-    for src, dst in (("latin1", "utf-8"), ("cp1251", "utf-8")):
-        try:
-            candidates.append(text.encode(src).decode(dst))
-        except UnicodeError:
-            continue
-
-    def cyrillic_score(value: str) -> int:
-        value = value.lower()
-        return sum(1 for ch in value if ("а" <= ch <= "я") or ch == "ё")
-
-    repaired = max(candidates, key=cyrillic_score)
-    if repaired != text:
-        logger.warning("Detected mojibake input: original=%r repaired=%r", text, repaired)
-    return repaired
-
-
-def _normalize_user_text(text: str) -> str:
-    repaired = _repair_text_encoding((text or "").strip())
-    normalized = " ".join(repaired.split()).lower()
-    return normalized.replace("ё", "е")
+def _is_registration_trigger(message) -> bool:
+    return update_text(message) in {"регистрация", "/регистрация"}
 
 
-def _is_registration_trigger(text: str) -> bool:
-    return _normalize_user_text(text) in {"регистрация", "/регистрация"}
+def _is_profile_trigger(message) -> bool:
+    return update_text(message) in {"мой профиль", "профиль", "/профиль"}
 
 
-def _is_profile_trigger(text: str) -> bool:
-    return _normalize_user_text(text) in {"мой профиль", "профиль", "/профиль"}
+# Текстовые сообщения в состоянии диалога: хендлер ищется по состоянию, а не перебором
+state_messages = StateDispatcher()
+# Шаги регистрации, которые нельзя выполнять дважды параллельно (двойные нажатия)
+registration_flight = SingleFlight()
 
 
 @bot.message_handler(['start'])
@@ -99,7 +99,7 @@ async def start(msg):
 
 
 
-@bot.message_handler(content_types='text', func=lambda message: _is_registration_trigger(message.text), state='*')
+@bot.message_handler(content_types='text', func=_is_registration_trigger, state='*')
 async def start_signup(msg):
 
     await bot.delete_state(user_id=msg.from_user.id, chat_id=msg.chat.id)
@@ -118,7 +118,7 @@ async def start_signup(msg):
         await bot.send_message(chat_id=msg.chat.id, text=text, reply_markup=markup_skip_volunteer_id)
         await bot.set_state(user_id=msg.from_user.id, chat_id=msg.chat.id, state=MyStates.handle_volunteer_id)
 
-@bot.message_handler(content_types='text', func=lambda message: _is_profile_trigger(message.text), state='*')
+@bot.message_handler(content_types='text', func=_is_profile_trigger, state='*')
 async def show_profile(msg):
 
     user_tg_id = int(msg.from_user.id)
@@ -149,8 +149,11 @@ async def show_profile(msg):
         await bot.send_message(chat_id=msg.chat.id, text=text, parse_mode='HTML', reply_markup=markup_default)
 
 
+# На этом месте стояли хендлеры состояний - порядок проверки сохраняется
+state_messages.register(bot, content_types=['text'])
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_volunteer_id])
+
+@state_messages.handler(MyStates.handle_volunteer_id)
 async def handle_volunteer_id(msg):
     text_input = msg.text.strip()
     try:
@@ -171,7 +174,7 @@ async def handle_volunteer_id(msg):
     await bot.set_state(user_id=msg.chat.id, chat_id=msg.from_user.id, state=MyStates.handle_surname)
 
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_surname])
+@state_messages.handler(MyStates.handle_surname)
 async def handle_surname(msg):
 
     surname = msg.text.strip().capitalize()
@@ -195,7 +198,7 @@ async def handle_surname(msg):
         )
         await bot.send_message(chat_id=msg.chat.id, text=text, parse_mode='HTML')
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_dob])
+@state_messages.handler(MyStates.handle_dob)
 async def handle_dob(msg):
 
     try:
@@ -242,7 +245,7 @@ async def handle_dob(msg):
         await bot.send_message(chat_id=msg.chat.id, text=text, parse_mode='HTML')
 
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_names])
+@state_messages.handler(MyStates.handle_names)
 async def handle_names(msg):
 
     user_string = msg.text
@@ -269,7 +272,7 @@ async def handle_names(msg):
         await bot.set_state(chat_id=msg.chat.id, user_id=msg.chat.id, state=MyStates.handle_phone_number)
 
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_phone_number])
+@state_messages.handler(MyStates.handle_phone_number)
 async def handle_phone_number(msg):
 
     phone_number = msg.text.strip()
@@ -309,7 +312,7 @@ async def handle_phone_number(msg):
 
 
 
-@bot.message_handler(content_types='text', state=[MyStates.check_sms])
+@state_messages.handler(MyStates.check_sms)
 async def check_sms(msg):
 
     code_from_user = msg.text.strip()
@@ -337,7 +340,7 @@ async def check_sms(msg):
         await bot.send_message(chat_id=msg.chat.id, text=text, parse_mode='HTML')
 
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_home_address])
+@state_messages.handler(MyStates.handle_home_address)
 async def handle_home_address(msg):
 
     home_address = msg.text.strip()
@@ -360,9 +363,15 @@ async def handle_home_address(msg):
 
 
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_company])
+@state_messages.handler(MyStates.handle_company)
 async def handle_company(msg):
 
+    # Одна регистрация на пользователя за раз: повтор ждёт первую, а не пишет заново
+    await registration_flight.run(msg.from_user.id, lambda: finalize_company_from_text(msg))
+
+
+async def finalize_company_from_text(msg):
+
     try:
         company_id_from_user = int(msg.text.strip())
 
@@ -421,7 +430,7 @@ async def handle_company(msg):
                                text=f"Неверный номер предприятия. Введите число.")
 
 
-@bot.message_handler(content_types='text', state=[MyStates.handle_info_correction])
+@state_messages.handler(MyStates.handle_info_correction)
 async def handle_info_correction(msg):
 
     async with bot.retrieve_data(user_id=msg.from_user.id, chat_id=msg.chat.id) as data:
@@ -439,7 +448,7 @@ async def handle_info_correction(msg):
     await bot.send_message(chat_id=admin_ids[0], text=msg_to_admin, reply_markup=markup_change_user_data)
     await bot.delete_state(user_id=msg.from_user.id, chat_id=msg.chat.id)
 
-@bot.message_handler(content_types='text', state=[MyStates.admin_read_user_id_for_edit])
+@state_messages.handler(MyStates.admin_read_user_id_for_edit)
 async def admin_read_user_id_for_edit(msg):
 
     try:
@@ -472,7 +481,7 @@ async def admin_read_user_id_for_edit(msg):
         await bot.send_message(chat_id=admin_ids[0], text="Неправильный ID")
 
 
-@bot.message_handler(content_types='text', state=[MyStates.admin_read_comp_id_for_edit])
+@state_messages.handler(MyStates.admin_read_comp_id_for_edit)
 async def admin_read_comp_id_for_edit(msg):
 
     try:
@@ -495,7 +504,7 @@ async def admin_read_comp_id_for_edit(msg):
         await bot.send_message(chat_id=admin_ids[0], text="Неправильный ID")
 
 
-@bot.message_handler(content_types='text', state=[MyStates.admin_read_volunteer_id])
+@state_messages.handler(MyStates.admin_read_volunteer_id)
 async def admin_read_volunteer_id(msg):
 
     try:
@@ -537,7 +546,7 @@ async def admin_read_volunteer_id(msg):
     await bot.set_state(chat_id=msg.chat.id, user_id=msg.from_user.id, state=MyStates.admin_menu)
 
 
-@bot.message_handler(content_types='text', state=[MyStates.admin_edit_volunteer_name])
+@state_messages.handler(MyStates.admin_edit_volunteer_name)
 async def admin_edit_volunteer_name(msg):
     """Обработка ввода имени волонтера"""
     new_name = msg.text.strip()
@@ -574,7 +583,7 @@ async def admin_edit_volunteer_name(msg):
     await bot.set_state(chat_id=msg.chat.id, user_id=msg.from_user.id, state=MyStates.admin_menu)
 
 
-@bot.message_handler(content_types='text', state=[MyStates.admin_search])
+@state_messages.handler(MyStates.admin_search)
 async def admin_handle_search(msg):
     """Обработка поискового запроса пользователей"""
     query = msg.text.strip()
@@ -587,7 +596,7 @@ async def admin_handle_search(msg):
     async with bot.retrieve_data(msg.from_user.id, msg.chat.id) as data:
         data['search_query'] = query
 
-    found = await show_search_results(bot, msg.chat.id, query, page=0)
+    found = await show_search_results(bot, msg.chat.id, query)
 
     if found:
         # Найдено - выходим из режима поиска
@@ -595,7 +604,7 @@ async def admin_handle_search(msg):
     # Если не найдено - остаемся в режиме поиска (admin_search state)
 
 
-@bot.message_handler(content_types='text', state=[MyStates.admin_search_companies])
+@state_messages.handler(MyStates.admin_search_companies)
 async def admin_handle_company_search(msg):
     """Обработка поискового запроса предприятий"""
     query = msg.text.strip()
@@ -608,7 +617,7 @@ async def admin_handle_company_search(msg):
     async with bot.retrieve_data(msg.from_user.id, msg.chat.id) as data:
         data['company_search_query'] = query
 
-    found = await show_company_search_results(bot, msg.chat.id, query, page=0)
+    found = await show_company_search_results(bot, msg.chat.id, query)
 
     if found:
         # Найдено - выходим из режима поиска
@@ -659,7 +668,7 @@ async def callback_admin_state(call):
                 async with bot.retrieve_data(user_id, call.message.chat.id) as data:
                     search_query = data.get('search_query', '')
                 if search_query:
-                    await show_search_results(bot, call.message.chat.id, search_query, result.get("page", 0), call.message.message_id)
+                    await show_search_results(bot, call.message.chat.id, search_query, result.get("cursor"), call.message.message_id)
             elif action == "set_company_search_state":
                 await bot.set_state(user_id=user_id, chat_id=call.message.chat.id, state=MyStates.admin_search_companies)
             elif action == "company_search_paginate":
@@ -667,7 +676,7 @@ async def callback_admin_state(call):
                 async with bot.retrieve_data(user_id, call.message.chat.id) as data:
                     search_query = data.get('company_search_query', '')
                 if search_query:
-                    await show_company_search_results(bot, call.message.chat.id, search_query, result.get("page", 0), call.message.message_id)
+                    await show_company_search_results(bot, call.message.chat.id, search_query, result.get("cursor"), call.message.message_id)
             elif action == "set_volunteer_state":
                 await bot.set_state(user_id=user_id, chat_id=call.message.chat.id, state=MyStates.admin_read_volunteer_id)
             elif action == "set_edit_volunteer_name":
@@ -682,14 +691,31 @@ async def callback_admin_state(call):
 
         print('Generating an excel file...')
 
-        await bot.send_message(chat_id=user_id,
-                               text="Собираю файл, подождите...")
-
-        await generate_excel()
+        progress_msg = await bot.send_message(chat_id=user_id,
+                                              text="Собираю файл, подождите...")
+
+        # Выгрузка идёт в отдельном процессе; одновременные запросы получают одну и ту же задачу
+        job = await export_jobs.submit()
+        shown_rows = None
+        while not job.finished:
+            if job.rows != shown_rows:
+                shown_rows = job.rows
+                try:
+                    await bot.edit_message_text(text=f"Собираю файл, подождите...\nВыгружено строк: {job.rows}",
+                                                chat_id=user_id, message_id=progress_msg.message_id)
+                except Exception:
+                    pass
+            try:
+                await export_jobs.wait(job, timeout=EXPORT_PROGRESS_EDIT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
 
-        file = types.InputFile("excel_dump.xlsx")
+        if job.status != 'done':
+            await bot.send_message(chat_id=user_id, text="Не удалось собрать файл, попробуйте позже.")
+        else:
+            file = types.InputFile(job.path, file_name="registry_export.xlsx")
 
-        await bot.send_document(chat_id=user_id, document=file)
+            await bot.send_document(chat_id=user_id, document=file)
 
     elif call.data == 'get_comp_stats':
 
@@ -710,7 +736,7 @@ async def callback_admin_state(call):
 
         print("Changing user data....")
 
-        if user_id in superadmin_ids:
+        if is_superadmin(user_id, superadmin_ids):
 
             await bot.send_message(chat_id=user_id,
                                    text="Пришлите мне ID пользователя, предприятие которого нужно изменить (или которого удалить).")
@@ -826,91 +852,106 @@ def is_user_flow_callback(call):
     )
 
 
-@bot.callback_query_handler(func=is_user_flow_callback, state='*')
-async def callback_any_state(call):
+async def finalize_company_from_callback(call):
 
     user_id = call.from_user.id
 
-    # Обработка выбора предприятия при регистрации (кнопки с пагинацией)
-    if call.data.startswith('reg_comp_page_'):
-        await bot.answer_callback_query(call.id)
-        page = int(call.data.replace('reg_comp_page_', ''))
-        await show_company_selection(bot, call.message.chat.id, page, call.message.message_id)
+    try:
+        company_id = int(call.data.replace('reg_company_', ''))
+    except ValueError:
+        text = format_error_message("Ошибка", "Некорректный идентификатор предприятия.")
+        await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
         return
 
-    if call.data.startswith('reg_company_'):
-        await bot.answer_callback_query(call.id)
-        try:
-            company_id = int(call.data.replace('reg_company_', ''))
-        except ValueError:
-            text = format_error_message("Ошибка", "Некорректный идентификатор предприятия.")
+    try:
+        async with bot.retrieve_data(user_id=user_id, chat_id=call.message.chat.id) as data:
+            user_db_id = data.get('id')
+
+        if not user_db_id:
+            text = format_error_message(
+                "Сессия регистрации устарела",
+                "Данные регистрации не найдены.",
+                "Нажмите /start и начните регистрацию заново"
+            )
             await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+            await bot.delete_state(user_id=user_id, chat_id=call.message.chat.id)
             return
 
-        try:
+        if await assign_company(user_db_id, company_id):
             async with bot.retrieve_data(user_id=user_id, chat_id=call.message.chat.id) as data:
-                user_db_id = data.get('id')
+                if await register_user(data):
+                    # Удаляем сообщение с выбором
+                    try:
+                        await bot.delete_message(chat_id=call.message.chat.id, message_id=call.message.message_id)
+                    except:
+                        pass
+
+                    # Успешная регистрация
+                    success_text = format_success_message(
+                        "Регистрация завершена!",
+                        "Добро пожаловать в систему. Ваш профиль успешно создан."
+                    )
+                    await bot.send_message(chat_id=user_id, text=success_text, parse_mode='HTML')
+
+                    # Показываем профиль
+                    user_data = await get_user_profile_data(user_db_id)
+                    if user_data:
+                        profile_text = format_user_profile(user_data)
+                        await bot.send_message(chat_id=user_id, text=profile_text, parse_mode='HTML')
+
+                    # Кнопка исправления
+                    await bot.send_message(
+                        chat_id=user_id,
+                        text="Если нужно исправить информацию, нажмите кнопку ниже.",
+                        reply_markup=markup_correct_info
+                    )
+
+                    if await is_volunteer(user_id):
+                        await bot.send_message(
+                            chat_id=user_id,
+                            text='Для начала следующей регистрации нажмите кнопку "Регистрация".',
+                            reply_markup=markup_default_volunteer
+                        )
 
-            if not user_db_id:
-                text = format_error_message(
-                    "Сессия регистрации устарела",
-                    "Данные регистрации не найдены.",
-                    "Нажмите /start и начните регистрацию заново"
-                )
-                await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
-                await bot.delete_state(user_id=user_id, chat_id=call.message.chat.id)
-                return
+                    await bot.delete_state(user_id=user_id, chat_id=call.message.chat.id)
+                else:
+                    text = format_error_message("Ошибка", "Регистрация не удалась.")
+                    await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+        else:
+            text = format_error_message("Ошибка", "Не удалось выбрать предприятие.")
+            await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+    except Exception as e:
+        text = format_error_message(
+            "Ошибка при выборе предприятия",
+            str(e),
+            "Попробуйте снова или нажмите /start"
+        )
+        await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
 
-            if await assign_company(user_db_id, company_id):
-                async with bot.retrieve_data(user_id=user_id, chat_id=call.message.chat.id) as data:
-                    if await register_user(data):
-                        # Удаляем сообщение с выбором
-                        try:
-                            await bot.delete_message(chat_id=call.message.chat.id, message_id=call.message.message_id)
-                        except:
-                            pass
-
-                        # Успешная регистрация
-                        success_text = format_success_message(
-                            "Регистрация завершена!",
-                            "Добро пожаловать в систему. Ваш профиль успешно создан."
-                        )
-                        await bot.send_message(chat_id=user_id, text=success_text, parse_mode='HTML')
 
-                        # Показываем профиль
-                        user_data = await get_user_profile_data(user_db_id)
-                        if user_data:
-                            profile_text = format_user_profile(user_data)
-                            await bot.send_message(chat_id=user_id, text=profile_text, parse_mode='HTML')
+async def start_company_selection(call):
 
-                        # Кнопка исправления
-                        await bot.send_message(
-                            chat_id=user_id,
-                            text="Если нужно исправить информацию, нажмите кнопку ниже.",
-                            reply_markup=markup_correct_info
-                        )
+    # Показываем выбор предприятия через кнопки
+    await show_company_selection(bot, call.message.chat.id, page=0)
+    await bot.set_state(chat_id=call.message.chat.id, user_id=call.from_user.id, state=MyStates.handle_company)
 
-                        if await is_volunteer(user_id):
-                            await bot.send_message(
-                                chat_id=user_id,
-                                text='Для начала следующей регистрации нажмите кнопку "Регистрация".',
-                                reply_markup=markup_default_volunteer
-                            )
 
-                        await bot.delete_state(user_id=user_id, chat_id=call.message.chat.id)
-                    else:
-                        text = format_error_message("Ошибка", "Регистрация не удалась.")
-                        await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
-            else:
-                text = format_error_message("Ошибка", "Не удалось выбрать предприятие.")
-                await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
-        except Exception as e:
-            text = format_error_message(
-                "Ошибка при выборе предприятия",
-                str(e),
-                "Попробуйте снова или нажмите /start"
-            )
-            await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+@bot.callback_query_handler(func=is_user_flow_callback, state='*')
+async def callback_any_state(call):
+
+    user_id = call.from_user.id
+
+    # Обработка выбора предприятия при регистрации (кнопки с пагинацией)
+    if call.data.startswith('reg_comp_page_'):
+        await bot.answer_callback_query(call.id)
+        page = int(call.data.replace('reg_comp_page_', ''))
+        await show_company_selection(bot, call.message.chat.id, page, call.message.message_id)
+        return
+
+    if call.data.startswith('reg_company_'):
+        await bot.answer_callback_query(call.id)
+        # Двойное нажатие на предприятие не регистрирует второй раз
+        await registration_flight.run(user_id, lambda: finalize_company_from_callback(call))
         return
 
     if call.data == 'skip_volunteer_id':
@@ -928,9 +969,7 @@ async def callback_any_state(call):
 
     if call.data == 'agreed_to_nda':
         await bot.answer_callback_query(call.id)
-        # Показываем выбор предприятия через кнопки
-        await show_company_selection(bot, call.message.chat.id, page=0)
-        await bot.set_state(chat_id=call.message.chat.id, user_id=user_id, state=MyStates.handle_company)
+        await registration_flight.run(('agreed_to_nda', user_id), lambda: start_company_selection(call))
         return
 
 
@@ -1010,13 +1049,53 @@ async def main():
     """Главная функция запуска бота"""
     # Проверяем и применяем миграции БД
     await check_and_migrate()
+    # Горячие запросы должны идти по индексам; полный скан таблицы - только предупреждение в лог
+    await log_query_plan_violations()
+    if await install_revision_tracking():
+        identity_cache.install_tracking()
     sync_result = await sync_telegram_platform_data(
         admin_ids=admin_ids,
         superadmin_ids=superadmin_ids,
         developer_ids=developer_ids,
     )
     logger.info("Platform foundation sync result: %s", sync_result)
+    # Роли из platform_role; изменения таблицы подхватываются без перезапуска
+    try:
+        await role_index.load()
+        background.add_periodic("role_index", ROLE_INDEX_POLL_SECONDS, role_index.refresh)
+    except PlatformSchemaUnavailable:
+        logger.warning("Role index unavailable, falling back to vars admin lists")
+    # Индекс реестра для шагов регистрации (фамилия / дата рождения)
+    await roster_index.load()
+    await registry_stats.start()
+    background.add_periodic("stats_rebuild", STATS_REBUILD_SECONDS, registry_stats.rebuild)
+    if await event_rollups.start():
+        background.add_periodic("event_rollup_prune", ROLLUP_PRUNE_SECONDS, event_rollups.prune)
+    background.add_periodic("roster_index", ROSTER_REFRESH_SECONDS, roster_index.load)
+    background.add_periodic("last_seen", LAST_SEEN_FLUSH_SECONDS, last_seen_updater.flush)
+    # Удаления через дашборд (другой процесс) сбрасывают кэш идентичностей по ревизии данных
+    background.add_periodic("identity_revision", IDENTITY_REVISION_POLL_SECONDS, identity_cache.sync_revision)
+    background.add_periodic("conversation_state", STATE_FLUSH_SECONDS, bot.current_states.flush)
+    # Чистка брошенных диалогов (в т.ч. MAX) только здесь: бот держит их кэш и узнаёт об удалении
+    state_sweeper.add_listener(bot.current_states.cache.discard)
+    background.add_periodic("state_sweeper", STATE_SWEEP_SECONDS, state_sweeper.sweep)
+    background.add_periodic("sqlite_maintenance", SQLITE_MAINTENANCE_SECONDS, sqlite_maintenance)
+    # Статусы доставки отправленных кодов: одним запросом на пачку, не в хендлерах
+    background.add_periodic("sms_status", SMS_STATUS_POLL_SECONDS, sms_gateway.poll_statuses)
+    background.on_shutdown("last_seen", last_seen_updater.flush)
+    background.on_shutdown("conversation_state", bot.current_states.flush)
+    background.on_shutdown("export_jobs", export_jobs.shutdown)
+    background.on_shutdown("http_client", http_client.close)
+    # Последним: хуки выше ещё могут ставить записи в очередь
+    background.on_shutdown("write_coordinator", write_coordinator.stop)
+    write_coordinator.start()
+    background.start()
     # Запускаем бота
-    await bot.infinity_polling()
+    try:
+        await bot.infinity_polling()
+    finally:
+        await background.stop()
+
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
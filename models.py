@@ -1,8 +1,8 @@
 # models.py
 from datetime import datetime
 from sqlalchemy import (
-    BigInteger, Column, Date, DateTime, Enum, ForeignKey, Integer,
-    JSON, String, UniqueConstraint
+    BigInteger, Column, Date, DateTime, Enum, ForeignKey, Index, Integer,
+    JSON, String, UniqueConstraint, text
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -49,6 +49,19 @@ class User(Base):
 
     __table_args__ = (
         UniqueConstraint("last_name", "date_of_birth", name="uq_user_identity"),
+        # Most imported people never link a Telegram account, so only linked rows are indexed.
+        Index(
+            "ix_user_tg_id", "tg_id",
+            sqlite_where=text("tg_id IS NOT NULL"), postgresql_where=text("tg_id IS NOT NULL"),
+        ),
+        Index("ix_user_status", "status"),
+        Index("ix_user_status_registered_at", "status", "registered_at"),
+        # Company card: staff of one company in (last_name, first_name, id) order.
+        Index("ix_user_company_name", "company_id", "last_name", "first_name"),
+        Index(
+            "ix_user_volunteer_status", "volunteer_id", "status",
+            sqlite_where=text("volunteer_id IS NOT NULL"), postgresql_where=text("volunteer_id IS NOT NULL"),
+        ),
     )
 
 
@@ -77,6 +90,10 @@ class User_volunteer(Base):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        Index("ix_user_volunteer_tg_id", "tg_id"),
+    )
+
 
 class UserIdentity(Base):
 
@@ -94,6 +111,7 @@ class UserIdentity(Base):
 
     __table_args__ = (
         UniqueConstraint("provider", "external_user_id", name="uq_user_identity_provider_external"),
+        Index("ix_user_identity_user_id", "user_id"),
     )
 
 
@@ -113,6 +131,7 @@ class VolunteerIdentity(Base):
 
     __table_args__ = (
         UniqueConstraint("provider", "external_user_id", name="uq_volunteer_identity_provider_external"),
+        Index("ix_volunteer_identity_volunteer_id", "volunteer_id"),
     )
 
 
@@ -164,4 +183,28 @@ class ConversationState(Base):
 
     __table_args__ = (
         UniqueConstraint("storage_key", name="uq_conversation_state_storage_key"),
+        # The TTL sweeper looks up stale conversations per provider by age.
+        Index("ix_conversation_state_provider_updated_at", "provider", "updated_at"),
     )
+
+
+class RegistryCounter(Base):
+
+    __tablename__ = "registry_counter"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class EventRollup(Base):
+
+    __tablename__ = "event_rollup"
+
+    # Column order is the primary key order: one series is a contiguous bucket_start range.
+    granularity = Column(String(8), primary_key=True)
+    event = Column(String(32), primary_key=True)
+    dimension = Column(String(32), primary_key=True)
+    dimension_value = Column(String(64), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
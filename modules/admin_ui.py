@@ -4,18 +4,25 @@
 """
 
 import logging
-from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Tuple
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 
-from db import SessionLocal
+from db import ReadSessionLocal
 from models import User, Company, User_volunteer
 from modules.auth import is_developer, get_developer_role
 from modules.error_handler import safe_edit_message, safe_send_message
 from modules.logger import log_company_change, log_user_delete
+from services.company_catalog import ORDER_BY_ID, company_catalog
+from services.identity_cache import USER, VOLUNTEER, identity_cache
+from services.roster_index import roster_index
+from services.pagination import KeysetPage, count_cache, fetch_keyset_page, total_pages
+from services.read_models import UserSummary, load_user_profile, to_summaries, user_summary_query
+from services.search_index import normalize_query, search_index
+from services.stats import registry_stats
+from services.unit_of_work import submit_write
 from vars import PRODUCTION_MODE
 
 logger = logging.getLogger(__name__)
@@ -39,131 +46,90 @@ STATUS_TEXT = {
 }
 
 
-async def get_stats() -> dict:
+def build_page_nav_row(callback_prefix: str, page: KeysetPage, total: int, suffix: str = "") -> List[InlineKeyboardButton]:
     """
-    Получить статистику для главного меню админа
+    Кнопки навигации (◀️ N/M ▶️) для курсорной пагинации
+
+    Args:
+        callback_prefix: Префикс callback_data, к нему дописывается токен курсора
+        page: Текущая страница с курсорами соседних страниц
+        total: Общее количество записей
+        suffix: Суффикс callback_data (например, фильтр по статусу)
 
     Returns:
-        dict с ключами: total_users, total_companies, registered_today, registered_week
+        Список кнопок; пустой, если страница всего одна
     """
-    async with SessionLocal() as session:
-        now = datetime.now(timezone.utc)
+    if not page.prev_cursor and not page.next_cursor:
+        return []
 
-        # Общее количество пользователей
-        total_users_result = await session.execute(
-            select(func.count(User.id))
-        )
-        total_users = total_users_result.scalar() or 0
+    pages = max(total_pages(total, ITEMS_PER_PAGE), page.page + 1)
+    buttons = []
 
-        # Количество предприятий
-        total_companies_result = await session.execute(
-            select(func.count(Company.id))
+    if page.prev_cursor:
+        buttons.append(
+            InlineKeyboardButton("◀️", callback_data=f"{callback_prefix}{page.prev_cursor}{suffix}")
         )
-        total_companies = total_companies_result.scalar() or 0
 
-        # Зарегистрировано сегодня
-        registered_today_result = await session.execute(
-            select(func.count(User.id)).where(
-                User.status == 'registered',
-                User.registered_at >= now - timedelta(hours=24)
-            )
-        )
-        registered_today = registered_today_result.scalar() or 0
+    buttons.append(
+        InlineKeyboardButton(f"{page.page + 1}/{pages}", callback_data="noop")
+    )
 
-        # Зарегистрировано за неделю
-        registered_week_result = await session.execute(
-            select(func.count(User.id)).where(
-                User.status == 'registered',
-                User.registered_at >= now - timedelta(days=7)
-            )
+    if page.next_cursor:
+        buttons.append(
+            InlineKeyboardButton("▶️", callback_data=f"{callback_prefix}{page.next_cursor}{suffix}")
         )
-        registered_week = registered_week_result.scalar() or 0
 
-        # Всего зарегистрировано
-        total_registered_result = await session.execute(
-            select(func.count(User.id)).where(User.status == 'registered')
-        )
-        total_registered = total_registered_result.scalar() or 0
+    return buttons
 
-        return {
-            'total_users': total_users,
-            'total_companies': total_companies,
-            'registered_today': registered_today,
-            'registered_week': registered_week,
-            'total_registered': total_registered
-        }
 
-
-async def get_detailed_stats() -> dict:
-    """
-    Получить детальную статистику для страницы статистики
+async def get_stats() -> dict:
     """
-    async with SessionLocal() as session:
-        now = datetime.now(timezone.utc)
-
-        # Статистика по статусам
-        status_stats_result = await session.execute(
-            select(User.status, func.count(User.id))
-            .group_by(User.status)
-        )
-        status_stats = {row[0]: row[1] for row in status_stats_result.all()}
-
-        # Регистрации по периодам
-        registered_today_result = await session.execute(
-            select(func.count(User.id)).where(
-                User.status == 'registered',
-                User.registered_at >= now - timedelta(hours=24)
-            )
-        )
-        registered_today = registered_today_result.scalar() or 0
-
-        registered_week_result = await session.execute(
-            select(func.count(User.id)).where(
-                User.status == 'registered',
-                User.registered_at >= now - timedelta(days=7)
-            )
-        )
-        registered_week = registered_week_result.scalar() or 0
+    Получить статистику для главного меню админа
 
-        registered_month_result = await session.execute(
-            select(func.count(User.id)).where(
-                User.status == 'registered',
-                User.registered_at >= now - timedelta(days=30)
-            )
-        )
-        registered_month = registered_month_result.scalar() or 0
+    Returns:
+        dict с ключами: total_users, total_companies, registered_today, registered_week
+    """
+    stats = await registry_stats.snapshot()
+    windows = await registry_stats.registration_windows()
 
-        # Количество предприятий
-        total_companies_result = await session.execute(
-            select(func.count(Company.id))
-        )
-        total_companies = total_companies_result.scalar() or 0
+    return {
+        'total_users': stats.users,
+        'total_companies': stats.companies,
+        'registered_today': windows.last_24h,
+        'registered_week': windows.last_7d,
+        'total_registered': stats.status('registered')
+    }
 
-        # Топ-5 предприятий по количеству зарегистрированных
-        top_companies_result = await session.execute(
-            select(
-                Company.name,
-                func.count(User.id).label("count")
-            )
-            .join(User, User.company_id == Company.id)
-            .where(User.status == 'registered')
-            .group_by(Company.id, Company.name)
-            .order_by(func.count(User.id).desc())
-            .limit(5)
-        )
-        top_companies = [(row[0], row[1]) for row in top_companies_result.all()]
 
-        return {
-            'registered': status_stats.get('registered', 0),
-            'not_registered': status_stats.get('not registered', 0),
-            'blocked': status_stats.get('blocked', 0),
-            'deleted': status_stats.get('deleted', 0),
-            'registered_today': registered_today,
-            'registered_week': registered_week,
-            'registered_month': registered_month,
-            'total_companies': total_companies,
-            'top_companies': top_companies
-        }
+async def get_detailed_stats() -> dict:
+    """
+    Получить детальную статистику для страницы статистики
+    """
+    stats = await registry_stats.snapshot()
+    windows = await registry_stats.registration_windows()
+
+    # Топ-5 предприятий по количеству зарегистрированных
+    top_ids = sorted(
+        (company_id for company_id, count in stats.company_registered.items() if count > 0),
+        key=lambda company_id: -stats.company_registered[company_id],
+    )[:5]
+    top_companies = []
+    for company_id in top_ids:
+        company = await company_catalog.get(company_id)
+        if company is not None:
+            top_companies.append((company.name, stats.company_registered[company_id]))
+
+    return {
+        'registered': stats.status('registered'),
+        'not_registered': stats.status('not registered'),
+        'blocked': stats.status('blocked'),
+        'deleted': stats.status('deleted'),
+        'registered_today': windows.last_24h,
+        'registered_week': windows.last_7d,
+        'registered_month': windows.last_30d,
+        'total_companies': stats.companies,
+        'top_companies': top_companies
+    }
 
 
 async def show_detailed_stats(bot: AsyncTeleBot, chat_id: int, message_id: int):
@@ -282,34 +248,20 @@ async def get_companies_page(page: int = 0) -> Tuple[List[dict], int]:
     Returns:
         Tuple[список предприятий, общее количество]
     """
-    async with SessionLocal() as session:
-        # Общее количество
-        total_result = await session.execute(select(func.count(Company.id)))
-        total = total_result.scalar() or 0
+    # Список и порядок берём из каталога, количество сотрудников - из счётчиков статистики
+    page_companies, _ = await company_catalog.page(page, ITEMS_PER_PAGE, order=ORDER_BY_ID)
+    total = await company_catalog.count()
+    if not page_companies:
+        return [], total
 
-        # Получаем предприятия с количеством пользователей
-        stmt = (
-            select(
-                Company.id,
-                Company.name,
-                func.count(User.id).label("user_count")
-            )
-            .outerjoin(User, User.company_id == Company.id)
-            .group_by(Company.id, Company.name)
-            .order_by(Company.id)
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
-        )
+    counts = (await registry_stats.snapshot()).company_users
 
-        result = await session.execute(stmt)
-        rows = result.all()
-
-        companies = [
-            {'id': row[0], 'name': row[1], 'user_count': row[2]}
-            for row in rows
-        ]
+    companies = [
+        {'id': c['id'], 'name': c['name'], 'user_count': counts.get(c['id'], 0)}
+        for c in page_companies
+    ]
 
-        return companies, total
+    return companies, total
 
 
 def build_companies_list_keyboard(companies: List[dict], page: int, total: int) -> InlineKeyboardMarkup:
@@ -388,7 +340,7 @@ async def get_company_detail(company_id: int) -> Optional[dict]:
     Returns:
         dict с данными предприятия или None
     """
-    async with SessionLocal() as session:
+    async with ReadSessionLocal() as session:
         result = await session.execute(
             select(Company).where(Company.id == company_id)
         )
@@ -416,76 +368,42 @@ async def get_company_detail(company_id: int) -> Optional[dict]:
         }
 
 
-async def get_company_users_page(company_id: int, page: int = 0) -> Tuple[List[dict], int]:
+async def get_company_users_page(company_id: int, cursor: Optional[str] = None) -> Tuple[List[UserSummary], int, KeysetPage]:
     """
     Получить страницу сотрудников предприятия
 
     Args:
         company_id: ID предприятия
-        page: Номер страницы (с 0)
+        cursor: Токен курсора страницы (None - первая страница)
 
     Returns:
-        Tuple[список пользователей, общее количество]
-    """
-    async with SessionLocal() as session:
-        # Общее количество
-        total_result = await session.execute(
-            select(func.count(User.id)).where(User.company_id == company_id)
+        Tuple[список пользователей, общее количество, страница с курсорами]
+    """
+    total = (await registry_stats.snapshot()).company_users.get(company_id, 0)
+
+    async with ReadSessionLocal() as session:
+        # Курсор по (фамилия, имя, id) вместо OFFSET
+        page = await fetch_keyset_page(
+            session,
+            user_summary_query().where(User.company_id == company_id),
+            (User.last_name, User.first_name, User.id),
+            cursor,
+            ITEMS_PER_PAGE,
+            total=total,
         )
-        total = total_result.scalar() or 0
 
-        # Получаем пользователей
-        stmt = (
-            select(User)
-            .where(User.company_id == company_id)
-            .order_by(User.last_name, User.first_name)
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
-        )
-
-        result = await session.execute(stmt)
-        users = result.scalars().all()
+    return to_summaries(page.rows), total, page
 
-        users_list = [
-            {
-                'id': u.id,
-                'last_name': u.last_name,
-                'first_name': u.first_name,
-                'father_name': u.father_name or '',
-                'status': u.status
-            }
-            for u in users
-        ]
 
-        return users_list, total
-
-
-def build_company_card_keyboard(company_id: int, page: int, total_users: int) -> InlineKeyboardMarkup:
+def build_company_card_keyboard(company_id: int, page: KeysetPage, total_users: int) -> InlineKeyboardMarkup:
     """
     Построить клавиатуру карточки предприятия
     """
     keyboard = InlineKeyboardMarkup(row_width=1)
 
     # Пагинация сотрудников
-    total_pages = (total_users + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE if total_users > 0 else 1
-
-    if total_pages > 1:
-        nav_buttons = []
-
-        if page > 0:
-            nav_buttons.append(
-                InlineKeyboardButton("◀️", callback_data=f"comp_users_{company_id}_{page - 1}")
-            )
-
-        nav_buttons.append(
-            InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data="noop")
-        )
-
-        if page < total_pages - 1:
-            nav_buttons.append(
-                InlineKeyboardButton("▶️", callback_data=f"comp_users_{company_id}_{page + 1}")
-            )
-
+    nav_buttons = build_page_nav_row(f"comp_users_{company_id}_", page, total_users)
+    if nav_buttons:
         keyboard.row(*nav_buttons)
 
     # Навигация
@@ -497,7 +415,7 @@ def build_company_card_keyboard(company_id: int, page: int, total_users: int) ->
     return keyboard
 
 
-async def show_company_card(bot: AsyncTeleBot, chat_id: int, message_id: int, company_id: int, page: int = 0):
+async def show_company_card(bot: AsyncTeleBot, chat_id: int, message_id: int, company_id: int, cursor: Optional[str] = None):
     """
     Показать карточку предприятия со списком сотрудников
     """
@@ -507,7 +425,7 @@ async def show_company_card(bot: AsyncTeleBot, chat_id: int, message_id: int, co
         await safe_edit_message(bot, chat_id, message_id, "❌ Предприятие не найдено")
         return
 
-    users, total_users = await get_company_users_page(company_id, page)
+    users, total_users, page = await get_company_users_page(company_id, cursor)
 
     # Формируем текст карточки
     text = (
@@ -524,11 +442,11 @@ async def show_company_card(bot: AsyncTeleBot, chat_id: int, message_id: int, co
     if users:
         text += "<b>👥 Сотрудники:</b>\n"
         for u in users:
-            emoji = STATUS_EMOJI.get(u['status'], '⚪')
-            full_name = f"{u['last_name']} {u['first_name']}"
-            if u['father_name']:
-                full_name += f" {u['father_name']}"
-            text += f"{emoji} <code>{u['id']}</code> {full_name}\n"
+            emoji = STATUS_EMOJI.get(u.status, '⚪')
+            full_name = f"{u.last_name} {u.first_name}"
+            if u.father_name:
+                full_name += f" {u.father_name}"
+            text += f"{emoji} <code>{u.id}</code> {full_name}\n"
     else:
         text += "📭 Сотрудников нет"
 
@@ -539,57 +457,32 @@ async def show_company_card(bot: AsyncTeleBot, chat_id: int, message_id: int, co
 
 # ===== ПОЛЬЗОВАТЕЛИ =====
 
-async def get_users_page(page: int = 0, status_filter: Optional[str] = None) -> Tuple[List[dict], int]:
+async def get_users_page(cursor: Optional[str] = None, status_filter: Optional[str] = None) -> Tuple[List[UserSummary], int, KeysetPage]:
     """
     Получить страницу всех пользователей
 
     Args:
-        page: Номер страницы (с 0)
+        cursor: Токен курсора страницы (None - первая страница)
         status_filter: Фильтр по статусу (опционально)
 
     Returns:
-        Tuple[список пользователей, общее количество]
+        Tuple[список пользователей, общее количество, страница с курсорами]
     """
-    async with SessionLocal() as session:
-        # Базовый запрос
-        base_query = select(User)
-        count_query = select(func.count(User.id))
-
-        if status_filter:
-            base_query = base_query.where(User.status == status_filter)
-            count_query = count_query.where(User.status == status_filter)
-
-        # Общее количество
-        total_result = await session.execute(count_query)
-        total = total_result.scalar() or 0
-
-        # Получаем пользователей с компанией
-        stmt = (
-            base_query
-            .options(selectinload(User.company))
-            .order_by(User.id.asc())
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
-        )
+    # Общее количество - из счётчиков статистики, без COUNT(*) на каждый клик
+    stats = await registry_stats.snapshot()
+    total = stats.status(status_filter) if status_filter else stats.users
 
-        result = await session.execute(stmt)
-        users = result.scalars().all()
+    base_query = user_summary_query()
+    if status_filter:
+        base_query = base_query.where(User.status == status_filter)
 
-        users_list = [
-            {
-                'id': u.id,
-                'last_name': u.last_name,
-                'first_name': u.first_name,
-                'status': u.status,
-                'company_name': u.company.name if u.company else 'Не назначено'
-            }
-            for u in users
-        ]
+    async with ReadSessionLocal() as session:
+        page = await fetch_keyset_page(session, base_query, (User.id,), cursor, ITEMS_PER_PAGE, total=total)
 
-        return users_list, total
+    return to_summaries(page.rows), total, page
 
 
-def build_users_list_keyboard(users: List[dict], page: int, total: int, status_filter: Optional[str] = None) -> InlineKeyboardMarkup:
+def build_users_list_keyboard(users: List[UserSummary], page: KeysetPage, total: int, status_filter: Optional[str] = None) -> InlineKeyboardMarkup:
     """
     Построить клавиатуру списка пользователей с пагинацией
     """
@@ -597,36 +490,19 @@ def build_users_list_keyboard(users: List[dict], page: int, total: int, status_f
 
     # Кнопки пользователей
     for user in users:
-        emoji = STATUS_EMOJI.get(user['status'], '⚪')
-        btn_text = f"{emoji} {user['id']}. {user['last_name']} {user['first_name']}"
+        emoji = STATUS_EMOJI.get(user.status, '⚪')
+        btn_text = f"{emoji} {user.id}. {user.last_name} {user.first_name}"
         # Обрезаем текст если слишком длинный
         if len(btn_text) > 55:
             btn_text = btn_text[:52] + "..."
         keyboard.add(
-            InlineKeyboardButton(btn_text, callback_data=f"user_{user['id']}")
+            InlineKeyboardButton(btn_text, callback_data=f"user_{user.id}")
         )
 
     # Пагинация
-    total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
     filter_suffix = f"_{status_filter}" if status_filter else ""
-
-    if total_pages > 1:
-        nav_buttons = []
-
-        if page > 0:
-            nav_buttons.append(
-                InlineKeyboardButton("◀️", callback_data=f"users_page_{page - 1}{filter_suffix}")
-            )
-
-        nav_buttons.append(
-            InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data="noop")
-        )
-
-        if page < total_pages - 1:
-            nav_buttons.append(
-                InlineKeyboardButton("▶️", callback_data=f"users_page_{page + 1}{filter_suffix}")
-            )
-
+    nav_buttons = build_page_nav_row("users_page_", page, total, filter_suffix)
+    if nav_buttons:
         keyboard.row(*nav_buttons)
 
     # Фильтры по статусу
@@ -646,11 +522,11 @@ def build_users_list_keyboard(users: List[dict], page: int, total: int, status_f
     return keyboard
 
 
-async def show_users_list(bot: AsyncTeleBot, chat_id: int, message_id: Optional[int] = None, page: int = 0, status_filter: Optional[str] = None):
+async def show_users_list(bot: AsyncTeleBot, chat_id: int, message_id: Optional[int] = None, cursor: Optional[str] = None, status_filter: Optional[str] = None):
     """
     Показать список пользователей с пагинацией
     """
-    users, total = await get_users_page(page, status_filter)
+    users, total, page = await get_users_page(cursor, status_filter)
 
     filter_text = ""
     if status_filter:
@@ -682,43 +558,31 @@ async def get_user_detail(user_id: int) -> Optional[dict]:
     Returns:
         dict с данными пользователя или None
     """
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.company))
-            .where(User.id == user_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            return None
-
-        # Получаем имя волонтёра
-        volunteer_name = None
-        if user.volunteer_id:
-            volunteer = await session.get(User_volunteer, user.volunteer_id)
-            if volunteer:
-                volunteer_name = volunteer.name or f"#{volunteer.id}"
+    # Пользователь, предприятие и волонтёр - одним запросом
+    user = await load_user_profile(user_id)
 
-        return {
-            'id': user.id,
-            'last_name': user.last_name,
-            'first_name': user.first_name,
-            'father_name': user.father_name or '',
-            'date_of_birth': user.date_of_birth,
-            'phone_number': user.phone_number or 'Не указан',
-            'address': user.address or 'Не указан',
-            'status': user.status,
-            'tg_id': user.tg_id,
-            'company_id': user.company_id,
-            'company_name': user.company.name if user.company else 'Не назначено',
-            'registered_at': user.registered_at,
-            'blocked_at': user.blocked_at,
-            'volunteer_id': user.volunteer_id,
-            'volunteer_name': volunteer_name,
-            'sms_code': user.sms_code,
-            'sms_confirmed_at': user.sms_confirmed_at
-        }
+    if not user:
+        return None
+
+    return {
+        'id': user.id,
+        'last_name': user.last_name,
+        'first_name': user.first_name,
+        'father_name': user.father_name or '',
+        'date_of_birth': user.date_of_birth,
+        'phone_number': user.phone_number or 'Не указан',
+        'address': user.address or 'Не указан',
+        'status': user.status,
+        'tg_id': user.tg_id,
+        'company_id': user.company_id,
+        'company_name': user.company_name if user.company_name is not None else 'Не назначено',
+        'registered_at': user.registered_at,
+        'blocked_at': user.blocked_at,
+        'volunteer_id': user.volunteer_id,
+        'volunteer_name': user.volunteer_name,
+        'sms_code': user.sms_code,
+        'sms_confirmed_at': user.sms_confirmed_at
+    }
 
 
 def build_user_card_keyboard(user_id: int, company_id: Optional[int] = None, status: str = None) -> InlineKeyboardMarkup:
@@ -806,117 +670,52 @@ async def show_user_card(bot: AsyncTeleBot, chat_id: int, message_id: int, user_
 
 # ===== ПОИСК =====
 
-async def search_users_page(query: str, page: int = 0) -> Tuple[List[dict], int]:
+async def search_users_page(query: str, cursor: Optional[str] = None) -> Tuple[List[UserSummary], int, KeysetPage]:
     """
     Поиск пользователей по ФИО, ID или телефону с пагинацией
 
     Args:
         query: Поисковый запрос
-        page: Номер страницы
+        cursor: Токен курсора страницы (None - первая страница)
 
     Returns:
-        Tuple[список пользователей, общее количество]
-    """
-    async with SessionLocal() as session:
-        query_text = query.strip()
-        # Создаем паттерны для обоих регистров (первая буква)
-        pattern_original = f"%{query_text}%"
-        pattern_lower = f"%{query_text.lower()}%"
-        pattern_upper = f"%{query_text.upper()}%"
-        pattern_capitalize = f"%{query_text.capitalize()}%"
-
-
-        # Базовые условия поиска - ищем по всем вариантам регистра
-        search_conditions = (
-            (User.last_name.like(pattern_original)) |
-            (User.last_name.like(pattern_lower)) |
-            (User.last_name.like(pattern_upper)) |
-            (User.last_name.like(pattern_capitalize)) |
-            (User.first_name.like(pattern_original)) |
-            (User.first_name.like(pattern_lower)) |
-            (User.first_name.like(pattern_upper)) |
-            (User.first_name.like(pattern_capitalize)) |
-            (User.father_name.like(pattern_original)) |
-            (User.father_name.like(pattern_lower)) |
-            (User.father_name.like(pattern_upper)) |
-            (User.father_name.like(pattern_capitalize)) |
-            (User.phone_number.like(pattern_original))
-        )
-
-        # Если это число - добавляем поиск по ID
-        if query.strip().isdigit():
-            user_id = int(query.strip())
-            search_conditions = search_conditions | (User.id == user_id)
+        Tuple[список пользователей, общее количество, страница с курсорами]
+    """
+    # Поиск по ФИО и телефону идёт через полнотекстовый индекс, числовой запрос - ещё и по ID
+    search_conditions = await search_index.user_condition(query)
 
-        # Общее количество
-        count_result = await session.execute(
-            select(func.count(User.id)).where(search_conditions)
-        )
-        total = count_result.scalar() or 0
+    async with ReadSessionLocal() as session:
+        async def count_matches() -> int:
+            return await session.scalar(select(func.count(User.id)).where(search_conditions))
 
+        # Общее количество кэшируется на время листания, чтобы не считать его на каждой странице
+        total = await count_cache.get(("user_search", normalize_query(" ".join(query.split()))), count_matches)
 
-        # Получаем пользователей с пагинацией
-        stmt = (
-            select(User)
-            .options(selectinload(User.company))
-            .where(search_conditions)
-            .order_by(User.id.asc())
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
+        page = await fetch_keyset_page(
+            session, user_summary_query().where(search_conditions), (User.id,), cursor, ITEMS_PER_PAGE, total=total
         )
 
-        result = await session.execute(stmt)
-        users = result.scalars().all()
-
-
-        users_list = [
-            {
-                'id': u.id,
-                'last_name': u.last_name,
-                'first_name': u.first_name,
-                'status': u.status,
-                'company_name': u.company.name if u.company else 'Не назначено'
-            }
-            for u in users
-        ]
+    return to_summaries(page.rows), total, page
 
-        return users_list, total
 
-
-def build_search_results_keyboard(users: List[dict], query: str, page: int, total: int) -> InlineKeyboardMarkup:
+def build_search_results_keyboard(users: List[UserSummary], query: str, page: KeysetPage, total: int) -> InlineKeyboardMarkup:
     """
     Построить клавиатуру результатов поиска с пагинацией
     """
     keyboard = InlineKeyboardMarkup(row_width=1)
 
     for user in users:
-        emoji = STATUS_EMOJI.get(user['status'], '⚪')
-        btn_text = f"{emoji} {user['id']}. {user['last_name']} {user['first_name']}"
+        emoji = STATUS_EMOJI.get(user.status, '⚪')
+        btn_text = f"{emoji} {user.id}. {user.last_name} {user.first_name}"
         if len(btn_text) > 55:
             btn_text = btn_text[:52] + "..."
         keyboard.add(
-            InlineKeyboardButton(btn_text, callback_data=f"user_{user['id']}")
+            InlineKeyboardButton(btn_text, callback_data=f"user_{user.id}")
         )
 
     # Пагинация
-    total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    if total_pages > 1:
-        nav_buttons = []
-
-        if page > 0:
-            nav_buttons.append(
-                InlineKeyboardButton("◀️", callback_data=f"search_page_{page - 1}")
-            )
-
-        nav_buttons.append(
-            InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data="noop")
-        )
-
-        if page < total_pages - 1:
-            nav_buttons.append(
-                InlineKeyboardButton("▶️", callback_data=f"search_page_{page + 1}")
-            )
-
+    nav_buttons = build_page_nav_row("search_page_", page, total)
+    if nav_buttons:
         keyboard.row(*nav_buttons)
 
     keyboard.add(
@@ -972,60 +771,34 @@ async def show_company_search_prompt(bot: AsyncTeleBot, chat_id: int, message_id
         await safe_send_message(bot, chat_id, text, reply_markup=keyboard)
 
 
-async def search_companies_page(query: str, page: int = 0) -> Tuple[List[dict], int]:
+async def search_companies_page(query: str, cursor: Optional[str] = None) -> Tuple[List[dict], int, KeysetPage]:
     """
     Поиск предприятий по названию или ID с пагинацией
     """
-    async with SessionLocal() as session:
-        query_text = query.strip()
-        pattern = f"%{query_text}%"
-
-        # Условия поиска по названию (регистронезависимо)
-        search_conditions = (
-            (Company.name.like(pattern)) |
-            (Company.name.like(f"%{query_text.lower()}%")) |
-            (Company.name.like(f"%{query_text.upper()}%")) |
-            (Company.name.like(f"%{query_text.capitalize()}%"))
-        )
+    # Поиск по названию идёт через полнотекстовый индекс, числовой запрос - ещё и по ID
+    search_conditions = await search_index.company_condition(query)
 
-        # Если это число - добавляем поиск по ID
-        if query_text.isdigit():
-            company_id = int(query_text)
-            search_conditions = search_conditions | (Company.id == company_id)
+    async with ReadSessionLocal() as session:
+        async def count_matches() -> int:
+            return await session.scalar(select(func.count(Company.id)).where(search_conditions))
 
-        # Общее количество
-        count_result = await session.execute(
-            select(func.count(Company.id)).where(search_conditions)
-        )
-        total = count_result.scalar() or 0
+        total = await count_cache.get(("company_search", normalize_query(" ".join(query.split()))), count_matches)
 
-        # Получаем предприятия с количеством пользователей
-        stmt = (
-            select(
-                Company.id,
-                Company.name,
-                func.count(User.id).label("user_count")
-            )
-            .outerjoin(User, User.company_id == Company.id)
-            .where(search_conditions)
-            .group_by(Company.id, Company.name)
-            .order_by(Company.id)
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
-        )
+        stmt = select(Company.id, Company.name).where(search_conditions)
+        page = await fetch_keyset_page(session, stmt, (Company.id,), cursor, ITEMS_PER_PAGE, total=total)
 
-        result = await session.execute(stmt)
-        rows = result.all()
+    # Количество сотрудников - из счётчиков статистики
+    counts = (await registry_stats.snapshot()).company_users
 
-        companies = [
-            {'id': row[0], 'name': row[1], 'user_count': row[2]}
-            for row in rows
-        ]
+    companies = [
+        {'id': row[0], 'name': row[1], 'user_count': counts.get(row[0], 0)}
+        for row in page.rows
+    ]
 
-        return companies, total
+    return companies, total, page
 
 
-def build_company_search_results_keyboard(companies: List[dict], query: str, page: int, total: int) -> InlineKeyboardMarkup:
+def build_company_search_results_keyboard(companies: List[dict], query: str, page: KeysetPage, total: int) -> InlineKeyboardMarkup:
     """
     Построить клавиатуру результатов поиска предприятий
     """
@@ -1040,24 +813,8 @@ def build_company_search_results_keyboard(companies: List[dict], query: str, pag
         )
 
     # Пагинация
-    total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    if total_pages > 1:
-        nav_buttons = []
-
-        if page > 0:
-            nav_buttons.append(
-                InlineKeyboardButton("◀️", callback_data=f"search_comp_page_{page - 1}")
-            )
-
-        nav_buttons.append(
-            InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data="noop")
-        )
-
-        if page < total_pages - 1:
-            nav_buttons.append(
-                InlineKeyboardButton("▶️", callback_data=f"search_comp_page_{page + 1}")
-            )
-
+    nav_buttons = build_page_nav_row("search_comp_page_", page, total)
+    if nav_buttons:
         keyboard.row(*nav_buttons)
 
     keyboard.add(
@@ -1068,14 +825,14 @@ def build_company_search_results_keyboard(companies: List[dict], query: str, pag
     return keyboard
 
 
-async def show_company_search_results(bot: AsyncTeleBot, chat_id: int, query: str, page: int = 0, message_id: Optional[int] = None) -> bool:
+async def show_company_search_results(bot: AsyncTeleBot, chat_id: int, query: str, cursor: Optional[str] = None, message_id: Optional[int] = None) -> bool:
     """
     Показать результаты поиска предприятий
 
     Returns:
         True если найдены результаты, False если не найдено
     """
-    companies, total = await search_companies_page(query, page)
+    companies, total, page = await search_companies_page(query, cursor)
 
     if not companies:
         text = (
@@ -1152,42 +909,35 @@ async def show_volunteer_added(bot: AsyncTeleBot, chat_id: int, volunteer_tg_id:
 
 # ============ ВОЛОНТЕРЫ ============
 
-async def get_volunteers_page(page: int = 0) -> Tuple[List[dict], int]:
+async def get_volunteers_page(cursor: Optional[str] = None) -> Tuple[List[dict], int, KeysetPage]:
     """
     Получить страницу волонтеров
 
     Args:
-        page: Номер страницы (с 0)
+        cursor: Токен курсора страницы (None - первая страница)
 
     Returns:
-        Tuple[список волонтеров, общее количество]
+        Tuple[список волонтеров, общее количество, страница с курсорами]
     """
-    async with SessionLocal() as session:
-        # Общее количество
-        total_result = await session.execute(select(func.count(User_volunteer.id)))
-        total = total_result.scalar() or 0
+    total = (await registry_stats.snapshot()).volunteers
 
-        # Получаем волонтеров
-        stmt = (
-            select(User_volunteer)
-            .order_by(User_volunteer.id.desc())
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
+    async with ReadSessionLocal() as session:
+        # Новые волонтеры - первыми
+        page = await fetch_keyset_page(
+            session, select(User_volunteer), (User_volunteer.id,), cursor, ITEMS_PER_PAGE,
+            descending=True, scalars=True, total=total
         )
 
-        result = await session.execute(stmt)
-        volunteers = result.scalars().all()
-
-        return [
-            {
-                'id': v.id,
-                'tg_id': v.tg_id,
-                'name': v.name,
-                'added_at': v.added_at,
-                'added_by': v.added_by
-            }
-            for v in volunteers
-        ], total
+    return [
+        {
+            'id': v.id,
+            'tg_id': v.tg_id,
+            'name': v.name,
+            'added_at': v.added_at,
+            'added_by': v.added_by
+        }
+        for v in page.rows
+    ], total, page
 
 
 async def get_volunteer_detail(volunteer_id: int) -> Optional[dict]:
@@ -1200,7 +950,7 @@ async def get_volunteer_detail(volunteer_id: int) -> Optional[dict]:
     Returns:
         Словарь с данными или None
     """
-    async with SessionLocal() as session:
+    async with ReadSessionLocal() as session:
         volunteer = await session.get(User_volunteer, volunteer_id)
 
         if not volunteer:
@@ -1225,18 +975,23 @@ async def delete_volunteer(volunteer_id: int) -> bool:
     Returns:
         True если удален успешно
     """
-    async with SessionLocal() as session:
+    async def write(session) -> bool:
         volunteer = await session.get(User_volunteer, volunteer_id)
 
         if not volunteer:
             return False
 
         await session.delete(volunteer)
-        await session.commit()
         return True
 
+    # Все записи идут через общий writer: отдельный коммит ждал бы его блокировку
+    deleted = await submit_write(write)
+    if deleted:
+        identity_cache.invalidate_target(VOLUNTEER, volunteer_id)
+    return deleted
 
-def build_volunteers_list_keyboard(volunteers: List[dict], page: int, total: int) -> InlineKeyboardMarkup:
+
+def build_volunteers_list_keyboard(volunteers: List[dict], page: KeysetPage, total: int) -> InlineKeyboardMarkup:
     """
     Построить клавиатуру списка волонтеров
     """
@@ -1252,24 +1007,8 @@ def build_volunteers_list_keyboard(volunteers: List[dict], page: int, total: int
         )
 
     # Пагинация
-    total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    if total_pages > 1:
-        nav_buttons = []
-
-        if page > 0:
-            nav_buttons.append(
-                InlineKeyboardButton("◀️", callback_data=f"volunteers_page_{page - 1}")
-            )
-
-        nav_buttons.append(
-            InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data="noop")
-        )
-
-        if page < total_pages - 1:
-            nav_buttons.append(
-                InlineKeyboardButton("▶️", callback_data=f"volunteers_page_{page + 1}")
-            )
-
+    nav_buttons = build_page_nav_row("volunteers_page_", page, total)
+    if nav_buttons:
         keyboard.row(*nav_buttons)
 
     # Кнопка добавления и назад
@@ -1281,7 +1020,7 @@ def build_volunteers_list_keyboard(volunteers: List[dict], page: int, total: int
 
 async def get_volunteers_stats() -> dict:
     """Получить статистику регистраций по каждому волонтёру."""
-    async with SessionLocal() as session:
+    async with ReadSessionLocal() as session:
         stmt = (
             select(User.volunteer_id, func.count(User.id))
             .where(User.volunteer_id.isnot(None), User.status == 'registered')
@@ -1291,11 +1030,11 @@ async def get_volunteers_stats() -> dict:
         return {vol_id: cnt for vol_id, cnt in result.all()}
 
 
-async def show_volunteers_list(bot: AsyncTeleBot, chat_id: int, message_id: Optional[int], page: int = 0):
+async def show_volunteers_list(bot: AsyncTeleBot, chat_id: int, message_id: Optional[int], cursor: Optional[str] = None):
     """
     Показать список волонтеров со статистикой
     """
-    volunteers, total = await get_volunteers_page(page)
+    volunteers, total, page = await get_volunteers_page(cursor)
 
     # Получаем статистику по всем волонтёрам
     stats = await get_volunteers_stats()
@@ -1453,7 +1192,7 @@ async def update_volunteer_name(volunteer_id: int, name: str) -> bool:
     Returns:
         True если успешно
     """
-    async with SessionLocal() as session:
+    async def write(session) -> bool:
         volunteer = await session.get(User_volunteer, volunteer_id)
 
         if not volunteer:
@@ -1461,18 +1200,19 @@ async def update_volunteer_name(volunteer_id: int, name: str) -> bool:
 
         volunteer.name = name
         volunteer.name_manual = 1
-        await session.commit()
         return True
 
+    return await submit_write(write)
+
 
-async def show_search_results(bot: AsyncTeleBot, chat_id: int, query: str, page: int = 0, message_id: Optional[int] = None) -> bool:
+async def show_search_results(bot: AsyncTeleBot, chat_id: int, query: str, cursor: Optional[str] = None, message_id: Optional[int] = None) -> bool:
     """
     Показать результаты поиска с пагинацией
 
     Returns:
         True если найдены результаты, False если не найдено (нужно остаться в режиме поиска)
     """
-    users, total = await search_users_page(query, page)
+    users, total, page = await search_users_page(query, cursor)
 
     if not users:
         text = (
@@ -1507,13 +1247,7 @@ async def get_all_companies() -> List[dict]:
     """
     Получить все предприятия для выбора
     """
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(Company).order_by(Company.id)
-        )
-        companies = result.scalars().all()
-
-        return [{'id': c.id, 'name': c.name} for c in companies]
+    return await company_catalog.all(order=ORDER_BY_ID)
 
 
 def build_company_select_keyboard(companies: List[dict], user_id: int, page: int = 0) -> InlineKeyboardMarkup:
@@ -1594,7 +1328,7 @@ async def change_user_company(user_id: int, new_company_id: int) -> Optional[Tup
     Returns:
         Tuple[old_company_name, new_company_name] если успешно, None если ошибка
     """
-    async with SessionLocal() as session:
+    async def write(session) -> Optional[Tuple[str, str]]:
         result = await session.execute(
             select(User)
             .options(selectinload(User.company))
@@ -1617,10 +1351,11 @@ async def change_user_company(user_id: int, new_company_id: int) -> Optional[Tup
             return None
 
         user.company_id = new_company_id
-        await session.commit()
 
         return (old_company_name, new_company.name)
 
+    return await submit_write(write)
+
 
 # ===== УДАЛЕНИЕ ПОЛЬЗОВАТЕЛЯ =====
 
@@ -1670,7 +1405,7 @@ async def delete_user(user_id: int) -> Optional[str]:
     Returns:
         ФИО пользователя если успешно, None если ошибка
     """
-    async with SessionLocal() as session:
+    async def write(session) -> Optional[str]:
         result = await session.execute(
             select(User).where(User.id == user_id)
         )
@@ -1685,22 +1420,33 @@ async def delete_user(user_id: int) -> Optional[str]:
 
         user.status = 'deleted'
         user.tg_id = None  # Отвязываем Telegram
-        await session.commit()
 
         return user_name
 
+    user_name = await submit_write(write)
+    if user_name is not None:
+        roster_index.set_status(user_id, 'deleted')
+        identity_cache.invalidate_target(USER, user_id)
+
+    return user_name
+
 
 async def reset_user_status(user_id: int) -> bool:
     """Сбросить статус пользователя на 'not registered'"""
-    async with SessionLocal() as session:
+    async def write(session) -> bool:
         user = await session.get(User, user_id)
         if not user:
             return False
         user.status = 'not registered'
         user.tg_id = None
-        await session.commit()
         return True
 
+    reset = await submit_write(write)
+    if reset:
+        roster_index.set_status(user_id, 'not registered')
+        identity_cache.invalidate_target(USER, user_id)
+    return reset
+
 
 async def handle_admin_callback(call: CallbackQuery, bot: AsyncTeleBot):
     """
@@ -1741,34 +1487,32 @@ async def handle_admin_callback(call: CallbackQuery, bot: AsyncTeleBot):
         # Карточка предприятия
         elif data.startswith("company_"):
             company_id = int(data.split("_")[1])
-            await show_company_card(bot, chat_id, message_id, company_id, page=0)
+            await show_company_card(bot, chat_id, message_id, company_id)
             await bot.answer_callback_query(call.id)
 
         # Пагинация сотрудников предприятия
         elif data.startswith("comp_users_"):
             parts = data.split("_")
             company_id = int(parts[2])
-            page = int(parts[3])
-            await show_company_card(bot, chat_id, message_id, company_id, page=page)
+            await show_company_card(bot, chat_id, message_id, company_id, cursor=parts[3])
             await bot.answer_callback_query(call.id)
 
         # Список пользователей
         elif data == "admin_users":
-            await show_users_list(bot, chat_id, message_id, page=0)
+            await show_users_list(bot, chat_id, message_id)
             await bot.answer_callback_query(call.id)
 
         # Пагинация пользователей
         elif data.startswith("users_page_"):
             parts = data.replace("users_page_", "").split("_", 1)
-            page = int(parts[0])
             status_filter = parts[1] if len(parts) > 1 else None
-            await show_users_list(bot, chat_id, message_id, page=page, status_filter=status_filter)
+            await show_users_list(bot, chat_id, message_id, cursor=parts[0], status_filter=status_filter)
             await bot.answer_callback_query(call.id)
 
         # Фильтр пользователей по статусу
         elif data.startswith("users_filter_"):
             status_filter = data.replace("users_filter_", "")
-            await show_users_list(bot, chat_id, message_id, page=0, status_filter=status_filter)
+            await show_users_list(bot, chat_id, message_id, status_filter=status_filter)
             await bot.answer_callback_query(call.id)
 
         # Карточка пользователя
@@ -1786,10 +1530,10 @@ async def handle_admin_callback(call: CallbackQuery, bot: AsyncTeleBot):
 
         # Пагинация результатов поиска
         elif data.startswith("search_page_"):
-            page = int(data.split("_")[2])
+            cursor = data.split("_")[2]
             await bot.answer_callback_query(call.id)
             # Возвращаем запрос на пагинацию поиска
-            return {"action": "search_paginate", "page": page}
+            return {"action": "search_paginate", "cursor": cursor}
 
         # Поиск предприятий - показать приглашение
         elif data == "admin_search_companies":
@@ -1799,9 +1543,9 @@ async def handle_admin_callback(call: CallbackQuery, bot: AsyncTeleBot):
 
         # Пагинация результатов поиска предприятий
         elif data.startswith("search_comp_page_"):
-            page = int(data.split("_")[3])
+            cursor = data.split("_")[3]
             await bot.answer_callback_query(call.id)
-            return {"action": "company_search_paginate", "page": page}
+            return {"action": "company_search_paginate", "cursor": cursor}
 
         # Изменение предприятия - показать выбор
         elif data.startswith("edit_user_company_"):
@@ -1868,13 +1612,13 @@ async def handle_admin_callback(call: CallbackQuery, bot: AsyncTeleBot):
 
         # Список волонтеров
         elif data == "admin_volunteers":
-            await show_volunteers_list(bot, chat_id, message_id, page=0)
+            await show_volunteers_list(bot, chat_id, message_id)
             await bot.answer_callback_query(call.id)
 
         # Пагинация волонтеров
         elif data.startswith("volunteers_page_"):
-            page = int(data.split("_")[2])
-            await show_volunteers_list(bot, chat_id, message_id, page=page)
+            cursor = data.split("_")[2]
+            await show_volunteers_list(bot, chat_id, message_id, cursor=cursor)
             await bot.answer_callback_query(call.id)
 
         # Карточка волонтера
@@ -1895,7 +1639,7 @@ async def handle_admin_callback(call: CallbackQuery, bot: AsyncTeleBot):
             success = await delete_volunteer(volunteer_id)
             if success:
                 await bot.answer_callback_query(call.id, "✅ Волонтер удален")
-                await show_volunteers_list(bot, chat_id, message_id, page=0)
+                await show_volunteers_list(bot, chat_id, message_id)
             else:
                 await bot.answer_callback_query(call.id, "❌ Ошибка", show_alert=True)
 
@@ -5,18 +5,37 @@
 
 import logging
 import functools
-from typing import List, Callable, Any
+from typing import List, Callable, Any, Optional
+
+from services.role_index import role_index
 
 logger = logging.getLogger(__name__)
 
 # ID разработчика - может видеть кнопку переключения режимов
 developer_ids: List[int] = [1632759029]
 
-# ID администраторов (импортируем из vars.py при использовании)
-# admin_ids будут браться из vars.py
+# Роли берутся из индекса platform_role (services.role_index).
+# Списки admin_ids / superadmin_ids из vars.py используются только
+# до первой загрузки индекса.
+
+
+def _has_role(user_id: int, role: str, fallback_ids: Optional[List[int]]) -> bool:
+    if role_index.loaded:
+        return role_index.has_role(user_id, role)
+    return user_id in (fallback_ids or ())
+
+
+def get_roles(user_id: int) -> frozenset:
+    """
+    Получить полный набор ролей пользователя (admin, superadmin, developer)
 
-# ID суперадминов (для критических операций)
-# superadmin_ids будут браться из vars.py
+    Args:
+        user_id: Telegram user ID
+
+    Returns:
+        frozenset с названиями ролей
+    """
+    return role_index.roles_for(user_id)
 
 
 def is_developer(user_id: int) -> bool:
@@ -29,35 +48,35 @@ def is_developer(user_id: int) -> bool:
     Returns:
         True если разработчик
     """
-    return user_id in developer_ids
+    return _has_role(user_id, 'developer', developer_ids)
 
 
-def is_admin(user_id: int, admin_ids: List[int]) -> bool:
+def is_admin(user_id: int, admin_ids: Optional[List[int]] = None) -> bool:
     """
     Проверка является ли пользователь администратором
 
     Args:
         user_id: Telegram user ID
-        admin_ids: Список ID администраторов
+        admin_ids: Список ID администраторов (до загрузки индекса ролей)
 
     Returns:
         True если админ
     """
-    return user_id in admin_ids
+    return _has_role(user_id, 'admin', admin_ids)
 
 
-def is_superadmin(user_id: int, superadmin_ids: List[int]) -> bool:
+def is_superadmin(user_id: int, superadmin_ids: Optional[List[int]] = None) -> bool:
     """
     Проверка является ли пользователь суперадмином
 
     Args:
         user_id: Telegram user ID
-        superadmin_ids: Список ID суперадминов
+        superadmin_ids: Список ID суперадминов (до загрузки индекса ролей)
 
     Returns:
         True если суперадмин
     """
-    return user_id in superadmin_ids
+    return _has_role(user_id, 'superadmin', superadmin_ids)
 
 
 def require_admin(admin_ids: List[int]):
@@ -207,7 +226,7 @@ def set_developer_role(user_id: int, role: str) -> None:
         logger.info(f"Developer {user_id} switched to role: {role}")
 
 
-def should_show_as_admin(user_id: int, admin_ids: List[int]) -> bool:
+def should_show_as_admin(user_id: int, admin_ids: Optional[List[int]] = None) -> bool:
     """
     Определить, показывать ли пользователю админ-интерфейс
 
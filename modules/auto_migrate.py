@@ -8,6 +8,7 @@ import logging
 from sqlalchemy import text, inspect
 from db import engine, DATABASE_URI
 from models import Base
+from services.search_index import ensure_search_index
 
 logger = logging.getLogger(__name__)
 
@@ -106,4 +107,27 @@ async def check_and_migrate():
             ))
             logger.info("Added column 'sms_confirmed_at' to user")
 
+        # create_all не добавляет новые индексы в уже существующие таблицы
+        def create_missing_indexes(connection):
+            existing = {
+                row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+            }
+            created = []
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(connection)
+                        created.append(index.name)
+            return created
+
+        created_indexes = await conn.run_sync(create_missing_indexes)
+        if created_indexes:
+            logger.info(f"Created indexes: {created_indexes}")
+
+        # Полнотекстовый индекс поиска (FTS5 trigram) и триггеры синхронизации
+        if await conn.run_sync(ensure_search_index):
+            logger.info("Search index is ready")
+        else:
+            logger.info("FTS5 trigram is unavailable, search falls back to LIKE")
+
     logger.info("Database migration check complete")
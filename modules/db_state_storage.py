@@ -1,17 +1,16 @@
-﻿import asyncio
-import logging
+﻿import logging
 
-from telebot.asyncio_storage import StateMemoryStorage
 from telebot.asyncio_storage.base_storage import StateDataContext, StateStorageBase
 
+from services.conversation_state_cache import ConversationStateCache, StateAddress
 from services.conversation_state_service import ConversationStateService
-from services.platform import PlatformSchemaUnavailable
+from services.keyed_lock import KeyedLock
 
 logger = logging.getLogger(__name__)
 
 
 class DbStateStorage(StateStorageBase):
-    """DB-backed storage with in-memory fallback until the schema is ready."""
+    """DB-backed storage behind a bounded in-memory tier (see ConversationStateCache)."""
 
     def __init__(
         self,
@@ -22,54 +21,30 @@ class DbStateStorage(StateStorageBase):
         self.provider = provider
         self.prefix = prefix
         self.separator = separator
-        self.lock = asyncio.Lock()
-        self.memory = StateMemoryStorage(separator=separator, prefix=prefix)
+        # Lock per conversation: one user's updates stay ordered, others don't wait
+        self.locks = KeyedLock()
         self.service = ConversationStateService(
             provider=provider,
             prefix=prefix,
             separator=separator,
         )
-        self._fallback_logged = False
+        # Same locks: a background flush never overlaps delete_state of the conversation
+        self.cache = ConversationStateCache(self.service, locks=self.locks)
 
-    def _log_fallback(self, exc: Exception) -> None:
-        if self._fallback_logged:
-            return
-        logger.warning(
-            "ConversationState DB storage is not ready, falling back to memory: %s",
-            exc,
-        )
-        self._fallback_logged = True
-
-    async def _reseed_db_record(
+    def _address(
         self,
         chat_id,
         user_id,
         business_connection_id=None,
         message_thread_id=None,
         bot_id=None,
-    ) -> bool:
-        state = await self.memory.get_state(
-            chat_id=chat_id,
-            user_id=user_id,
-            business_connection_id=business_connection_id,
-            message_thread_id=message_thread_id,
-            bot_id=bot_id,
-        )
-        if state is None:
-            return False
+    ) -> tuple[str, StateAddress]:
+        address = StateAddress(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        return self.service.make_storage_key(**address.kwargs()), address
 
-        try:
-            return await self.service.set_state(
-                chat_id=chat_id,
-                user_id=user_id,
-                state=state,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-        except PlatformSchemaUnavailable as exc:
-            self._log_fallback(exc)
-            return False
+    async def flush(self) -> int:
+        """Persist data changes that are still only in memory."""
+        return await self.cache.flush()
 
     async def set_state(
         self,
@@ -80,27 +55,12 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ) -> bool:
-        async with self.lock:
-            await self.memory.set_state(
-                chat_id=chat_id,
-                user_id=user_id,
-                state=state,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-            try:
-                return await self.service.set_state(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    state=state,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-            except PlatformSchemaUnavailable as exc:
-                self._log_fallback(exc)
-                return True
+        if hasattr(state, "name"):
+            state = state.name
+        key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        async with self.locks(key):
+            await self.cache.set_state(key, address, state)
+            return True
 
     async def get_state(
         self,
@@ -110,28 +70,8 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ):
-        try:
-            db_state = await self.service.get_state(
-                chat_id=chat_id,
-                user_id=user_id,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-        except PlatformSchemaUnavailable as exc:
-            self._log_fallback(exc)
-            db_state = None
-
-        if db_state is not None:
-            return db_state
-
-        return await self.memory.get_state(
-            chat_id=chat_id,
-            user_id=user_id,
-            business_connection_id=business_connection_id,
-            message_thread_id=message_thread_id,
-            bot_id=bot_id,
-        )
+        key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        return await self.cache.get_state(key, address)
 
     async def delete_state(
         self,
@@ -141,26 +81,9 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ) -> bool:
-        async with self.lock:
-            memory_deleted = await self.memory.delete_state(
-                chat_id=chat_id,
-                user_id=user_id,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-            try:
-                db_deleted = await self.service.delete_state(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-                return db_deleted or memory_deleted
-            except PlatformSchemaUnavailable as exc:
-                self._log_fallback(exc)
-                return memory_deleted
+        key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        async with self.locks(key):
+            return await self.cache.delete(key, address)
 
     async def set_data(
         self,
@@ -172,48 +95,9 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ) -> bool:
-        async with self.lock:
-            await self.memory.set_data(
-                chat_id=chat_id,
-                user_id=user_id,
-                key=key,
-                value=value,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-            try:
-                return await self.service.set_data(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    key=key,
-                    value=value,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-            except RuntimeError:
-                reseeded = await self._reseed_db_record(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-                if reseeded:
-                    return await self.service.set_data(
-                        chat_id=chat_id,
-                        user_id=user_id,
-                        key=key,
-                        value=value,
-                        business_connection_id=business_connection_id,
-                        message_thread_id=message_thread_id,
-                        bot_id=bot_id,
-                    )
-                raise
-            except PlatformSchemaUnavailable as exc:
-                self._log_fallback(exc)
-                return True
+        storage_key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        async with self.locks(storage_key):
+            return await self.cache.set_data(storage_key, address, key, value)
 
     async def get_data(
         self,
@@ -223,28 +107,8 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ) -> dict:
-        try:
-            db_data = await self.service.get_data(
-                chat_id=chat_id,
-                user_id=user_id,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-        except PlatformSchemaUnavailable as exc:
-            self._log_fallback(exc)
-            db_data = {}
-
-        if db_data:
-            return db_data
-
-        return await self.memory.get_data(
-            chat_id=chat_id,
-            user_id=user_id,
-            business_connection_id=business_connection_id,
-            message_thread_id=message_thread_id,
-            bot_id=bot_id,
-        )
+        key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        return await self.cache.get_data(key, address)
 
     async def reset_data(
         self,
@@ -254,26 +118,9 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ) -> bool:
-        async with self.lock:
-            memory_reset = await self.memory.reset_data(
-                chat_id=chat_id,
-                user_id=user_id,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-            try:
-                db_reset = await self.service.reset_data(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-                return db_reset or memory_reset
-            except PlatformSchemaUnavailable as exc:
-                self._log_fallback(exc)
-                return memory_reset
+        key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        async with self.locks(key):
+            return await self.cache.reset_data(key, address)
 
     def get_interactive_data(
         self,
@@ -301,43 +148,6 @@ class DbStateStorage(StateStorageBase):
         message_thread_id=None,
         bot_id=None,
     ) -> bool:
-        async with self.lock:
-            await self.memory.save(
-                chat_id=chat_id,
-                user_id=user_id,
-                data=data,
-                business_connection_id=business_connection_id,
-                message_thread_id=message_thread_id,
-                bot_id=bot_id,
-            )
-            try:
-                saved = await self.service.save(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    data=data,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-                if saved:
-                    return True
-                reseeded = await self._reseed_db_record(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    business_connection_id=business_connection_id,
-                    message_thread_id=message_thread_id,
-                    bot_id=bot_id,
-                )
-                if reseeded:
-                    return await self.service.save(
-                        chat_id=chat_id,
-                        user_id=user_id,
-                        data=data,
-                        business_connection_id=business_connection_id,
-                        message_thread_id=message_thread_id,
-                        bot_id=bot_id,
-                    )
-                return False
-            except PlatformSchemaUnavailable as exc:
-                self._log_fallback(exc)
-                return True
+        key, address = self._address(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        async with self.locks(key):
+            return await self.cache.save(key, address, data)
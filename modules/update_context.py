@@ -0,0 +1,158 @@
+# modules/update_context.py
+"""
+Контекст входящего обновления: состояние диалога и нормализованный текст,
+вычисленные один раз до проверки фильтров хендлеров
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from telebot.asyncio_filters import StateFilter
+from telebot.asyncio_handler_backends import BaseMiddleware, State
+from telebot.states import resolve_context
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CONTEXT_ATTR = "update_context"
+
+
+def repair_text_encoding(text: str) -> str:
+    """
+    Попытаться восстановить типичную mojibake-перекодировку (UTF-8 -> latin1/cp1251).
+    """
+    if not text:
+        return ""
+
+    candidates = [text]
+    for src, dst in (("latin1", "utf-8"), ("cp1251", "utf-8")):
+        try:
+            candidates.append(text.encode(src).decode(dst))
+        except UnicodeError:
+            continue
+
+    def cyrillic_score(value: str) -> int:
+        value = value.lower()
+        return sum(1 for ch in value if ("а" <= ch <= "я") or ch == "ё")
+
+    repaired = max(candidates, key=cyrillic_score)
+    if repaired != text:
+        logger.warning("Detected mojibake input: original=%r repaired=%r", text, repaired)
+    return repaired
+
+
+def normalize_user_text(text: str) -> str:
+    repaired = repair_text_encoding((text or "").strip())
+    normalized = " ".join(repaired.split()).lower()
+    return normalized.replace("ё", "е")
+
+
+def _state_name(state) -> str:
+    return state.name if isinstance(state, State) else state
+
+
+@dataclass(slots=True)
+class UpdateContext:
+    """Что фильтрам нужно знать об обновлении"""
+
+    state: Optional[str]
+    text: str = ""
+
+
+def update_context(update) -> Optional[UpdateContext]:
+    return getattr(update, UPDATE_CONTEXT_ATTR, None)
+
+
+def update_text(update) -> str:
+    """Нормализованный текст сообщения (без контекста - считается на месте)"""
+    context = update_context(update)
+    if context is not None:
+        return context.text
+    return normalize_user_text(getattr(update, "text", None) or "")
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """
+    Читает состояние и нормализует текст один раз на обновление.
+
+    Раньше каждый хендлер с state=[...] отдельно спрашивал хранилище,
+    а каждый триггер заново чинил кодировку текста.
+    """
+
+    def __init__(self, bot, update_types=("message", "edited_message", "callback_query")):
+        super().__init__()
+        self.bot = bot
+        self.update_types = list(update_types)
+
+    async def _state(self, update) -> Optional[str]:
+        try:
+            chat_id, user_id, business_connection_id, bot_id, message_thread_id = resolve_context(update, self.bot.bot_id)
+        except AttributeError:
+            # callback от inline-сообщения: чата нет, состояния тоже
+            return None
+        if chat_id is None:
+            chat_id = user_id
+        return await self.bot.current_states.get_state(
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            bot_id=bot_id,
+            message_thread_id=message_thread_id,
+        )
+
+    async def pre_process(self, update, data):
+        state = await self._state(update)
+        text = getattr(update, "text", None)
+        setattr(update, UPDATE_CONTEXT_ATTR, UpdateContext(state, normalize_user_text(text) if text else ""))
+
+    async def post_process(self, update, data, exception):
+        pass
+
+
+class ContextStateFilter(StateFilter):
+    """StateFilter, который берёт состояние из контекста обновления, а не из хранилища"""
+
+    async def check(self, message, text):
+        context = update_context(message)
+        if context is None:
+            return await super().check(message, text)
+
+        user_state = context.state
+        if text == "*":
+            # Как в StateFilter: '*' значит "любое, но установленное" состояние
+            return user_state is not None
+        if isinstance(text, list):
+            return user_state in [_state_name(state) for state in text]
+        return user_state == _state_name(text)
+
+
+class StateDispatcher:
+    """
+    Таблица состояние -> хендлер для текстовых сообщений.
+
+    Вместо десятка хендлеров с state=[...], которые бот проверяет по очереди,
+    регистрируется один: он находит нужную функцию по состоянию за один поиск в словаре.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[..., Awaitable]] = {}
+
+    def handler(self, *states):
+        def decorator(func):
+            for state in states:
+                name = _state_name(state)
+                if name in self._handlers:
+                    raise ValueError(f"State {name} already has a handler")
+                self._handlers[name] = func
+            return func
+        return decorator
+
+    def matches(self, message) -> bool:
+        context = update_context(message)
+        return context is not None and context.state in self._handlers
+
+    async def dispatch(self, message):
+        return await self._handlers[update_context(message).state](message)
+
+    def register(self, bot, **filters):
+        bot.register_message_handler(self.dispatch, func=self.matches, **filters)
@@ -0,0 +1,103 @@
+# modules/update_middleware.py
+"""
+Middleware бота: отсев повторных доставок и одна единица работы с БД
+на каждое входящее обновление
+"""
+
+import logging
+
+from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+from telebot.types import CallbackQuery
+
+from services.idempotency import IdempotencyCache
+from services.unit_of_work import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+UNIT_OF_WORK_KEY = "unit_of_work"
+# Повторное нажатие той же кнопки в течение этого окна считается двойным
+DOUBLE_TAP_SECONDS = 2.0
+
+
+def delivery_key(update):
+    """Ключ доставки: id callback'а или (чат, id сообщения)"""
+    if isinstance(update, CallbackQuery):
+        return "callback_query", update.id
+    chat = getattr(update, "chat", None)
+    message_id = getattr(update, "message_id", None)
+    if chat is None or message_id is None:
+        return None
+    return "message", chat.id, message_id
+
+
+def tap_key(call):
+    """
+    Ключ нажатия: (чат, сообщение, кнопка).
+
+    Telegram выдаёт новый id на каждое нажатие, поэтому двойное нажатие
+    по delivery_key не отличить от двух разных callback'ов.
+    """
+    message = call.message
+    if message is None or getattr(message, "chat", None) is None:
+        return None
+    return message.chat.id, message.message_id, call.data
+
+
+class DuplicateUpdateMiddleware(BaseMiddleware):
+    """
+    Отбрасывает повторную доставку того же сообщения или callback'а,
+    а также повторное нажатие той же кнопки в течение DOUBLE_TAP_SECONDS.
+
+    Ставится первым: отменённое обновление не доходит ни до чтения
+    состояния, ни до UnitOfWork. Двойное нажатие, растянутое дольше окна,
+    дальше ловит registration_flight в main.py.
+    """
+
+    def __init__(self, bot, cache=None, taps=None, update_types=("message", "callback_query")):
+        super().__init__()
+        self.bot = bot
+        self.cache = cache if cache is not None else IdempotencyCache()
+        self.taps = taps if taps is not None else IdempotencyCache(ttl=DOUBLE_TAP_SECONDS)
+        self.update_types = list(update_types)
+
+    async def pre_process(self, update, data):
+        key = delivery_key(update)
+        duplicate = key is not None and self.cache.seen(key)
+        if isinstance(update, CallbackQuery):
+            key = tap_key(update)
+            if key is not None and self.taps.seen(key):
+                duplicate = True
+                await self._answer(update)
+        if duplicate:
+            return CancelUpdate()
+
+    async def _answer(self, call):
+        # Иначе у пользователя крутятся часики на кнопке
+        try:
+            await self.bot.answer_callback_query(call.id)
+        except Exception:
+            logger.debug("Failed to answer duplicate callback %s", call.id, exc_info=True)
+
+    async def post_process(self, update, data, exception):
+        pass
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """
+    Открывает UnitOfWork до хендлера и закрывает после.
+
+    Хелперы из functions.py находят её через contextvar: все чтения идут
+    через одну сессию, отложенные записи коммитятся одним разом в конце.
+    """
+
+    def __init__(self, update_types=("message", "edited_message", "callback_query", "my_chat_member")):
+        super().__init__()
+        self.update_types = list(update_types)
+
+    async def pre_process(self, message, data):
+        data[UNIT_OF_WORK_KEY] = UnitOfWork().enter()
+
+    async def post_process(self, message, data, exception):
+        unit = data.get(UNIT_OF_WORK_KEY)
+        if unit is not None:
+            await unit.exit(exception)
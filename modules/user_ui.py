@@ -6,12 +6,12 @@
 from typing import Tuple, List, Optional, Dict, Any
 from datetime import datetime
 from telebot.async_telebot import types
-from db import SessionLocal
-from models import User, Company, User_volunteer
-from sqlalchemy import select, func
+from services.company_catalog import company_catalog
+from services.read_models import load_user_profile
 
 # Константы
 ITEMS_PER_PAGE = 5  # Компаний на странице при выборе
+REGISTRATION_KEYBOARD = "telegram_registration"  # Имя предрендеренной клавиатуры в каталоге
 
 # Шаги регистрации
 REGISTRATION_STEPS = {
@@ -301,37 +301,25 @@ async def get_user_profile_data(user_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Словарь с данными или None
     """
-    async with SessionLocal() as session:
-        user = await session.get(User, user_id)
-
-        if not user:
-            return None
-
-        company_name = None
-        if user.company_id:
-            company = await session.get(Company, user.company_id)
-            if company:
-                company_name = company.name
-
-        volunteer_name = None
-        if user.volunteer_id:
-            volunteer = await session.get(User_volunteer, user.volunteer_id)
-            if volunteer:
-                volunteer_name = volunteer.name or f"#{volunteer.id}"
-
-        return {
-            'id': user.id,
-            'last_name': user.last_name,
-            'first_name': user.first_name,
-            'father_name': user.father_name,
-            'date_of_birth': user.date_of_birth,
-            'phone_number': user.phone_number,
-            'address': user.address,
-            'company_name': company_name,
-            'registered_at': user.registered_at,
-            'status': user.status,
-            'volunteer_name': volunteer_name,
-        }
+    # Пользователь, предприятие и волонтёр - одним запросом
+    user = await load_user_profile(user_id)
+
+    if not user:
+        return None
+
+    return {
+        'id': user.id,
+        'last_name': user.last_name,
+        'first_name': user.first_name,
+        'father_name': user.father_name,
+        'date_of_birth': user.date_of_birth,
+        'phone_number': user.phone_number,
+        'address': user.address,
+        'company_name': user.company_name,
+        'registered_at': user.registered_at,
+        'status': user.status,
+        'volunteer_name': user.volunteer_name,
+    }
 
 
 async def get_companies_for_selection(page: int = 0) -> Tuple[List[Dict], int]:
@@ -344,24 +332,7 @@ async def get_companies_for_selection(page: int = 0) -> Tuple[List[Dict], int]:
     Returns:
         Tuple[список предприятий, общее количество страниц]
     """
-    async with SessionLocal() as session:
-        # Считаем общее количество
-        count_stmt = select(func.count(Company.id))
-        total_count = await session.scalar(count_stmt)
-        total_pages = (total_count + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE if total_count > 0 else 1
-
-        # Получаем страницу
-        stmt = (
-            select(Company)
-            .order_by(Company.name.asc())
-            .offset(page * ITEMS_PER_PAGE)
-            .limit(ITEMS_PER_PAGE)
-        )
-
-        result = await session.execute(stmt)
-        companies = result.scalars().all()
-
-        return [{'id': c.id, 'name': c.name} for c in companies], total_pages
+    return await company_catalog.page(page, ITEMS_PER_PAGE)
 
 
 def build_company_selection_keyboard(
@@ -416,6 +387,14 @@ def build_company_selection_keyboard(
     return markup
 
 
+def _render_company_selection_page(companies: List[Dict], page: int, total_pages: int) -> str:
+    """Готовый JSON клавиатуры выбора предприятия (кэшируется каталогом)"""
+    return build_company_selection_keyboard(companies, page, total_pages).to_json()
+
+
+company_catalog.register_renderer(REGISTRATION_KEYBOARD, ITEMS_PER_PAGE, _render_company_selection_page)
+
+
 async def show_company_selection(
     bot,
     chat_id: int,
@@ -431,13 +410,16 @@ async def show_company_selection(
         page: Страница
         message_id: ID сообщения для редактирования
     """
-    companies, total_pages = await get_companies_for_selection(page)
-
     # Заголовок с прогрессом
     header = format_registration_header(7, "Выбор предприятия")
     text = header + "\nВыберите ваше предприятие из списка:"
 
-    markup = build_company_selection_keyboard(companies, page, total_pages)
+    rendered = await company_catalog.rendered_page(REGISTRATION_KEYBOARD, page)
+    if rendered is not None:
+        markup, _ = rendered
+    else:
+        companies, total_pages = await get_companies_for_selection(page)
+        markup = build_company_selection_keyboard(companies, page, total_pages)
 
     if message_id:
         try:
@@ -11,7 +11,7 @@ DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
 
 # База данных (используем существующую БД бота)
-DATABASE_URL = f"sqlite+aiosqlite:///{PROJECT_ROOT}/app.db"
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{PROJECT_ROOT}/app.db")
 
 # Безопасность
 SECRET_KEY = os.getenv("REGISTRY_SECRET_KEY", "your-secret-key-change-in-production")
@@ -40,3 +40,6 @@ MAX_DEBUG_LOG_PAYLOADS = os.getenv("MAX_DEBUG_LOG_PAYLOADS", "false").strip().lo
     "yes",
     "on",
 }
+# Обработка апдейтов в фоне: воркеры и предел очереди (при переполнении webhook отвечает 503)
+MAX_UPDATE_WORKERS = int(os.getenv("MAX_UPDATE_WORKERS", "8"))
+MAX_UPDATE_QUEUE_SIZE = int(os.getenv("MAX_UPDATE_QUEUE_SIZE", "1000"))
@@ -17,7 +17,7 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
 from sqlalchemy import select, func, update, delete
-from db import SessionLocal
+from db import SQLITE_MAINTENANCE_SECONDS, ReadSessionLocal, sqlite_maintenance
 from models import User, Company, User_volunteer
 from auth import create_access_token, verify_password, get_current_user
 from config import (
@@ -28,12 +28,54 @@ from config import (
     MAX_BOT_TOKEN,
     MAX_WEBHOOK_SECRET,
     MAX_DEBUG_LOG_PAYLOADS,
+    MAX_UPDATE_QUEUE_SIZE,
+    MAX_UPDATE_WORKERS,
 )
-from max_bot import MaxBotService, MaxClient
+from max_bot import MaxBotService, MaxClient, update_order_key
+from max_dispatcher import MaxUpdateDispatcher
+from services.background import background
+from services.data_revision import install_revision_tracking
+from services.event_rollup import (
+    DAY,
+    DIMENSION_ALL,
+    DIMENSIONS,
+    EVENT_REGISTERED,
+    EVENTS,
+    GRANULARITIES,
+    HOUR,
+    HOURLY_RETENTION_DAYS,
+    ROLLUP_PRUNE_SECONDS,
+    event_rollups,
+)
+from services.export_jobs import ExportJob, export_jobs
+from services.http_client import http_client
+from services.identity_cache import (
+    IDENTITY_REVISION_POLL_SECONDS,
+    LAST_SEEN_FLUSH_SECONDS,
+    USER,
+    VOLUNTEER,
+    identity_cache,
+    last_seen_updater,
+)
+from services.pagination import count_cache, fetch_keyset_page, last_page_cursor
+from services.read_models import UserRow, to_user_rows, user_row_query
+from services.platform import PlatformSchemaUnavailable
+from services.role_index import ROLE_INDEX_POLL_SECONDS, role_index
+from services.roster_index import ROSTER_REFRESH_SECONDS, roster_index
+from services.search_index import normalize_query, search_index
+from services.sms_gateway import SMS_STATUS_POLL_SECONDS, sms_gateway
+from services.stats import STATS_REBUILD_SECONDS, registry_stats
+from services.write_coordinator import write_coordinator
 
 app = FastAPI(title="Registry Dashboard API")
 logger = logging.getLogger(__name__)
 max_bot_service = MaxBotService(MaxClient(token=MAX_BOT_TOKEN, base_url=MAX_API_BASE_URL))
+max_updates = MaxUpdateDispatcher(
+    max_bot_service.handle_update,
+    update_order_key,
+    workers=MAX_UPDATE_WORKERS,
+    max_pending=MAX_UPDATE_QUEUE_SIZE,
+)
 
 # CORS
 app.add_middleware(
@@ -61,6 +103,42 @@ class UserUpdate(BaseModel):
     status: Optional[str] = None
 
 
+@app.on_event("startup")
+async def startup():
+    if await install_revision_tracking():
+        identity_cache.install_tracking()
+    await roster_index.load()
+    await registry_stats.start()
+    background.add_periodic("stats_rebuild", STATS_REBUILD_SECONDS, registry_stats.rebuild)
+    if await event_rollups.start():
+        background.add_periodic("event_rollup_prune", ROLLUP_PRUNE_SECONDS, event_rollups.prune)
+    background.add_periodic("roster_index", ROSTER_REFRESH_SECONDS, roster_index.load)
+    background.add_periodic("last_seen", LAST_SEEN_FLUSH_SECONDS, last_seen_updater.flush)
+    background.add_periodic("identity_revision", IDENTITY_REVISION_POLL_SECONDS, identity_cache.sync_revision)
+    background.add_periodic("sqlite_maintenance", SQLITE_MAINTENANCE_SECONDS, sqlite_maintenance)
+    background.add_periodic("sms_status", SMS_STATUS_POLL_SECONDS, sms_gateway.poll_statuses)
+    # Первым: необработанные апдейты MAX ещё пишут в БД и трогают last_seen
+    background.on_shutdown("max_updates", max_updates.stop)
+    background.on_shutdown("last_seen", last_seen_updater.flush)
+    background.on_shutdown("export_jobs", export_jobs.shutdown)
+    background.on_shutdown("http_client", http_client.close)
+    # Последним: хуки выше ещё могут ставить записи в очередь
+    background.on_shutdown("write_coordinator", write_coordinator.stop)
+    write_coordinator.start()
+    max_updates.start()
+    try:
+        await role_index.load()
+        background.add_periodic("role_index", ROLE_INDEX_POLL_SECONDS, role_index.refresh)
+    except PlatformSchemaUnavailable:
+        logger.warning("Role index unavailable, /admins falls back to vars.admin_ids")
+    background.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await background.stop()
+
+
 def _extract_max_update_type(payload: dict[str, Any]) -> str:
     for key in ("update_type", "type", "event_type"):
         value = payload.get(key)
@@ -81,164 +159,147 @@ async def login(request: LoginRequest):
 
 # ===== СТАТИСТИКА =====
 
-@app.get(f"{API_PREFIX}/stats")
-async def get_stats(current_user: dict = Depends(get_current_user)):
-    """Получить статистику"""
-    async with SessionLocal() as session:
-        now = datetime.utcnow()
-
-        # Общее количество
-        total_stmt = select(func.count(User.id))
-        total = (await session.execute(total_stmt)).scalar()
-
-        # По статусам
-        registered_stmt = select(func.count(User.id)).where(User.status == 'registered')
-        registered = (await session.execute(registered_stmt)).scalar()
-
-        # За сегодня
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_stmt = select(func.count(User.id)).where(
-            User.status == 'registered',
-            User.registered_at >= today_start
-        )
-        today = (await session.execute(today_stmt)).scalar()
-
-        # За неделю
-        week_start = now - timedelta(days=7)
-        week_stmt = select(func.count(User.id)).where(
-            User.status == 'registered',
-            User.registered_at >= week_start
-        )
-        week = (await session.execute(week_stmt)).scalar()
-
-        # За месяц
-        month_start = now - timedelta(days=30)
-        month_stmt = select(func.count(User.id)).where(
-            User.status == 'registered',
-            User.registered_at >= month_start
-        )
-        month = (await session.execute(month_stmt)).scalar()
-
-        # Компании
-        companies_stmt = select(func.count(Company.id))
-        companies = (await session.execute(companies_stmt)).scalar()
-
-        # Волонтеры
-        volunteers_stmt = select(func.count(User_volunteer.id))
-        volunteers = (await session.execute(volunteers_stmt)).scalar()
-
-        return {
-            "total": total,
-            "registered": registered,
-            "today": today,
-            "week": week,
-            "month": month,
-            "companies": companies,
-            "volunteers": volunteers
-        }
-
+@app.get(f"{API_PREFIX}/stats")
+async def get_stats(current_user: dict = Depends(get_current_user)):
+    """Получить статистику"""
+    stats = await registry_stats.snapshot()
+    windows = await registry_stats.registration_windows()
+
+    return {
+        "total": stats.users,
+        "registered": stats.status("registered"),
+        "today": windows.today,
+        "week": windows.last_7d,
+        "month": windows.last_30d,
+        "companies": stats.companies,
+        "volunteers": stats.volunteers
+    }
+
+
+@app.get(f"{API_PREFIX}/stats/timeseries")
+async def get_stats_timeseries(
+    event: str = EVENT_REGISTERED,
+    granularity: str = DAY,
+    dimension: str = DIMENSION_ALL,
+    value: Optional[str] = None,
+    days: int = 30,
+    current_user: dict = Depends(get_current_user)
+):
+    """Временной ряд событий (регистрации, блокировки, удаления) из почасовых / посуточных агрегатов"""
+    if event not in EVENTS:
+        raise HTTPException(status_code=400, detail=f"event must be one of: {', '.join(EVENTS)}")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of: {', '.join(DIMENSIONS)}")
+    max_days = HOURLY_RETENTION_DAYS if granularity == HOUR else 3660
+    if not 1 <= days <= max_days:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {max_days}")
+
+    since = datetime.utcnow() - timedelta(days=days)
+    series = await event_rollups.series(event, granularity, dimension, since=since, value=value)
+
+    return {
+        "event": event,
+        "granularity": granularity,
+        "dimension": dimension,
+        "since": since.isoformat(),
+        "series": [
+            {
+                "value": series_value,
+                "points": [{"t": bucket.isoformat(), "count": count} for bucket, count in points]
+            }
+            for series_value, points in series.items()
+        ]
+    }
+
 # ===== ПОЛЬЗОВАТЕЛИ =====
 
+def _user_row_json(user: UserRow) -> dict:
+    return {
+        "id": user.id,
+        "last_name": user.last_name,
+        "first_name": user.first_name,
+        "father_name": user.father_name,
+        "phone_number": user.phone_number,
+        "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else None,
+        "address": user.address,
+        "status": user.status,
+        "company_id": user.company_id,
+        "company_name": user.company_name,
+        "registered_at": user.registered_at.isoformat() if user.registered_at else None,
+        "tg_id": user.tg_id
+    }
+
 @app.get(f"{API_PREFIX}/users")
 async def get_users(
     page: int = 0,
     limit: int = 20,
     status: Optional[str] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Получить список пользователей с пагинацией"""
-    async with SessionLocal() as session:
-        # Базовый запрос
-        base_query = select(User).join(Company, User.company_id == Company.id, isouter=True)
-        count_query = select(func.count(User.id))
-
-        # Фильтры
-        if status:
-            base_query = base_query.where(User.status == status)
-            count_query = count_query.where(User.status == status)
-
+    """Получить список пользователей с пагинацией
+
+    Страницы листаются по курсорам (next_cursor / prev_cursor / last_cursor из ответа);
+    page без cursor оставлен для старых клиентов и работает через OFFSET.
+    """
+    limit = max(1, limit)
+    # Только нужные колонки и название компании одним JOIN, без загрузки ORM-объектов
+    base_query = user_row_query()
+    if status:
+        base_query = base_query.where(User.status == status)
+
+    async with ReadSessionLocal() as session:
         if search:
-            search_filter = f"%{search}%"
-            base_query = base_query.where(
-                (User.last_name.ilike(search_filter)) |
-                (User.first_name.ilike(search_filter)) |
-                (User.phone_number.ilike(search_filter))
-            )
-            count_query = count_query.where(
-                (User.last_name.ilike(search_filter)) |
-                (User.first_name.ilike(search_filter)) |
-                (User.phone_number.ilike(search_filter))
+            search_filter = await search_index.user_condition(search)
+            base_query = base_query.where(search_filter)
+
+            async def count_matches() -> int:
+                return await session.scalar(
+                    select(func.count(User.id)).where(search_filter, *([User.status == status] if status else []))
+                )
+
+            cache_key = ("dashboard_user_search", status, normalize_query(" ".join(search.split())))
+            total = await count_cache.get(cache_key, count_matches)
+        else:
+            # Без поиска общее количество берётся из счётчиков статистики
+            stats = await registry_stats.snapshot()
+            total = stats.status(status) if status else stats.users
+
+        if cursor is None and page > 0:
+            result = await session.execute(base_query.order_by(User.id.desc()).offset(page * limit).limit(limit))
+            rows = result.all()
+            next_cursor = prev_cursor = None
+        else:
+            keyset = await fetch_keyset_page(
+                session, base_query, (User.id,), cursor, limit, descending=True, total=total
             )
-
-        # Общее количество
-        total = (await session.execute(count_query)).scalar()
-
-        # Пользователи с пагинацией
-        stmt = base_query.order_by(User.id.desc()).offset(page * limit).limit(limit)
-        result = await session.execute(stmt)
-        users = result.scalars().all()
-
-        # Получаем компании для пользователей
-        users_data = []
-        for user in users:
-            company_name = None
-            if user.company_id:
-                company = await session.get(Company, user.company_id)
-                if company:
-                    company_name = company.name
-
-            users_data.append({
-                "id": user.id,
-                "last_name": user.last_name,
-                "first_name": user.first_name,
-                "father_name": user.father_name,
-                "phone_number": user.phone_number,
-                "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else None,
-                "address": user.address,
-                "status": user.status,
-                "company_id": user.company_id,
-                "company_name": company_name,
-                "registered_at": user.registered_at.isoformat() if user.registered_at else None,
-                "tg_id": user.tg_id
-            })
-
-        return {
-            "users": users_data,
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "pages": (total + limit - 1) // limit
-        }
+            rows = keyset.rows
+            page = keyset.page
+            next_cursor, prev_cursor = keyset.next_cursor, keyset.prev_cursor
+
+    return {
+        "users": [_user_row_json(user) for user in to_user_rows(rows)],
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": (total + limit - 1) // limit,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "last_cursor": last_page_cursor(total, limit),
+    }
 
 @app.get(f"{API_PREFIX}/users/{{user_id}}")
 async def get_user(user_id: int, current_user: dict = Depends(get_current_user)):
     """Получить пользователя по ID"""
-    async with SessionLocal() as session:
-        user = await session.get(User, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    async with ReadSessionLocal() as session:
+        row = (await session.execute(user_row_query().where(User.id == user_id))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-        company_name = None
-        if user.company_id:
-            company = await session.get(Company, user.company_id)
-            if company:
-                company_name = company.name
-
-        return {
-            "id": user.id,
-            "last_name": user.last_name,
-            "first_name": user.first_name,
-            "father_name": user.father_name,
-            "phone_number": user.phone_number,
-            "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else None,
-            "address": user.address,
-            "status": user.status,
-            "company_id": user.company_id,
-            "company_name": company_name,
-            "registered_at": user.registered_at.isoformat() if user.registered_at else None,
-            "tg_id": user.tg_id
-        }
+    return _user_row_json(UserRow(*row))
 
 @app.patch(f"{API_PREFIX}/users/{{user_id}}")
 async def update_user(
@@ -247,7 +308,7 @@ async def update_user(
     current_user: dict = Depends(get_current_user)
 ):
     """Обновить пользователя"""
-    async with SessionLocal() as session:
+    async def write(session):
         user = await session.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -260,29 +321,35 @@ async def update_user(
 
         if update_data.status is not None:
             user.status = update_data.status
+        return user.status
 
-        await session.commit()
-        return {"success": True}
+    # Через единственного писателя: иначе коммит дашборда ловит "database is locked"
+    status = await write_coordinator.submit(write)
+    roster_index.set_status(user_id, status)
+    return {"success": True}
 
 @app.delete(f"{API_PREFIX}/users/{{user_id}}")
 async def delete_user(user_id: int, current_user: dict = Depends(get_current_user)):
     """Удалить пользователя (установить статус deleted)"""
-    async with SessionLocal() as session:
+    async def write(session):
         user = await session.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         user.status = 'deleted'
         user.company_id = None
-        await session.commit()
-        return {"success": True}
+
+    await write_coordinator.submit(write)
+    roster_index.set_status(user_id, 'deleted')
+    identity_cache.invalidate_target(USER, user_id)
+    return {"success": True}
 
 # ===== КОМПАНИИ =====
 
 @app.get(f"{API_PREFIX}/companies")
 async def get_companies(current_user: dict = Depends(get_current_user)):
     """Получить список компаний со статистикой"""
-    async with SessionLocal() as session:
+    async with ReadSessionLocal() as session:
         stmt = (
             select(
                 Company.id,
@@ -312,7 +379,7 @@ async def get_companies(current_user: dict = Depends(get_current_user)):
 @app.get(f"{API_PREFIX}/volunteers")
 async def get_volunteers(current_user: dict = Depends(get_current_user)):
     """Получить список волонтеров"""
-    async with SessionLocal() as session:
+    async with ReadSessionLocal() as session:
         stmt = select(User_volunteer).order_by(User_volunteer.id.desc())
         result = await session.execute(stmt)
         volunteers = result.scalars().all()
@@ -337,26 +404,29 @@ async def update_volunteer(
     current_user: dict = Depends(get_current_user)
 ):
     """Обновить имя волонтера"""
-    async with SessionLocal() as session:
+    async def write(session):
         volunteer = await session.get(User_volunteer, volunteer_id)
         if not volunteer:
             raise HTTPException(status_code=404, detail="Volunteer not found")
 
         volunteer.name = update_data.name
-        await session.commit()
-        return {"success": True}
+
+    await write_coordinator.submit(write)
+    return {"success": True}
 
 @app.delete(f"{API_PREFIX}/volunteers/{{volunteer_id}}")
 async def delete_volunteer(volunteer_id: int, current_user: dict = Depends(get_current_user)):
     """Удалить волонтера"""
-    async with SessionLocal() as session:
+    async def write(session):
         volunteer = await session.get(User_volunteer, volunteer_id)
         if not volunteer:
             raise HTTPException(status_code=404, detail="Volunteer not found")
 
         await session.delete(volunteer)
-        await session.commit()
-        return {"success": True}
+
+    await write_coordinator.submit(write)
+    identity_cache.invalidate_target(VOLUNTEER, volunteer_id)
+    return {"success": True}
 
 # ===== АДМИНИСТРАТОРЫ =====
 
@@ -364,6 +434,8 @@ async def delete_volunteer(volunteer_id: int, current_user: dict = Depends(get_c
 async def get_admins(current_user: dict = Depends(get_current_user)):
     """Получить список администраторов бота"""
     from vars import admin_ids
+    if role_index.loaded:
+        admin_ids = sorted(int(admin_id) for admin_id in role_index.members("admin"))
     from telebot import async_telebot
     import os
 
@@ -375,7 +447,7 @@ async def get_admins(current_user: dict = Depends(get_current_user)):
     bot = async_telebot.AsyncTeleBot(bot_token)
 
     admins_data = []
-    async with SessionLocal() as session:
+    async with ReadSessionLocal() as session:
         for admin_id in admin_ids:
             admin_info = {
                 "tg_id": admin_id,
@@ -406,15 +478,46 @@ async def get_admins(current_user: dict = Depends(get_current_user)):
 
 # ===== ЭКСПОРТ =====
 
-@app.get(f"{API_PREFIX}/export/excel")
+@app.get(f"{API_PREFIX}/export/excel")
 async def export_excel(current_user: dict = Depends(get_current_user)):
-    """Экспортировать все данные в Excel"""
-    from functions import generate_excel
+    """Экспортировать все данные в Excel (дождаться фоновой выгрузки)"""
+    job = await export_jobs.submit()
+    await export_jobs.wait(job)
+    return _export_file_response(job)
 
-    await generate_excel()
-
-    return FileResponse(
-        path="excel_dump.xlsx",
+
+@app.post(f"{API_PREFIX}/export/jobs")
+async def start_export_job(current_user: dict = Depends(get_current_user)):
+    """Запустить выгрузку или получить уже идущую / готовую"""
+    job = await export_jobs.submit()
+    return job.to_dict()
+
+
+@app.get(f"{API_PREFIX}/export/jobs/{{job_id}}")
+async def get_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Статус и прогресс выгрузки"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена")
+    return job.to_dict()
+
+
+@app.get(f"{API_PREFIX}/export/jobs/{{job_id}}/file")
+async def download_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Скачать готовый файл выгрузки"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail="Выгрузка ещё не завершена")
+    return _export_file_response(job)
+
+
+def _export_file_response(job: ExportJob) -> FileResponse:
+    if job.status != "done":
+        raise HTTPException(status_code=500, detail=job.error or "Не удалось сформировать выгрузку")
+    return FileResponse(
+        path=job.path,
         filename="registry_export.xlsx",
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -428,6 +531,9 @@ async def max_health():
         "status": "ok",
         "service": "registry-max-webhook",
         "bot_configured": bool(MAX_BOT_TOKEN),
+        "queue": max_updates.stats(),
+        "sms": sms_gateway.stats(),
+        "deliveries": max_bot_service.deliveries.stats(),
     }
 
 
@@ -464,16 +570,19 @@ async def max_webhook(
         logger.error("MAX webhook received update, but MAX_BOT_TOKEN is not configured")
         raise HTTPException(status_code=500, detail="MAX_BOT_TOKEN is not configured")
 
-    try:
-        result = await max_bot_service.handle_update(payload)
-    except Exception as exc:
-        logger.exception("MAX webhook processing failed for update_type=%s", update_type)
-        raise HTTPException(status_code=500, detail="MAX webhook processing failed") from exc
+    # Отвечаем сразу: SMS и запросы к MAX API не должны задерживать ответ webhook
+    if not max_updates.submit(payload):
+        logger.warning(
+            "MAX update queue is full (%s pending), rejecting update_type=%s",
+            max_updates.pending,
+            update_type,
+        )
+        raise HTTPException(status_code=503, detail="MAX update queue is full")
 
     return {
         "ok": True,
         "update_type": update_type,
-        "result": result,
+        "queued": True,
     }
 
 # ===== HEALTHCHECK =====
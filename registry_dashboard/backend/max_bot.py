@@ -8,28 +8,30 @@ import re
 from dataclasses import dataclass
 from datetime import datetime
 from math import ceil
-from random import randint
 from typing import Any
-from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
-from sqlalchemy import func, select
+import aiohttp
+from sqlalchemy import select
 
-from db import SessionLocal
 from models import Company, User, User_volunteer
+from services.company_catalog import CatalogCompany, company_catalog
 from services.conversation_state_service import ConversationStateService
+from services.http_client import http_client
 from services.platform import IdentityService, PlatformSchemaUnavailable
+from services.read_models import load_user_profile
+from services.identity_cache import MISSING, USER, identity_cache, last_seen_updater
+from services.idempotency import IdempotencyCache, SingleFlight
+from services.roster_index import RosterEntry, roster_index
+from services.sms_gateway import sms_gateway
+from services.unit_of_work import read_session, submit_write, unit_of_work
 
 logger = logging.getLogger(__name__)
 
 MAX_PROVIDER = "max"
 MAX_API_BASE_URL = "https://platform-api.max.ru"
-SMS_API_URL = "https://smsc.ru/sys/send.php"
-SMS_LOGIN = "lgjt"
-SMS_PASSWORD = "123456"
-SMS_SENDER = "kotelnikiru"
+MAX_API_TIMEOUT = aiohttp.ClientTimeout(total=20, connect=5, sock_read=15)
 COMPANIES_PER_PAGE = 5
+MAX_COMPANY_PAGES = "max_registration"
 
 
 class MaxState:
@@ -151,24 +153,9 @@ class MaxClient:
     ) -> dict[str, Any]:
         if not self.token:
             raise MaxApiError("MAX_BOT_TOKEN is empty")
-        return await asyncio.to_thread(
-            self._request_sync,
-            method,
-            path,
-            query or {},
-            body,
-        )
-
-    def _request_sync(
-        self,
-        method: str,
-        path: str,
-        query: dict[str, Any],
-        body: dict[str, Any] | None,
-    ) -> dict[str, Any]:
         clean_query = {
             key: value
-            for key, value in query.items()
+            for key, value in (query or {}).items()
             if value is not None
         }
         clean_body = None
@@ -179,36 +166,33 @@ class MaxClient:
                 if value is not None
             }
 
-        url = f"{self.base_url}{path}"
-        if clean_query:
-            url = f"{url}?{urlencode(clean_query)}"
-
-        payload = None
         headers = {
             "Authorization": self.token,
             "Accept": "application/json",
         }
-        if clean_body is not None:
-            payload = json.dumps(clean_body).encode("utf-8")
-            headers["Content-Type"] = "application/json"
-
-        request = Request(url=url, data=payload, method=method.upper(), headers=headers)
         try:
-            with urlopen(request, timeout=20) as response:
-                raw = response.read().decode("utf-8")
-        except HTTPError as exc:
-            body_text = exc.read().decode("utf-8", errors="replace")
+            response = await http_client.request(
+                method,
+                f"{self.base_url}{path}",
+                params=clean_query or None,
+                json=clean_body,
+                headers=headers,
+                timeout=MAX_API_TIMEOUT,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logger.error("MAX API network error %s %s: %r", method, path, exc)
+            raise MaxApiError("MAX API network error") from exc
+
+        raw = response.text
+        if not response.ok:
             logger.error(
                 "MAX API error %s %s status=%s body=%s",
                 method,
                 path,
-                exc.code,
-                body_text,
+                response.status,
+                raw,
             )
-            raise MaxApiError(f"MAX API request failed with status {exc.code}") from exc
-        except URLError as exc:
-            logger.error("MAX API network error %s %s: %s", method, path, exc)
-            raise MaxApiError("MAX API network error") from exc
+            raise MaxApiError(f"MAX API request failed with status {response.status}")
 
         if not raw:
             return {}
@@ -225,13 +209,11 @@ class MaxConversationStore:
         self._service = ConversationStateService(provider=MAX_PROVIDER, prefix="max")
 
     async def load(self, chat_id: int, user_id: int) -> tuple[str | None, dict[str, Any]]:
-        state = await self._service.get_state(chat_id=chat_id, user_id=user_id)
-        data = await self._service.get_data(chat_id=chat_id, user_id=user_id)
-        return state, data
+        row = await self._service.load(chat_id=chat_id, user_id=user_id)
+        return row if row is not None else (None, {})
 
     async def save(self, chat_id: int, user_id: int, state: str | None, data: dict[str, Any]) -> None:
-        await self._service.set_state(chat_id=chat_id, user_id=user_id, state=state)
-        await self._service.save(chat_id=chat_id, user_id=user_id, data=data)
+        await self._service.store(chat_id=chat_id, user_id=user_id, state=state, data=data)
 
     async def clear(self, chat_id: int, user_id: int) -> None:
         await self._service.delete_state(chat_id=chat_id, user_id=user_id)
@@ -241,8 +223,19 @@ class MaxBotService:
     def __init__(self, client: MaxClient) -> None:
         self.client = client
         self.store = MaxConversationStore()
+        self.deliveries = IdempotencyCache()
+        self._finalizing = SingleFlight()
 
     async def handle_update(self, payload: dict[str, Any]) -> dict[str, Any]:
+        # MAX redelivers on timeout: a repeat gets the first delivery's result.
+        return await self.deliveries.run(update_delivery_key(payload), lambda: self._handle_once(payload))
+
+    async def _handle_once(self, payload: dict[str, Any]) -> dict[str, Any]:
+        # One read session per update; deferred writes commit once when it is done.
+        async with unit_of_work():
+            return await self._dispatch(payload)
+
+    async def _dispatch(self, payload: dict[str, Any]) -> dict[str, Any]:
         event = parse_event(payload)
         if event is None or event.user is None or event.chat_id is None:
             logger.info("Skipping unsupported MAX update: %s", payload.get("update_type"))
@@ -267,15 +260,15 @@ class MaxBotService:
 
     async def _handle_start(self, event: MaxEvent) -> None:
         await self.store.clear(event.chat_id, event.user.user_id)
-        linked_user = await self._get_linked_user(event.user.user_id)
-        if linked_user:
-            await self._touch_identity(linked_user.id, event.user, event.chat_id)
+        linked_user_id = await self._get_linked_user_id(event.user.user_id)
+        if linked_user_id:
+            self._touch_identity(event.user)
             await self.send_text(
                 event.chat_id,
                 "Здравствуйте! Аккаунт MAX уже привязан к вашему профилю.",
                 attachments=menu_keyboard(),
             )
-            await self.send_profile(event.chat_id, linked_user.id)
+            await self.send_profile(event.chat_id, linked_user_id)
             return
 
         await self.send_text(
@@ -422,8 +415,8 @@ class MaxBotService:
         await self._safe_answer_callback(event.callback_id, notification="Неизвестное действие")
 
     async def _handle_profile_request(self, event: MaxEvent) -> None:
-        linked_user = await self._get_linked_user(event.user.user_id)
-        if not linked_user:
+        linked_user_id = await self._get_linked_user_id(event.user.user_id)
+        if not linked_user_id:
             await self.send_text(
                 event.chat_id,
                 "Профиль MAX пока не привязан. Нажмите «Регистрация», чтобы пройти идентификацию.",
@@ -431,19 +424,20 @@ class MaxBotService:
             )
             return
 
-        await self._touch_identity(linked_user.id, event.user, event.chat_id)
-        await self.send_profile(event.chat_id, linked_user.id)
+        self._touch_identity(event.user)
+        await self.send_profile(event.chat_id, linked_user_id)
 
     async def _start_registration(self, event: MaxEvent) -> None:
-        linked_user = await self._get_linked_user(event.user.user_id)
-        if linked_user and linked_user.status == "registered":
-            await self._touch_identity(linked_user.id, event.user, event.chat_id)
+        linked_user_id = await self._get_linked_user_id(event.user.user_id)
+        linked_entry = await roster_index.get(linked_user_id) if linked_user_id else None
+        if linked_entry and linked_entry.status == "registered":
+            self._touch_identity(event.user)
             await self.send_text(
                 event.chat_id,
                 "Этот аккаунт MAX уже привязан к зарегистрированному профилю.",
                 attachments=menu_keyboard(),
             )
-            await self.send_profile(event.chat_id, linked_user.id)
+            await self.send_profile(event.chat_id, linked_user_id)
             return
 
         data: dict[str, Any] = {
@@ -553,7 +547,8 @@ class MaxBotService:
         next_data["id"] = candidate.id
 
         if candidate.status == "registered":
-            if not candidate.phone_number:
+            phone_number = await self._get_user_phone(candidate.id)
+            if not phone_number:
                 await self.store.clear(event.chat_id, event.user.user_id)
                 await self.send_text(
                     event.chat_id,
@@ -562,7 +557,7 @@ class MaxBotService:
                 )
                 return
 
-            code = await send_sms_code(candidate.phone_number)
+            code = await send_sms_code(phone_number)
             if not code:
                 await self.send_text(
                     event.chat_id,
@@ -571,13 +566,13 @@ class MaxBotService:
                 return
 
             next_data["code"] = code
-            next_data["link_phone_number"] = candidate.phone_number
+            next_data["link_phone_number"] = phone_number
             await self.store.save(event.chat_id, event.user.user_id, MaxState.WAIT_LINK_SMS, next_data)
             await self.send_text(
                 event.chat_id,
                 (
                     "Профиль уже зарегистрирован. Чтобы привязать MAX, отправили код подтверждения "
-                    f"на номер {mask_phone(candidate.phone_number)}.\n\nВведите этот код."
+                    f"на номер {mask_phone(phone_number)}.\n\nВведите этот код."
                 ),
             )
             return
@@ -698,27 +693,19 @@ class MaxBotService:
         page: int,
         edit_message_id: str | None = None,
     ) -> None:
-        companies, total_pages = await self._get_companies_page(page)
-        if not companies:
+        total_pages = max(1, ceil(await company_catalog.count() / COMPANIES_PER_PAGE))
+        page = min(max(page, 0), total_pages - 1)
+        rendered = await company_catalog.rendered_page(MAX_COMPANY_PAGES, page)
+        if rendered is None or rendered[0] is None:
             await self.send_text(event.chat_id, "Список предприятий пуст.")
             return
 
+        (text, attachments), _ = rendered
+
         next_data = dict(data)
         next_data["company_page"] = page
         await self.store.save(event.chat_id, event.user.user_id, MaxState.WAIT_COMPANY, next_data)
 
-        lines = [
-            "Шаг 7 из 7. Выберите предприятие кнопкой ниже или отправьте его ID сообщением.",
-            "",
-            f"Страница {page + 1} из {total_pages}",
-            "",
-        ]
-        for company in companies:
-            lines.append(f"{company['id']} — {html.escape(company['name'])}")
-
-        text = "\n".join(lines)
-        attachments = company_keyboard(companies, page, total_pages)
-
         if edit_message_id:
             try:
                 await self.client.edit_message(
@@ -746,6 +733,13 @@ class MaxBotService:
         await self._finalize_registration(event, data, company_id)
 
     async def _finalize_registration(self, event: MaxEvent, data: dict[str, Any], company_id: int) -> None:
+        # A second company pick while the first is being saved waits for it instead of registering again.
+        await self._finalizing.run(
+            event.user.user_id,
+            lambda: self._finalize_registration_once(event, data, company_id),
+        )
+
+    async def _finalize_registration_once(self, event: MaxEvent, data: dict[str, Any], company_id: int) -> None:
         company = await self._get_company(company_id)
         if company is None:
             await self.send_text(
@@ -851,77 +845,61 @@ class MaxBotService:
         except MaxApiError:
             logger.warning("Failed to answer MAX callback %s", callback_id, exc_info=True)
 
-    async def _get_linked_user(self, max_user_id: int) -> User | None:
-        async with SessionLocal() as session:
+    async def _get_linked_user_id(self, max_user_id: int) -> int | None:
+        cached_user_id = identity_cache.get(USER, MAX_PROVIDER, max_user_id)
+        if cached_user_id is not MISSING:
+            return cached_user_id
+
+        async with read_session() as session:
             try:
-                return await IdentityService.get_user_by_identity(session, MAX_PROVIDER, max_user_id)
+                user = await IdentityService.get_user_by_identity(session, MAX_PROVIDER, max_user_id)
             except PlatformSchemaUnavailable:
                 logger.warning("MAX identity lookup skipped: platform schema is unavailable")
                 return None
 
-    async def _touch_identity(self, user_id: int, max_user: MaxUser, chat_id: int) -> None:
-        try:
-            async with SessionLocal() as session:
-                await IdentityService.link_user_identity(
-                    session=session,
-                    user_id=user_id,
-                    provider=MAX_PROVIDER,
-                    external_user_id=max_user.user_id,
-                    payload=build_identity_payload(max_user, chat_id),
-                )
-                await session.commit()
-        except PlatformSchemaUnavailable:
-            logger.warning("MAX identity touch skipped: platform schema is unavailable")
+        user_id = user.id if user else None
+        identity_cache.set(USER, MAX_PROVIDER, max_user_id, user_id)
+        return user_id
+
+    def _touch_identity(self, max_user: MaxUser) -> None:
+        last_seen_updater.touch(USER, MAX_PROVIDER, max_user.user_id)
 
     async def _link_identity(self, user_id: int, max_user: MaxUser, chat_id: int) -> None:
-        await self._touch_identity(user_id, max_user, chat_id)
+        async def write(session) -> None:
+            await IdentityService.link_user_identity(
+                session=session,
+                user_id=user_id,
+                provider=MAX_PROVIDER,
+                external_user_id=max_user.user_id,
+                payload=build_identity_payload(max_user, chat_id),
+            )
+
+        try:
+            await submit_write(write)
+        except PlatformSchemaUnavailable:
+            logger.warning("MAX identity link skipped: platform schema is unavailable")
+            return
+        identity_cache.invalidate(USER, MAX_PROVIDER, max_user.user_id)
 
     async def _surname_exists(self, surname: str) -> bool:
-        async with SessionLocal() as session:
-            stmt = select(func.count(User.id)).where(User.last_name == surname)
-            return bool((await session.scalar(stmt)) or 0)
+        return await roster_index.surname_exists(surname)
 
-    async def _get_user_by_surname_and_dob(self, surname: str | None, dob) -> User | None:
+    async def _get_user_by_surname_and_dob(self, surname: str | None, dob) -> RosterEntry | None:
         if not surname:
             return None
-        async with SessionLocal() as session:
-            stmt = (
-                select(User)
-                .where(User.last_name == surname)
-                .where(User.date_of_birth == dob)
-            )
-            result = await session.execute(stmt)
-            return result.scalars().first()
+        return await roster_index.find(surname, dob)
+
+    async def _get_user_phone(self, user_id: int) -> str | None:
+        async with read_session() as session:
+            return await session.scalar(select(User.phone_number).where(User.id == user_id))
 
     async def _check_volunteer_exists(self, volunteer_id: int) -> bool:
-        async with SessionLocal() as session:
+        async with read_session() as session:
             volunteer = await session.get(User_volunteer, volunteer_id)
             return volunteer is not None
 
-    async def _get_company(self, company_id: int) -> Company | None:
-        async with SessionLocal() as session:
-            return await session.get(Company, company_id)
-
-    async def _get_companies_page(self, page: int) -> tuple[list[dict[str, Any]], int]:
-        safe_page = max(page, 0)
-        async with SessionLocal() as session:
-            total_count = await session.scalar(select(func.count(Company.id)))
-            total_count = int(total_count or 0)
-            total_pages = max(1, ceil(total_count / COMPANIES_PER_PAGE)) if total_count else 1
-            safe_page = min(safe_page, total_pages - 1)
-
-            stmt = (
-                select(Company)
-                .order_by(Company.name.asc())
-                .offset(safe_page * COMPANIES_PER_PAGE)
-                .limit(COMPANIES_PER_PAGE)
-            )
-            result = await session.execute(stmt)
-            companies = result.scalars().all()
-            return (
-                [{"id": company.id, "name": company.name} for company in companies],
-                total_pages,
-            )
+    async def _get_company(self, company_id: int) -> CatalogCompany | None:
+        return await company_catalog.get(company_id)
 
     async def _register_max_user(
         self,
@@ -932,10 +910,18 @@ class MaxBotService:
         max_user: MaxUser,
         chat_id: int,
     ) -> bool:
-        async with SessionLocal() as session:
-            user = await session.get(User, user_id)
+        current_status = None
+
+        async def write(session) -> bool:
+            nonlocal current_status
+            # Re-read in the write transaction (row lock on PostgreSQL): the roster snapshot
+            # may predate a registration made through the Telegram bot.
+            user = await session.get(User, user_id, with_for_update=True)
             if user is None:
                 return False
+            if user.status in ("registered", "blocked"):
+                current_status = user.status
+                return False
 
             company = await session.get(Company, company_id)
             if company is None:
@@ -965,53 +951,49 @@ class MaxBotService:
                 )
             except PlatformSchemaUnavailable:
                 logger.warning("MAX identity link skipped during registration: schema unavailable")
-
-            await session.commit()
             return True
 
+        if not await submit_write(write):
+            if current_status is not None:
+                logger.warning("User %s is already %s, MAX registration skipped", user_id, current_status)
+                roster_index.set_status(user_id, current_status)
+            return False
+        roster_index.set_status(user_id, "registered")
+        identity_cache.invalidate(USER, MAX_PROVIDER, max_user.user_id)
+        return True
+
     async def _build_profile_text(self, user_id: int) -> str | None:
-        async with SessionLocal() as session:
-            user = await session.get(User, user_id)
-            if user is None:
-                return None
+        user = await load_user_profile(user_id)
+        if user is None:
+            return None
 
-            company_name = "Не назначено"
-            if user.company_id:
-                company = await session.get(Company, user.company_id)
-                if company:
-                    company_name = company.name
-
-            volunteer_name = None
-            if user.volunteer_id:
-                volunteer = await session.get(User_volunteer, user.volunteer_id)
-                if volunteer:
-                    volunteer_name = volunteer.name or f"#{volunteer.id}"
-
-            fio = " ".join(
-                part for part in [user.last_name, user.first_name, user.father_name] if part
-            ).strip() or "Не указано"
-
-            lines = [
-                "<b>Мой профиль</b>",
-                "",
-                f"<b>ID:</b> {user.id}",
-                f"<b>ФИО:</b> {html.escape(fio)}",
-                f"<b>Дата рождения:</b> {html.escape(format_date(user.date_of_birth))}",
-                f"<b>Телефон:</b> {html.escape(format_phone_readable(user.phone_number))}",
-                f"<b>Адрес:</b> {html.escape(user.address or 'Не указан')}",
-                f"<b>Предприятие:</b> {html.escape(company_name)}",
-                f"<b>Статус:</b> {html.escape(user.status or 'Не указан')}",
-            ]
+        company_name = user.company_name if user.company_name is not None else "Не назначено"
 
-            if user.registered_at:
-                lines.append(
-                    f"<b>Дата регистрации:</b> {html.escape(format_datetime(user.registered_at))}"
-                )
+        fio = " ".join(
+            part for part in [user.last_name, user.first_name, user.father_name] if part
+        ).strip() or "Не указано"
+
+        lines = [
+            "<b>Мой профиль</b>",
+            "",
+            f"<b>ID:</b> {user.id}",
+            f"<b>ФИО:</b> {html.escape(fio)}",
+            f"<b>Дата рождения:</b> {html.escape(format_date(user.date_of_birth))}",
+            f"<b>Телефон:</b> {html.escape(format_phone_readable(user.phone_number))}",
+            f"<b>Адрес:</b> {html.escape(user.address or 'Не указан')}",
+            f"<b>Предприятие:</b> {html.escape(company_name)}",
+            f"<b>Статус:</b> {html.escape(user.status or 'Не указан')}",
+        ]
+
+        if user.registered_at:
+            lines.append(
+                f"<b>Дата регистрации:</b> {html.escape(format_datetime(user.registered_at))}"
+            )
 
-            if volunteer_name:
-                lines.append(f"<b>Волонтёр:</b> {html.escape(volunteer_name)}")
+        if user.volunteer_name:
+            lines.append(f"<b>Волонтёр:</b> {html.escape(user.volunteer_name)}")
 
-            return "\n".join(lines)
+        return "\n".join(lines)
 
 
 def parse_event(payload: dict[str, Any]) -> MaxEvent | None:
@@ -1061,6 +1043,32 @@ def parse_event(payload: dict[str, Any]) -> MaxEvent | None:
     return None
 
 
+def update_delivery_key(payload: dict[str, Any]) -> str | None:
+    """Identifies an update across redeliveries; None if it carries nothing stable."""
+    update_type = payload.get("update_type")
+    callback_id = (payload.get("callback") or {}).get("callback_id")
+    if callback_id:
+        return f"{update_type}:{callback_id}"
+    message_id = ((payload.get("message") or {}).get("body") or {}).get("mid")
+    if message_id:
+        return f"{update_type}:{message_id}"
+    timestamp = payload.get("timestamp")
+    if timestamp is None:
+        return None
+    user_id = (payload.get("user") or {}).get("user_id")
+    return f"{update_type}:{payload.get('chat_id')}:{user_id}:{timestamp}"
+
+
+def update_order_key(payload: dict[str, Any]) -> int | None:
+    """Updates with the same key must be handled one after another, in arrival order."""
+    event = parse_event(payload)
+    if event is None:
+        return None
+    if event.chat_id is not None:
+        return event.chat_id
+    return event.user.user_id if event.user is not None else None
+
+
 def build_user(raw: dict[str, Any] | None) -> MaxUser | None:
     if not raw:
         return None
@@ -1243,37 +1251,28 @@ def company_keyboard(
     return inline_keyboard(rows)
 
 
-async def send_sms_code(phone_number: str) -> str | None:
-    code = str(randint(10, 99))
-    message = f"Ваш код для подтверждения: {code}"
+def render_company_page(
+    companies: list[dict[str, Any]],
+    page: int,
+    total_pages: int,
+) -> tuple[str, list[dict[str, Any]]] | None:
+    if not companies:
+        return None
 
-    params = urlencode(
-        {
-            "login": SMS_LOGIN,
-            "psw": SMS_PASSWORD,
-            "phones": phone_number,
-            "mes": message,
-            "sender": SMS_SENDER,
-        }
-    )
-    request = Request(
-        url=f"{SMS_API_URL}?{params}",
-        method="POST",
-    )
+    lines = [
+        "Шаг 7 из 7. Выберите предприятие кнопкой ниже или отправьте его ID сообщением.",
+        "",
+        f"Страница {page + 1} из {total_pages}",
+        "",
+    ]
+    for company in companies:
+        lines.append(f"{company['id']} — {html.escape(company['name'])}")
 
-    try:
-        response_text = await asyncio.to_thread(_read_sms_response, request)
-    except Exception:
-        logger.exception("SMS provider request failed for phone %s", phone_number)
-        return None
+    return "\n".join(lines), company_keyboard(companies, page, total_pages)
 
-    if not response_text:
-        return None
 
-    logger.info("SMS provider response for %s: %s", phone_number, response_text)
-    return code
+company_catalog.register_renderer(MAX_COMPANY_PAGES, COMPANIES_PER_PAGE, render_company_page)
 
 
-def _read_sms_response(request: Request) -> str:
-    with urlopen(request, timeout=15) as response:
-        return response.read().decode("utf-8", errors="replace").strip()
+async def send_sms_code(phone_number: str) -> str | None:
+    return await sms_gateway.send_code(phone_number)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+MAX_UPDATE_WORKERS = 8
+MAX_UPDATE_QUEUE_SIZE = 1000
+MAX_UPDATE_DRAIN_SECONDS = 30.0
+
+UpdateHandler = Callable[[dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass(slots=True)
+class _QueuedUpdate:
+    payload: dict[str, Any]
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MaxUpdateDispatcher:
+    """Processes webhook updates in the background: parallel across chats, in order within one.
+
+    Every chat has its own FIFO. A chat is owned by at most one worker at a time: the
+    worker handles one update, then puts the chat back at the end of the ready queue if
+    more are waiting, so a busy chat cannot starve the others. ``submit`` never waits;
+    once ``max_pending`` updates are queued it refuses, and the webhook answers 503 so
+    MAX redelivers later.
+    """
+
+    def __init__(
+        self,
+        handler: UpdateHandler,
+        order_key: Callable[[dict[str, Any]], Hashable],
+        workers: int = MAX_UPDATE_WORKERS,
+        max_pending: int = MAX_UPDATE_QUEUE_SIZE,
+    ) -> None:
+        self.handler = handler
+        self.order_key = order_key
+        self.workers = workers
+        self.max_pending = max_pending
+        self._chats: dict[Hashable, deque[_QueuedUpdate]] = {}
+        self._ready: asyncio.Queue[Hashable] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._closing = False
+        self.pending = 0
+        self.in_flight = 0
+        self.high_water = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.running and self._loop is loop:
+            return
+        self._loop = loop
+        self._closing = False
+        self._chats.clear()
+        self.pending = 0
+        self._ready = asyncio.Queue()
+        self._tasks = [
+            loop.create_task(self._worker(), name=f"max_updates:{index}")
+            for index in range(self.workers)
+        ]
+
+    def submit(self, payload: dict[str, Any]) -> bool:
+        if self._closing or self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.start()
+        key = self.order_key(payload)
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        # A chat that is already queued or being processed picks this up in turn.
+        chat.append(_QueuedUpdate(payload))
+        self.pending += 1
+        self.accepted += 1
+        self.high_water = max(self.high_water, self.pending)
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        oldest = min((chat[0].enqueued_at for chat in self._chats.values() if chat), default=now)
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "high_water": self.high_water,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "oldest_wait_ms": round((now - oldest) * 1000, 1),
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+    async def stop(self, timeout: float = MAX_UPDATE_DRAIN_SECONDS) -> None:
+        """Stop accepting, finish what is queued (up to ``timeout``), then stop the workers."""
+        if not self._tasks:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("MAX update queue not drained in %.0fs, dropping %s updates", timeout, self.pending)
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _worker(self) -> None:
+        ready = self._ready
+        while True:
+            key = await ready.get()
+            try:
+                chat = self._chats[key]
+                update = chat.popleft()
+                self.pending -= 1
+                self.in_flight += 1
+                self.max_wait = max(self.max_wait, time.monotonic() - update.enqueued_at)
+                try:
+                    await self.handler(update.payload)
+                    self.processed += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.failed += 1
+                    logger.exception("MAX update processing failed for chat %s", key)
+                finally:
+                    self.in_flight -= 1
+                if chat:
+                    ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+            finally:
+                ready.task_done()
@@ -25,8 +25,8 @@ export const getStats = async () => {
   return response.data;
 };
 
-export const getUsers = async (page = 0, limit = 20, status?: string, search?: string) => {
-  const response = await api.get('/users', { params: { page, limit, status, search } });
+export const getUsers = async (cursor?: string, limit = 20, status?: string, search?: string) => {
+  const response = await api.get('/users', { params: { cursor, limit, status, search } });
   return response.data;
 };
 
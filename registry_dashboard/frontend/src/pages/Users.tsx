@@ -5,7 +5,11 @@ export default function Users() {
   const [users, setUsers] = useState<any[]>([]);
   const [companies, setCompanies] = useState<any[]>([]);
   const [total, setTotal] = useState(0);
+  const [cursor, setCursor] = useState<string | undefined>(undefined);
   const [page, setPage] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [prevCursor, setPrevCursor] = useState<string | null>(null);
+  const [lastCursor, setLastCursor] = useState<string | null>(null);
   const [limit] = useState(20);
   const [status, setStatus] = useState('');
   const [search, setSearch] = useState('');
@@ -15,14 +19,18 @@ export default function Users() {
   useEffect(() => {
     loadUsers();
     loadCompanies();
-  }, [page, status, search]);
+  }, [cursor, status, search]);
 
   const loadUsers = async () => {
     setLoading(true);
     try {
-      const data = await getUsers(page, limit, status || undefined, search || undefined);
+      const data = await getUsers(cursor, limit, status || undefined, search || undefined);
       setUsers(data.users);
       setTotal(data.total);
+      setPage(data.page);
+      setNextCursor(data.next_cursor);
+      setPrevCursor(data.prev_cursor);
+      setLastCursor(data.last_cursor);
     } catch (err) {
       console.error('Failed to load users:', err);
     } finally {
@@ -82,7 +90,7 @@ export default function Users() {
     }
   };
 
-  const pages = Math.ceil(total / limit);
+  const pages = Math.max(1, Math.ceil(total / limit), page + 1);
 
   return (
     <div>
@@ -93,7 +101,7 @@ export default function Users() {
         </div>
 
         <div className="filters">
-          <select value={status} onChange={(e) => { setStatus(e.target.value); setPage(0); }}>
+          <select value={status} onChange={(e) => { setStatus(e.target.value); setCursor(undefined); }}>
             <option value="">Все статусы</option>
             <option value="registered">Зарегистрированы</option>
             <option value="not registered">Не зарегистрированы</option>
@@ -105,7 +113,7 @@ export default function Users() {
             type="text"
             placeholder="Поиск по ФИО или телефону..."
             value={search}
-            onChange={(e) => { setSearch(e.target.value); setPage(0); }}
+            onChange={(e) => { setSearch(e.target.value); setCursor(undefined); }}
           />
         </div>
 
@@ -161,19 +169,19 @@ export default function Users() {
             </table>
 
             <div className="pagination">
-              <button onClick={() => setPage(0)} disabled={page === 0}>
+              <button onClick={() => setCursor(undefined)} disabled={page === 0}>
                 ««
               </button>
-              <button onClick={() => setPage(page - 1)} disabled={page === 0}>
+              <button onClick={() => setCursor(prevCursor ?? undefined)} disabled={!prevCursor}>
                 «
               </button>
               <span style={{ padding: '8px 12px' }}>
                 Страница {page + 1} из {pages}
               </span>
-              <button onClick={() => setPage(page + 1)} disabled={page >= pages - 1}>
+              <button onClick={() => setCursor(nextCursor ?? undefined)} disabled={!nextCursor}>
                 »
               </button>
-              <button onClick={() => setPage(pages - 1)} disabled={page >= pages - 1}>
+              <button onClick={() => setCursor(lastCursor ?? undefined)} disabled={!lastCursor || page >= pages - 1}>
                 »»
               </button>
             </div>
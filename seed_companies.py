@@ -1,11 +1,11 @@
 # seed_companies.py
-from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
+from db import SYNC_DATABASE_URI, create_sync_engine
 from models import Base, Company, User
 import openpyxl
 
-def seed_companies(sqlite_url: str = "sqlite:///app.db"):
-    engine = create_engine(sqlite_url, echo=False, future=True)
+def seed_companies(sqlite_url: str = SYNC_DATABASE_URI):
+    engine = create_sync_engine(sqlite_url, echo=False)
 
     # Ensure tables exist
     Base.metadata.create_all(engine)
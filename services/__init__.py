@@ -5,11 +5,88 @@ from services.platform import (
     RoleService,
     sync_telegram_platform_data,
 )
+from services.background import background
+from services.company_catalog import CompanyCatalog, company_catalog
+from services.conversation_state_cache import ConversationStateCache
+from services.data_revision import current_revision, install_revision_tracking
+from services.event_rollup import EventRollups, event_rollups
+from services.export_jobs import ExportJob, ExportJobManager, export_jobs
+from services.http_client import HttpClient, HttpResponse, http_client
+from services.idempotency import IdempotencyCache, SingleFlight
+from services.identity_cache import IdentityCache, LastSeenUpdater, identity_cache, last_seen_updater
+from services.keyed_lock import KeyedLock
+from services.pagination import CountCache, KeysetPage, count_cache, fetch_keyset_page
+from services.query_plans import PlanRecorder, PlanViolation, check_query_plans
+from services.read_models import UserProfile, UserRow, UserSummary, load_user_profile
+from services.role_index import RoleIndex, role_index
+from services.roster_index import RosterEntry, RosterIndex, roster_index
+from services.search_index import SearchIndex, search_index
+from services.sms_gateway import FakeSmsTransport, SmsError, SmsGateway, SmscTransport, sms_gateway
+from services.state_sweeper import ConversationStateSweeper, StateTtl, state_sweeper
+from services.stats import RegistrationWindows, RegistryStats, StatsService, registry_stats
+from services.unit_of_work import UnitOfWork, read_session, unit_of_work
+from services.write_coordinator import WriteCoordinator, write_coordinator
 
 __all__ = [
+    "CompanyCatalog",
+    "ConversationStateCache",
     "ConversationStateService",
+    "ConversationStateSweeper",
+    "CountCache",
+    "EventRollups",
+    "ExportJob",
+    "ExportJobManager",
+    "FakeSmsTransport",
+    "HttpClient",
+    "HttpResponse",
+    "IdempotencyCache",
+    "IdentityCache",
     "IdentityService",
+    "KeyedLock",
+    "KeysetPage",
+    "LastSeenUpdater",
+    "PlanRecorder",
+    "PlanViolation",
     "PlatformSchemaUnavailable",
+    "RegistrationWindows",
+    "RegistryStats",
+    "RoleIndex",
     "RoleService",
+    "RosterEntry",
+    "RosterIndex",
+    "SearchIndex",
+    "SingleFlight",
+    "SmsError",
+    "SmsGateway",
+    "SmscTransport",
+    "StateTtl",
+    "StatsService",
+    "UnitOfWork",
+    "UserProfile",
+    "UserRow",
+    "UserSummary",
+    "WriteCoordinator",
+    "background",
+    "check_query_plans",
+    "company_catalog",
+    "count_cache",
+    "current_revision",
+    "event_rollups",
+    "export_jobs",
+    "fetch_keyset_page",
+    "http_client",
+    "identity_cache",
+    "install_revision_tracking",
+    "last_seen_updater",
+    "load_user_profile",
+    "read_session",
+    "registry_stats",
+    "role_index",
+    "roster_index",
+    "search_index",
+    "sms_gateway",
+    "state_sweeper",
     "sync_telegram_platform_data",
+    "unit_of_work",
+    "write_coordinator",
 ]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+AsyncCallback = Callable[[], Awaitable[Any]]
+
+
+class PeriodicTask:
+    """Runs ``func`` every ``interval`` seconds until stopped."""
+
+    def __init__(self, name: str, interval: float, func: AsyncCallback) -> None:
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(),
+            name=f"periodic:{self.name}",
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Periodic task %s failed", self.name)
+
+
+class BackgroundServices:
+    """Process-wide registry of periodic jobs and shutdown hooks."""
+
+    def __init__(self) -> None:
+        self._tasks: dict[str, PeriodicTask] = {}
+        self._shutdown_hooks: list[tuple[str, AsyncCallback]] = []
+        self._started = False
+
+    def add_periodic(self, name: str, interval: float, func: AsyncCallback) -> PeriodicTask:
+        task = self._tasks.get(name)
+        if task is None:
+            task = PeriodicTask(name, interval, func)
+            self._tasks[name] = task
+        if self._started:
+            task.start()
+        return task
+
+    def on_shutdown(self, name: str, func: AsyncCallback) -> None:
+        if any(existing == name for existing, _ in self._shutdown_hooks):
+            return
+        self._shutdown_hooks.append((name, func))
+
+    def start(self) -> None:
+        self._started = True
+        for task in self._tasks.values():
+            task.start()
+
+    async def stop(self) -> None:
+        self._started = False
+        for task in self._tasks.values():
+            await task.stop()
+        for name, hook in self._shutdown_hooks:
+            try:
+                await hook()
+            except Exception:
+                logger.exception("Shutdown hook %s failed", name)
+
+
+background = BackgroundServices()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from sqlalchemy import func, select
+
+from db import SessionLocal
+from models import Company
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CHECK_SECONDS = 60.0
+
+ORDER_BY_NAME = "name"
+ORDER_BY_ID = "id"
+
+# renderer(companies_on_page, page, total_pages) -> ready-to-send payload
+PageRenderer = Callable[[list[dict[str, Any]], int, int], Any]
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogCompany:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True, slots=True)
+class _RendererSpec:
+    per_page: int
+    order: str
+    render: PageRenderer
+
+
+@dataclass(slots=True)
+class CatalogSnapshot:
+    version: int
+    fingerprint: tuple[Any, ...]
+    by_id: dict[int, CatalogCompany]
+    ordered: dict[str, tuple[dict[str, Any], ...]]
+    listing_text: str
+    pages: dict[tuple[str, int], tuple[tuple[dict[str, Any], ...], ...]] = field(default_factory=dict)
+    rendered: dict[str, tuple[Any, ...]] = field(default_factory=dict)
+
+    def page_slices(self, order: str, per_page: int) -> tuple[tuple[dict[str, Any], ...], ...]:
+        key = (order, per_page)
+        cached = self.pages.get(key)
+        if cached is None:
+            items = self.ordered[order]
+            cached = tuple(items[start:start + per_page] for start in range(0, len(items), per_page))
+            self.pages[key] = cached
+        return cached
+
+
+class CompanyCatalog:
+    """Versioned in-memory company list with pre-sorted pages and pre-rendered keyboards.
+
+    The table is re-checked with a cheap fingerprint query at most once per
+    ``check_interval`` seconds and rebuilt only when it actually changed.
+    """
+
+    def __init__(self, session_factory=SessionLocal, check_interval: float = CATALOG_CHECK_SECONDS) -> None:
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+        self._renderers: dict[str, _RendererSpec] = {}
+        self._snapshot: CatalogSnapshot | None = None
+        self._checked_at = 0.0
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def register_renderer(self, name: str, per_page: int, render: PageRenderer, order: str = ORDER_BY_NAME) -> None:
+        self._renderers[name] = _RendererSpec(per_page=per_page, order=order, render=render)
+        if self._snapshot is not None:
+            self._render(self._snapshot, name)
+
+    def invalidate(self) -> None:
+        self._checked_at = 0.0
+
+    async def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        async with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._snapshot
+
+            async with self.session_factory() as session:
+                fingerprint = tuple(
+                    (
+                        await session.execute(
+                            select(
+                                func.count(Company.id),
+                                func.max(Company.id),
+                                func.sum(func.length(Company.name)),
+                            )
+                        )
+                    ).one()
+                )
+                if self._snapshot is None or self._snapshot.fingerprint != fingerprint:
+                    rows = (await session.execute(select(Company.id, Company.name))).all()
+                    self._snapshot = self._build(fingerprint, rows)
+
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _build(self, fingerprint: tuple[Any, ...], rows) -> CatalogSnapshot:
+        self._version += 1
+        by_id = {company_id: CatalogCompany(company_id, name) for company_id, name in rows}
+        by_id_order = tuple({"id": c.id, "name": c.name} for c in sorted(by_id.values(), key=lambda c: c.id))
+        by_name_order = tuple(sorted(by_id_order, key=lambda c: (c["name"], c["id"])))
+
+        snapshot = CatalogSnapshot(
+            version=self._version,
+            fingerprint=fingerprint,
+            by_id=by_id,
+            ordered={ORDER_BY_ID: by_id_order, ORDER_BY_NAME: by_name_order},
+            listing_text="".join(f"\n{c['id']} - {c['name']}" for c in by_id_order),
+        )
+        for name in self._renderers:
+            self._render(snapshot, name)
+
+        logger.info("Company catalog v%s built: %s companies", snapshot.version, len(by_id))
+        return snapshot
+
+    def _render(self, snapshot: CatalogSnapshot, name: str) -> None:
+        spec = self._renderers[name]
+        slices = snapshot.page_slices(spec.order, spec.per_page) or ((),)
+        total_pages = len(slices)
+        try:
+            snapshot.rendered[name] = tuple(
+                spec.render(list(companies), page, total_pages)
+                for page, companies in enumerate(slices)
+            )
+        except Exception:
+            logger.exception("Company catalog renderer %s failed", name)
+            snapshot.rendered.pop(name, None)
+
+    async def get(self, company_id: int) -> CatalogCompany | None:
+        return (await self.snapshot()).by_id.get(company_id)
+
+    async def all(self, order: str = ORDER_BY_ID) -> list[dict[str, Any]]:
+        return list((await self.snapshot()).ordered[order])
+
+    async def count(self) -> int:
+        return len((await self.snapshot()).by_id)
+
+    async def listing_text(self) -> str:
+        return (await self.snapshot()).listing_text
+
+    async def page(self, page: int, per_page: int, order: str = ORDER_BY_NAME) -> tuple[list[dict[str, Any]], int]:
+        """Return (companies on page, total pages); an out-of-range page is empty."""
+        slices = (await self.snapshot()).page_slices(order, per_page)
+        total_pages = len(slices) or 1
+        if 0 <= page < len(slices):
+            return list(slices[page]), total_pages
+        return [], total_pages
+
+    async def rendered_page(self, name: str, page: int) -> tuple[Any, int] | None:
+        """Pre-rendered payload for ``page`` of renderer ``name`` and the page count."""
+        pages = (await self.snapshot()).rendered.get(name)
+        if not pages or not 0 <= page < len(pages):
+            return None
+        return pages[page], len(pages)
+
+
+company_catalog = CompanyCatalog()
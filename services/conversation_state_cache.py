@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any
+
+from services.conversation_state_service import ConversationStateService
+from services.keyed_lock import KeyedLock
+from services.platform import PlatformSchemaUnavailable
+
+logger = logging.getLogger(__name__)
+
+STATE_CACHE_MAX_ENTRIES = 10_000
+STATE_FLUSH_SECONDS = 5.0
+# A dirty entry that keeps failing to persist is retried with backoff, then dropped.
+STATE_PERSIST_MAX_ATTEMPTS = 5
+STATE_PERSIST_BACKOFF_SECONDS = 5.0
+STATE_PERSIST_BACKOFF_MAX_SECONDS = 120.0
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def to_json_data(value: Any) -> Any:
+    """``value`` as it will come back from the JSON column; raises ``TypeError`` if it cannot be stored."""
+    return json.loads(json.dumps(value, default=_encode))
+
+
+@dataclass(frozen=True, slots=True)
+class StateAddress:
+    chat_id: int
+    user_id: int
+    business_connection_id: str | None = None
+    message_thread_id: int | None = None
+    bot_id: int | None = None
+
+    def kwargs(self) -> dict[str, Any]:
+        return {
+            "chat_id": self.chat_id,
+            "user_id": self.user_id,
+            "business_connection_id": self.business_connection_id,
+            "message_thread_id": self.message_thread_id,
+            "bot_id": self.bot_id,
+        }
+
+
+@dataclass(slots=True)
+class CachedConversation:
+    address: StateAddress
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    state_dirty: bool = False
+    data_dirty: bool = False
+    failures: int = 0
+    retry_at: float = 0.0
+
+
+class ConversationStateCache:
+    """Bounded LRU tier in front of ``conversation_state`` with write-behind for data.
+
+    Reads are served from memory; a miss loads the row once, and a missing row is
+    cached as well since most updates come from users without a state. A state
+    change is written through together with any pending data. ``set_data`` /
+    ``reset_data`` / ``save`` only mark the entry dirty; ``flush`` writes all dirty
+    entries at once (periodically and at shutdown), each under its conversation's
+    lock so a flush cannot resurrect a row that ``delete`` just removed. Dirty entries
+    are not evicted; one that keeps failing to persist is retried with backoff and
+    dropped after ``STATE_PERSIST_MAX_ATTEMPTS``. Data is converted to its JSON form
+    when set, so a value the column cannot hold fails the caller right away.
+
+    Until the platform schema exists the tier works from memory alone: unwritten
+    entries stay dirty, so they are neither evicted nor dropped.
+    """
+
+    def __init__(
+        self,
+        service: ConversationStateService,
+        max_entries: int = STATE_CACHE_MAX_ENTRIES,
+        locks: KeyedLock | None = None,
+    ) -> None:
+        self.service = service
+        self.max_entries = max_entries
+        self.locks = locks if locks is not None else KeyedLock()
+        self._entries: OrderedDict[str, CachedConversation | None] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._unavailable_logged = False
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def _log_unavailable(self, exc: Exception) -> None:
+        if self._unavailable_logged:
+            return
+        logger.warning("ConversationState DB storage is not ready, keeping states in memory: %s", exc)
+        self._unavailable_logged = True
+
+    async def _load(self, address: StateAddress) -> CachedConversation | None:
+        try:
+            row = await self.service.load(**address.kwargs())
+        except PlatformSchemaUnavailable as exc:
+            self._log_unavailable(exc)
+            return None
+        if row is None or row[0] is None:
+            return None
+        return CachedConversation(address, *row)
+
+    async def get(self, key: str, address: StateAddress) -> CachedConversation | None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        entry = await self._load(address)
+        if key in self._entries:
+            # Someone else loaded or created it while we were waiting on the DB.
+            return self._entries[key]
+        self._entries[key] = entry
+        self._trim()
+        return entry
+
+    async def get_state(self, key: str, address: StateAddress) -> str | None:
+        entry = await self.get(key, address)
+        return entry.state if entry is not None else None
+
+    async def get_data(self, key: str, address: StateAddress) -> dict:
+        entry = await self.get(key, address)
+        return dict(entry.data) if entry is not None else {}
+
+    async def set_state(self, key: str, address: StateAddress, state: str) -> None:
+        entry = await self.get(key, address)
+        if entry is None:
+            entry = CachedConversation(address)
+            self._entries[key] = entry
+        if entry.state != state:
+            entry.state = state
+            entry.state_dirty = True
+        if entry.state_dirty:
+            await self._persist(key, entry, raise_errors=True)
+
+    async def delete(self, key: str, address: StateAddress) -> bool:
+        entry = await self.get(key, address)
+        self._entries[key] = None
+        self._dirty.discard(key)
+        if entry is None:
+            return False
+        try:
+            await self.service.delete_state(**address.kwargs())
+        except PlatformSchemaUnavailable as exc:
+            self._log_unavailable(exc)
+        return True
+
+    async def set_data(self, key: str, address: StateAddress, name: str, value: Any) -> bool:
+        entry = await self.get(key, address)
+        if entry is None:
+            raise RuntimeError(f"ConversationState: key {key} does not exist.")
+        entry.data[name] = to_json_data(value)
+        self._mark_dirty(key, entry)
+        return True
+
+    async def reset_data(self, key: str, address: StateAddress) -> bool:
+        entry = await self.get(key, address)
+        if entry is None:
+            return False
+        entry.data = {}
+        self._mark_dirty(key, entry)
+        return True
+
+    async def save(self, key: str, address: StateAddress, data: dict) -> bool:
+        entry = await self.get(key, address)
+        if entry is None:
+            return False
+        entry.data = to_json_data(dict(data or {}))
+        self._mark_dirty(key, entry)
+        return True
+
+    def discard(self, keys: list[str]) -> None:
+        """Forget rows deleted behind our back (by the TTL sweeper); pending edits are kept."""
+        for key in keys:
+            if key not in self._dirty:
+                self._entries.pop(key, None)
+
+    def _mark_dirty(self, key: str, entry: CachedConversation) -> None:
+        entry.data_dirty = True
+        self._dirty.add(key)
+
+    async def _persist(self, key: str, entry: CachedConversation, raise_errors: bool = False) -> bool:
+        state_dirty, data_dirty = entry.state_dirty, entry.data_dirty
+        entry.state_dirty = entry.data_dirty = False
+        self._dirty.discard(key)
+
+        try:
+            # One upsert for state and data; recreates the row if it was deleted elsewhere.
+            await self.service.store(state=entry.state, data=dict(entry.data), **entry.address.kwargs())
+        except PlatformSchemaUnavailable as exc:
+            # Nowhere to write yet: the entry stays dirty, so it is pinned in memory
+            # (not a failed attempt) and written once the schema exists.
+            self._log_unavailable(exc)
+            if self._entries.get(key) is entry:
+                self._keep_dirty(key, entry, state_dirty, data_dirty)
+                entry.retry_at = time.monotonic() + STATE_PERSIST_BACKOFF_MAX_SECONDS
+            return False
+        except Exception:
+            if self._entries.get(key) is entry:
+                self._retry_later(key, entry, state_dirty, data_dirty)
+            if raise_errors:
+                raise
+            logger.exception("Failed to persist conversation state %s", key)
+            return False
+        entry.failures = 0
+        entry.retry_at = 0.0
+        return True
+
+    def _retry_later(self, key: str, entry: CachedConversation, state_dirty: bool, data_dirty: bool) -> None:
+        entry.failures += 1
+        if entry.failures >= STATE_PERSIST_MAX_ATTEMPTS:
+            # Give up: the next read reloads whatever the DB has.
+            logger.error("Dropping conversation state %s after %s failed writes", key, entry.failures)
+            self._entries.pop(key, None)
+            self.dropped += 1
+            return
+        self._keep_dirty(key, entry, state_dirty, data_dirty)
+        entry.retry_at = time.monotonic() + min(
+            STATE_PERSIST_BACKOFF_MAX_SECONDS, STATE_PERSIST_BACKOFF_SECONDS * 2 ** (entry.failures - 1)
+        )
+
+    def _keep_dirty(self, key: str, entry: CachedConversation, state_dirty: bool, data_dirty: bool) -> None:
+        entry.state_dirty = entry.state_dirty or state_dirty
+        entry.data_dirty = entry.data_dirty or data_dirty
+        self._dirty.add(key)
+
+    async def _flush_key(self, key: str) -> bool:
+        async with self.locks(key):
+            # Deleted or already written while we waited for the lock.
+            entry = self._entries.get(key)
+            if key not in self._dirty or entry is None:
+                return False
+            if entry.retry_at > time.monotonic():
+                return False
+            return await self._persist(key, entry)
+
+    async def flush(self) -> int:
+        """Write every dirty entry; the writes share the write coordinator's group commits."""
+        results = await asyncio.gather(*(self._flush_key(key) for key in list(self._dirty)))
+        self._trim()
+        return sum(results)
+
+    def _trim(self) -> None:
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        victims = []
+        for key in self._entries:
+            if key not in self._dirty:
+                victims.append(key)
+                if len(victims) == excess:
+                    break
+        for key in victims:
+            del self._entries[key]
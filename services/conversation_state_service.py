@@ -3,12 +3,15 @@
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 
-from db import SessionLocal
+from db import ReadSessionLocal
 from models import ConversationState
 from services.platform import _raise_schema_unavailable
+from services.write_coordinator import write_coordinator
 
 
 def build_storage_key(
@@ -36,12 +39,14 @@ class ConversationStateService:
     def __init__(
         self,
         provider: str = "telegram",
-        session_factory=SessionLocal,
+        session_factory=ReadSessionLocal,
         prefix: str = "telebot",
         separator: str = ":",
+        writer=write_coordinator,
     ) -> None:
         self.provider = provider
         self.session_factory = session_factory
+        self.writer = writer
         self.prefix = prefix
         self.separator = separator
 
@@ -68,6 +73,62 @@ class ConversationStateService:
         result = await session.execute(stmt)
         return result.scalars().first()
 
+    async def _write(self, operation, action: str):
+        """Run ``operation(session)`` in the shared writer's next group commit."""
+        try:
+            return await self.writer.submit(operation)
+        except SQLAlchemyError as exc:
+            _raise_schema_unavailable(exc, action)
+
+    def _new_row(
+        self,
+        storage_key: str,
+        chat_id: int,
+        user_id: int,
+        business_connection_id: str | None,
+        message_thread_id: int | None,
+        bot_id: int | None,
+        state: str | None,
+        data: dict,
+    ) -> dict[str, Any]:
+        now = datetime.utcnow()
+        return {
+            "storage_key": storage_key,
+            "provider": self.provider,
+            "external_user_id": str(user_id),
+            "chat_id": str(chat_id),
+            "business_connection_id": business_connection_id,
+            "message_thread_id": message_thread_id,
+            "bot_id": bot_id,
+            "state": state,
+            "data": data,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    @staticmethod
+    def _upsert(session, row: dict[str, Any], columns: tuple[str, ...]):
+        """INSERT ... ON CONFLICT(storage_key) DO UPDATE of ``columns``: one statement, no SELECT."""
+        table = ConversationState.__table__
+        dialect_insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+        stmt = dialect_insert(table).values(**row)
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.storage_key],
+            set_={name: stmt.excluded[name] for name in (*columns, "updated_at")},
+        )
+
+    async def _update_data(self, storage_key: str, data: dict, action: str) -> bool:
+        stmt = (
+            update(ConversationState.__table__)
+            .where(ConversationState.storage_key == storage_key)
+            .values(data=data, updated_at=datetime.utcnow())
+        )
+
+        async def write(session) -> bool:
+            return (await session.execute(stmt)).rowcount > 0
+
+        return await self._write(write, action)
+
     async def set_state(
         self,
         chat_id: int,
@@ -87,35 +148,15 @@ class ConversationStateService:
             message_thread_id=message_thread_id,
             bot_id=bot_id,
         )
-        now = datetime.utcnow()
+        row = self._new_row(
+            storage_key, chat_id, user_id, business_connection_id, message_thread_id, bot_id, state, {}
+        )
 
-        async with self.session_factory() as session:
-            try:
-                record = await self._get_record(session, storage_key)
-                if record is None:
-                    record = ConversationState(
-                        storage_key=storage_key,
-                        provider=self.provider,
-                        external_user_id=str(user_id),
-                        chat_id=str(chat_id),
-                        business_connection_id=business_connection_id,
-                        message_thread_id=message_thread_id,
-                        bot_id=bot_id,
-                        state=state,
-                        data={},
-                        created_at=now,
-                        updated_at=now,
-                    )
-                    session.add(record)
-                else:
-                    record.state = state
-                    record.updated_at = now
-
-                await session.commit()
-                return True
-            except SQLAlchemyError as exc:
-                await session.rollback()
-                _raise_schema_unavailable(exc, "conversation state write")
+        async def write(session) -> bool:
+            await session.execute(self._upsert(session, row, ("state",)))
+            return True
+
+        return await self._write(write, "conversation state write")
 
     async def get_state(
         self,
@@ -140,14 +181,15 @@ class ConversationStateService:
             except SQLAlchemyError as exc:
                 _raise_schema_unavailable(exc, "conversation state read")
 
-    async def delete_state(
+    async def load(
         self,
         chat_id: int,
         user_id: int,
         business_connection_id: str | None = None,
         message_thread_id: int | None = None,
         bot_id: int | None = None,
-    ) -> bool:
+    ) -> tuple[str | None, dict] | None:
+        """State and data in one query; ``None`` if the conversation has no row."""
         storage_key = self.make_storage_key(
             chat_id=chat_id,
             user_id=user_id,
@@ -155,18 +197,41 @@ class ConversationStateService:
             message_thread_id=message_thread_id,
             bot_id=bot_id,
         )
+        stmt = select(ConversationState.state, ConversationState.data).where(
+            ConversationState.storage_key == storage_key
+        )
 
         async with self.session_factory() as session:
             try:
-                record = await self._get_record(session, storage_key)
-                if record is None:
-                    return False
-                await session.delete(record)
-                await session.commit()
-                return True
+                row = (await session.execute(stmt)).first()
             except SQLAlchemyError as exc:
-                await session.rollback()
-                _raise_schema_unavailable(exc, "conversation state delete")
+                _raise_schema_unavailable(exc, "conversation state read")
+        if row is None:
+            return None
+        return row.state, dict(row.data or {})
+
+    async def delete_state(
+        self,
+        chat_id: int,
+        user_id: int,
+        business_connection_id: str | None = None,
+        message_thread_id: int | None = None,
+        bot_id: int | None = None,
+    ) -> bool:
+        storage_key = self.make_storage_key(
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            message_thread_id=message_thread_id,
+            bot_id=bot_id,
+        )
+
+        stmt = delete(ConversationState.__table__).where(ConversationState.storage_key == storage_key)
+
+        async def write(session) -> bool:
+            return (await session.execute(stmt)).rowcount > 0
+
+        return await self._write(write, "conversation state delete")
 
     async def get_data(
         self,
@@ -209,20 +274,17 @@ class ConversationStateService:
             bot_id=bot_id,
         )
 
-        async with self.session_factory() as session:
-            try:
-                record = await self._get_record(session, storage_key)
-                if record is None:
-                    raise RuntimeError(f"ConversationState: key {storage_key} does not exist.")
-                payload = dict(record.data or {})
-                payload[key] = value
-                record.data = payload
-                record.updated_at = datetime.utcnow()
-                await session.commit()
-                return True
-            except SQLAlchemyError as exc:
-                await session.rollback()
-                _raise_schema_unavailable(exc, "conversation data write")
+        async def write(session) -> bool:
+            record = await self._get_record(session, storage_key)
+            if record is None:
+                raise RuntimeError(f"ConversationState: key {storage_key} does not exist.")
+            payload = dict(record.data or {})
+            payload[key] = value
+            record.data = payload
+            record.updated_at = datetime.utcnow()
+            return True
+
+        return await self._write(write, "conversation data write")
 
     async def reset_data(
         self,
@@ -240,18 +302,7 @@ class ConversationStateService:
             bot_id=bot_id,
         )
 
-        async with self.session_factory() as session:
-            try:
-                record = await self._get_record(session, storage_key)
-                if record is None:
-                    return False
-                record.data = {}
-                record.updated_at = datetime.utcnow()
-                await session.commit()
-                return True
-            except SQLAlchemyError as exc:
-                await session.rollback()
-                _raise_schema_unavailable(exc, "conversation data reset")
+        return await self._update_data(storage_key, {}, "conversation data reset")
 
     async def save(
         self,
@@ -270,15 +321,36 @@ class ConversationStateService:
             bot_id=bot_id,
         )
 
-        async with self.session_factory() as session:
-            try:
-                record = await self._get_record(session, storage_key)
-                if record is None:
-                    return False
-                record.data = dict(data or {})
-                record.updated_at = datetime.utcnow()
-                await session.commit()
-                return True
-            except SQLAlchemyError as exc:
-                await session.rollback()
-                _raise_schema_unavailable(exc, "conversation data save")
+        return await self._update_data(storage_key, dict(data or {}), "conversation data save")
+
+    async def store(
+        self,
+        chat_id: int,
+        user_id: int,
+        state: Any,
+        data: dict,
+        business_connection_id: str | None = None,
+        message_thread_id: int | None = None,
+        bot_id: int | None = None,
+    ) -> bool:
+        """Write state and data together, creating the row if needed, in one statement."""
+        if hasattr(state, "name"):
+            state = state.name
+
+        storage_key = self.make_storage_key(
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            message_thread_id=message_thread_id,
+            bot_id=bot_id,
+        )
+        row = self._new_row(
+            storage_key, chat_id, user_id, business_connection_id, message_thread_id, bot_id,
+            state, dict(data or {}),
+        )
+
+        async def write(session) -> bool:
+            await session.execute(self._upsert(session, row, ("state", "data")))
+            return True
+
+        return await self._write(write, "conversation state store")
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from itertools import chain
+from typing import Any
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Company, RegistryCounter, User, User_who_blocked
+from services.write_coordinator import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+DATA_REVISION = "data_revision"
+
+# Changes to these tables do not count as registry data changes.
+REVISION_IGNORED_TABLES = frozenset({"conversation_state", "registry_counter", "event_rollup"})
+
+_DIRTY_FLAG = "registry_data_dirty"
+_installed = False
+
+
+def _mark_dirty(session: Session, flush_context) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None and table.name not in REVISION_IGNORED_TABLES:
+            session.info[_DIRTY_FLAG] = True
+            return
+
+
+def _bump_on_commit(session: Session) -> None:
+    # Flush first so objects added right before commit are seen by _mark_dirty.
+    session.flush()
+    if not session.info.pop(_DIRTY_FLAG, False):
+        return
+    session.connection().execute(
+        update(RegistryCounter.__table__)
+        .where(RegistryCounter.name == DATA_REVISION)
+        .values(value=RegistryCounter.value + 1, updated_at=datetime.utcnow())
+    )
+
+
+def _clear_on_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_FLAG, None)
+
+
+async def install_revision_tracking(writer=write_coordinator) -> bool:
+    """Make every ORM commit that touches registry data bump ``registry_counter.data_revision``."""
+    global _installed
+    if _installed:
+        return True
+
+    async def ensure_counter(session) -> None:
+        exists = await session.scalar(
+            select(RegistryCounter.name).where(RegistryCounter.name == DATA_REVISION)
+        )
+        if exists is None:
+            await session.execute(
+                insert(RegistryCounter).values(name=DATA_REVISION, value=0, updated_at=datetime.utcnow())
+            )
+
+    try:
+        await writer.submit(ensure_counter)
+    except SQLAlchemyError:
+        logger.warning("registry_counter is unavailable, data revision tracking disabled", exc_info=True)
+        return False
+
+    event.listen(Session, "after_flush", _mark_dirty)
+    event.listen(Session, "before_commit", _bump_on_commit)
+    event.listen(Session, "after_rollback", _clear_on_rollback)
+    _installed = True
+    return True
+
+
+async def revision_counter(session_factory=SessionLocal) -> int | None:
+    """Just the ``data_revision`` counter: one primary-key read, cheap enough to poll."""
+    try:
+        async with session_factory() as session:
+            return await session.scalar(
+                select(RegistryCounter.value).where(RegistryCounter.name == DATA_REVISION)
+            )
+    except SQLAlchemyError:
+        return None
+
+
+async def revision_counters(prefix: str, session_factory=SessionLocal) -> dict[str, int]:
+    """Every counter whose name starts with ``prefix``, in one range read of the primary key."""
+    async with session_factory() as session:
+        rows = await session.execute(
+            select(RegistryCounter.name, RegistryCounter.value).where(RegistryCounter.name.startswith(prefix))
+        )
+        return {name: value for name, value in rows}
+
+
+async def current_revision(session_factory=SessionLocal) -> tuple[Any, ...]:
+    """Token that changes whenever registry data changes, including bulk imports done outside the ORM hooks."""
+    stmt = select(
+        select(func.count(User.id)).scalar_subquery(),
+        select(func.max(User.id)).scalar_subquery(),
+        select(func.count(Company.id)).scalar_subquery(),
+        select(func.count(User_who_blocked.id)).scalar_subquery(),
+    )
+    async with session_factory() as session:
+        counts = tuple((await session.execute(stmt)).one())
+        try:
+            counter = await session.scalar(
+                select(RegistryCounter.value).where(RegistryCounter.name == DATA_REVISION)
+            )
+        except SQLAlchemyError:
+            counter = None
+    return (counter,) + counts
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import BlockedIdentityEvent, EventRollup, User, User_who_blocked, UserIdentity
+from services.stats import _UNKNOWN, _old_new
+from services.write_coordinator import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (HOUR, DAY)
+
+EVENT_REGISTERED = "registered"
+EVENT_BLOCKED = "blocked"
+EVENT_DELETED = "deleted"
+EVENTS = (EVENT_REGISTERED, EVENT_BLOCKED, EVENT_DELETED)
+
+DIMENSION_ALL = "all"
+DIMENSION_COMPANY = "company"
+DIMENSION_VOLUNTEER = "volunteer"
+DIMENSION_PROVIDER = "provider"
+DIMENSIONS = (DIMENSION_ALL, DIMENSION_COMPANY, DIMENSION_VOLUNTEER, DIMENSION_PROVIDER)
+
+HOURLY_RETENTION_DAYS = 90
+ROLLUP_PRUNE_SECONDS = 24 * 3600.0
+
+# (granularity, event, dimension, dimension_value, bucket_start)
+RollupKey = tuple[str, str, str, str, datetime]
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_event(
+    counts: Counter,
+    event_name: str,
+    moment: datetime | None,
+    dimensions: dict[str, Any],
+    amount: int = 1,
+) -> None:
+    moment = moment or datetime.utcnow()
+    pairs = [(DIMENSION_ALL, "")]
+    pairs.extend((dimension, str(value)) for dimension, value in dimensions.items() if value is not None)
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(moment, granularity)
+        for dimension, value in pairs:
+            counts[(granularity, event_name, dimension, value, bucket)] += amount
+
+
+def _upsert_statement(connection, counts: dict[RollupKey, int]):
+    table = EventRollup.__table__
+    dialect_insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = dialect_insert(table).values(
+        [
+            {
+                "granularity": granularity,
+                "event": event_name,
+                "dimension": dimension,
+                "dimension_value": value,
+                "bucket_start": bucket,
+                "count": amount,
+            }
+            for (granularity, event_name, dimension, value, bucket), amount in counts.items()
+        ]
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[
+            table.c.granularity, table.c.event, table.c.dimension, table.c.dimension_value, table.c.bucket_start,
+        ],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+
+
+def _hour_expr(column, dialect_name: str):
+    if dialect_name == "postgresql":
+        return func.date_trunc("hour", column)
+    return func.strftime("%Y-%m-%d %H:00:00", column)
+
+
+def _as_datetime(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+class EventRollups:
+    """Hourly and daily counts of registrations, blocks and deletions in ``event_rollup``.
+
+    Every event is counted under the ``all`` dimension and, when known, per company,
+    volunteer and provider. Rows are maintained by a session ``after_flush`` hook in
+    the transaction that produced the event; telegram blocks come from
+    ``user_who_blocked``, other providers from ``blocked_identity_event``.
+    """
+
+    def __init__(self, session_factory=SessionLocal, writer=write_coordinator) -> None:
+        self.session_factory = session_factory
+        self.writer = writer
+        self._installed = False
+
+    async def start(self) -> bool:
+        """Backfill an empty table from history and start maintaining it."""
+        try:
+            async with self.session_factory() as session:
+                has_rows = await session.scalar(select(EventRollup.granularity).limit(1))
+            if has_rows is None:
+                await self.backfill()
+        except SQLAlchemyError:
+            logger.warning("event_rollup is unavailable, event rollups disabled", exc_info=True)
+            return False
+        if not self._installed:
+            event.listen(Session, "after_flush", self._after_flush)
+            self._installed = True
+        return True
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        counts: Counter = Counter()
+        providers: dict[int, str] = {}
+        users_by_tg: dict[int, User] = {}
+        users_by_id: dict[int, User] = {}
+
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, UserIdentity) and obj.user_id is not None:
+                providers.setdefault(obj.user_id, obj.provider)
+            elif isinstance(obj, User):
+                users_by_id[obj.id] = obj
+                if obj.tg_id is not None:
+                    users_by_tg[obj.tg_id] = obj
+
+        for obj in session.new:
+            if isinstance(obj, User) and obj.status == EVENT_REGISTERED:
+                self._add_registration(counts, obj, providers)
+            elif isinstance(obj, User_who_blocked):
+                user = users_by_tg.get(obj.tg_id)
+                _add_event(counts, EVENT_BLOCKED, obj.blocked_at, {
+                    DIMENSION_PROVIDER: "telegram",
+                    DIMENSION_COMPANY: user.company_id if user is not None else None,
+                })
+            elif isinstance(obj, BlockedIdentityEvent) and obj.provider != "telegram":
+                user = users_by_id.get(obj.user_id)
+                _add_event(counts, EVENT_BLOCKED, obj.blocked_at, {
+                    DIMENSION_PROVIDER: obj.provider,
+                    DIMENSION_COMPANY: user.company_id if user is not None else None,
+                })
+
+        for obj in session.dirty:
+            if not isinstance(obj, User) or obj in session.deleted:
+                continue
+            state = inspect(obj)
+            old_status, new_status = _old_new(state, "status")
+            if old_status is _UNKNOWN or old_status == new_status:
+                continue
+            if new_status == EVENT_REGISTERED:
+                self._add_registration(counts, obj, providers)
+            elif new_status == EVENT_DELETED:
+                old_company, _ = _old_new(state, "company_id")
+                _add_event(counts, EVENT_DELETED, None, {
+                    DIMENSION_COMPANY: None if old_company is _UNKNOWN else old_company,
+                })
+
+        if counts:
+            connection = session.connection()
+            connection.execute(_upsert_statement(connection, dict(counts)))
+
+    @staticmethod
+    def _add_registration(counts: Counter, user: User, providers: dict[int, str]) -> None:
+        provider = providers.get(user.id) or ("telegram" if user.tg_id is not None else None)
+        _add_event(counts, EVENT_REGISTERED, user.registered_at, {
+            DIMENSION_COMPANY: user.company_id,
+            DIMENSION_VOLUNTEER: user.volunteer_id,
+            DIMENSION_PROVIDER: provider,
+        })
+
+    async def backfill(self) -> int:
+        """Rebuild rollups from ``user``, ``user_who_blocked`` and ``blocked_identity_event``.
+
+        Deletions carry no timestamp in the source tables and only accumulate from now on.
+        Like the stats rebuild it is one write operation, so no event lands between the
+        read of the history and the replacement.
+        """
+        counts: Counter = Counter()
+
+        async def write(session) -> None:
+            dialect_name = session.bind.dialect.name
+            identity_provider = (
+                select(func.min(UserIdentity.provider))
+                .where(UserIdentity.user_id == User.id)
+                .scalar_subquery()
+            )
+            provider = func.coalesce(case((User.tg_id.is_not(None), "telegram")), identity_provider)
+            hour = _hour_expr(User.registered_at, dialect_name)
+            registrations = select(hour, User.company_id, User.volunteer_id, provider, func.count()).where(
+                User.status == EVENT_REGISTERED,
+                User.registered_at.is_not(None),
+            ).group_by(hour, User.company_id, User.volunteer_id, provider)
+            for moment, company_id, volunteer_id, provider_name, amount in await session.execute(registrations):
+                _add_event(counts, EVENT_REGISTERED, _as_datetime(moment), {
+                    DIMENSION_COMPANY: company_id,
+                    DIMENSION_VOLUNTEER: volunteer_id,
+                    DIMENSION_PROVIDER: provider_name,
+                }, amount)
+
+            hour = _hour_expr(User_who_blocked.blocked_at, dialect_name)
+            telegram_blocks = (
+                select(hour, User.company_id, func.count())
+                .select_from(User_who_blocked)
+                .outerjoin(User, User.tg_id == User_who_blocked.tg_id)
+                .where(User_who_blocked.blocked_at.is_not(None))
+                .group_by(hour, User.company_id)
+            )
+            for moment, company_id, amount in await session.execute(telegram_blocks):
+                _add_event(counts, EVENT_BLOCKED, _as_datetime(moment), {
+                    DIMENSION_PROVIDER: "telegram",
+                    DIMENSION_COMPANY: company_id,
+                }, amount)
+
+            hour = _hour_expr(BlockedIdentityEvent.blocked_at, dialect_name)
+            other_blocks = (
+                select(hour, BlockedIdentityEvent.provider, User.company_id, func.count())
+                .select_from(BlockedIdentityEvent)
+                .outerjoin(User, User.id == BlockedIdentityEvent.user_id)
+                .where(BlockedIdentityEvent.provider != "telegram")
+                .group_by(hour, BlockedIdentityEvent.provider, User.company_id)
+            )
+            for moment, provider_name, company_id, amount in await session.execute(other_blocks):
+                _add_event(counts, EVENT_BLOCKED, _as_datetime(moment), {
+                    DIMENSION_PROVIDER: provider_name,
+                    DIMENSION_COMPANY: company_id,
+                }, amount)
+
+            await session.execute(delete(EventRollup))
+            if counts:
+                await session.execute(
+                    insert(EventRollup),
+                    [
+                        {
+                            "granularity": granularity,
+                            "event": event_name,
+                            "dimension": dimension,
+                            "dimension_value": value,
+                            "bucket_start": bucket,
+                            "count": amount,
+                        }
+                        for (granularity, event_name, dimension, value, bucket), amount in counts.items()
+                    ],
+                )
+
+        await self.writer.submit(write)
+
+        logger.info("Event rollups backfilled: %s buckets", len(counts))
+        return len(counts)
+
+    async def series(
+        self,
+        event_name: str,
+        granularity: str = DAY,
+        dimension: str = DIMENSION_ALL,
+        *,
+        since: datetime,
+        until: datetime | None = None,
+        value: str | None = None,
+    ) -> dict[str, list[tuple[datetime, int]]]:
+        """dimension value -> [(bucket_start, count)] in ``[since, until)``, read straight from the rollup."""
+        stmt = select(EventRollup.dimension_value, EventRollup.bucket_start, EventRollup.count).where(
+            EventRollup.granularity == granularity,
+            EventRollup.event == event_name,
+            EventRollup.dimension == dimension,
+            EventRollup.bucket_start >= bucket_start(since, granularity),
+        )
+        if until is not None:
+            stmt = stmt.where(EventRollup.bucket_start < until)
+        if value is not None:
+            stmt = stmt.where(EventRollup.dimension_value == value)
+        stmt = stmt.order_by(EventRollup.dimension_value, EventRollup.bucket_start)
+
+        result: dict[str, list[tuple[datetime, int]]] = {}
+        async with self.session_factory() as session:
+            for dimension_value, bucket, amount in await session.execute(stmt):
+                result.setdefault(dimension_value, []).append((bucket, amount))
+        return result
+
+    async def prune(self) -> None:
+        """Drop hourly buckets older than ``HOURLY_RETENTION_DAYS``; daily buckets are kept."""
+        cutoff = datetime.utcnow() - timedelta(days=HOURLY_RETENTION_DAYS)
+
+        async def write(session) -> None:
+            await session.execute(
+                delete(EventRollup).where(EventRollup.granularity == HOUR, EventRollup.bucket_start < cutoff)
+            )
+
+        await self.writer.submit(write)
+
+
+event_rollups = EventRollups()
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable
+
+from openpyxl import Workbook
+from sqlalchemy import MetaData, Table, select
+
+from db import engine
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000
+DEFAULT_EXPORT_PATH = "excel_dump.xlsx"
+
+TABLE_EXPORT_CONFIG: dict[str, dict[str, Any]] = {
+    "user": {
+        "sheet_name": "Пользователи",
+        "column_order": [
+            "id", "last_name", "first_name", "father_name",
+            "passport_number", "date_of_birth", "counter",
+            "address", "phone_number", "status", "registered_at",
+            "blocked_at", "company_id"
+        ],
+        "rename": {
+            "id": "ID",
+            "last_name": "Фамилия",
+            "first_name": "Имя",
+            "father_name": "Отчество",
+            "passport_number": "Серия номер паспорта",
+            "date_of_birth": "Дата рождения",
+            "counter": "Порядковый номер",
+            "address": "Адрес",
+            "phone_number": "Номер телефона",
+            "status": "Статус",
+            "registered_at": "Дата время регистрации",
+            "blocked_at": "Дата время блокировки",
+            "company_id": "ID предприятия",
+        },
+    },
+    "company": {
+        "sheet_name": "Предприятия",
+        "column_order": ["id", "name"],
+        "rename": {
+            "id": "ID",
+            "name": "Название",
+        },
+    },
+}
+
+# Extra user sheets filled from the same pass over ``user``: status -> sheet name.
+EXTRA_USER_SHEETS = {
+    "blocked": "Заблокировали после регистрации",
+    "deleted": "Удалены",
+}
+
+USER_WHO_BLOCKED_SHEET_NAME = "Заблокировали до регистрации"
+USER_WHO_BLOCKED_RENAME = {
+    "tg_id": "ID телеграм",
+    "blocked_at": "Время и дата блокировки",
+}
+EXCLUDED_TABLES = {"alembic_version", "user_who_blocked", "conversation_state", "registry_counter", "event_rollup"}
+# FTS5 search tables and their shadow tables (user_search_data, user_search_idx, ...).
+EXCLUDED_TABLE_PREFIXES = ("user_search", "company_search")
+
+ProgressCallback = Callable[[str, int], None]
+
+_NATIVE_TYPES = (str, int, float, bool, date, datetime, Decimal)
+
+
+def _cell(value: Any) -> Any:
+    if value is None or isinstance(value, _NATIVE_TYPES):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def _export_columns(table: Table) -> tuple[list[str], list[str]]:
+    config = TABLE_EXPORT_CONFIG.get(table.name, {})
+    source_cols = [column.name for column in table.columns]
+    column_order = config.get("column_order")
+    columns = [col for col in column_order if col in source_cols] if column_order else source_cols
+    rename_map = config.get("rename", {})
+    return columns, [rename_map.get(col, col) for col in columns]
+
+
+async def _stream_table(conn, table: Table, columns: list[str], chunk_size: int):
+    stmt = select(*(table.c[col] for col in columns)).execution_options(yield_per=chunk_size)
+    result = await conn.stream(stmt)
+    async for partition in result.partitions(chunk_size):
+        yield partition
+
+
+async def export_registry(
+    path: str = DEFAULT_EXPORT_PATH,
+    *,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    progress: ProgressCallback | None = None,
+) -> int:
+    """Stream every table into a write-only workbook at ``path``; returns the number of rows written."""
+    metadata = MetaData()
+    async with engine.connect() as conn:
+        await conn.run_sync(metadata.reflect)
+
+    workbook = Workbook(write_only=True)
+    total_rows = 0
+
+    async with engine.connect() as conn:
+        for idx, table in enumerate(metadata.sorted_tables, start=1):
+            if table.name in EXCLUDED_TABLES or table.name.startswith(EXCLUDED_TABLE_PREFIXES):
+                continue
+
+            columns, headers = _export_columns(table)
+            sheet_name = TABLE_EXPORT_CONFIG.get(table.name, {}).get("sheet_name", table.name.title())
+            sheet = workbook.create_sheet(title=(sheet_name or f"table_{idx}")[:31])
+            sheet.append(headers)
+
+            status_sheets = {}
+            status_pos = None
+            if table.name == "user" and "status" in columns:
+                status_pos = columns.index("status")
+                for status_value, extra_sheet_name in EXTRA_USER_SHEETS.items():
+                    extra_sheet = workbook.create_sheet(title=extra_sheet_name[:31])
+                    extra_sheet.append(headers)
+                    status_sheets[status_value] = extra_sheet
+
+            async for rows in _stream_table(conn, table, columns, chunk_size):
+                for row in rows:
+                    values = [_cell(value) for value in row]
+                    sheet.append(values)
+                    if status_pos is not None:
+                        extra_sheet = status_sheets.get(row[status_pos])
+                        if extra_sheet is not None:
+                            extra_sheet.append(values)
+                total_rows += len(rows)
+                if progress is not None:
+                    progress(table.name, total_rows)
+
+        user_who_blocked_table = metadata.tables.get("user_who_blocked")
+        if user_who_blocked_table is not None:
+            sheet = workbook.create_sheet(title=USER_WHO_BLOCKED_SHEET_NAME[:31])
+            columns = list(USER_WHO_BLOCKED_RENAME)
+            sheet.append([USER_WHO_BLOCKED_RENAME[col] for col in columns])
+            async for rows in _stream_table(conn, user_who_blocked_table, columns, chunk_size):
+                for row in rows:
+                    sheet.append([_cell(value) for value in row])
+                total_rows += len(rows)
+                if progress is not None:
+                    progress(user_who_blocked_table.name, total_rows)
+
+    # Save under a temporary name so readers never see a half-written file.
+    tmp_path = f"{path}.part"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    logger.info("Excel export written to %s: %s rows", path, total_rows)
+    return total_rows
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from services.data_revision import current_revision
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = Path(os.environ.get("EXPORT_DIR", "exports"))
+EXPORT_KEEP_ARTIFACTS = 3
+EXPORT_PROGRESS_POLL_SECONDS = 0.5
+_PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass(slots=True)
+class ExportJob:
+    id: str
+    path: str
+    revision: tuple[Any, ...] | None
+    status: str = PENDING
+    rows: int = 0
+    table: str | None = None
+    error: str | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "rows": self.rows,
+            "table": self.table,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ExportJobManager:
+    """Runs Excel exports in a worker process, one at a time, reusing fresh artifacts.
+
+    The worker is a fresh interpreter running ``services.export_worker``: it does not
+    inherit the parent's event loop or DB connections, and unlike a multiprocessing
+    spawn it does not re-import the caller's ``__main__`` (the bot script).
+    """
+
+    def __init__(self, export_dir: Path = EXPORT_DIR, keep_artifacts: int = EXPORT_KEEP_ARTIFACTS) -> None:
+        self.export_dir = Path(export_dir)
+        self.keep_artifacts = keep_artifacts
+        self._jobs: dict[str, ExportJob] = {}
+        self._active: ExportJob | None = None
+        self._process: asyncio.subprocess.Process | None = None
+        self._lock = asyncio.Lock()
+
+    async def _start_worker(self, job: ExportJob, progress_path: str) -> asyncio.subprocess.Process:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(_PROJECT_ROOT), env.get("PYTHONPATH")]))
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "services.export_worker", job.path, progress_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+        )
+
+    def get(self, job_id: str) -> ExportJob | None:
+        return self._jobs.get(job_id)
+
+    def _latest_done(self) -> ExportJob | None:
+        done = [job for job in self._jobs.values() if job.status == DONE and Path(job.path).exists()]
+        return max(done, key=lambda job: job.created_at) if done else None
+
+    async def submit(self) -> ExportJob:
+        """Return the running job, a finished job for the current data revision, or start a new one."""
+        async with self._lock:
+            if self._active is not None and not self._active.finished:
+                return self._active
+
+            revision = await current_revision()
+            latest = self._latest_done()
+            if latest is not None and latest.revision == revision:
+                return latest
+
+            job_id = uuid.uuid4().hex
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.export_dir.mkdir(parents=True, exist_ok=True)
+            job = ExportJob(
+                id=job_id,
+                path=str(self.export_dir / f"registry_{stamp}_{job_id[:8]}.xlsx"),
+                revision=revision,
+            )
+            self._jobs[job_id] = job
+            self._active = job
+            job.task = asyncio.get_running_loop().create_task(self._run(job), name=f"export:{job_id}")
+            return job
+
+    async def wait(self, job: ExportJob, timeout: float | None = None) -> ExportJob:
+        if job.task is not None and not job.finished:
+            await asyncio.wait_for(asyncio.shield(job.task), timeout)
+        return job
+
+    async def _run(self, job: ExportJob) -> None:
+        progress_path = f"{job.path}.progress"
+        job.status = RUNNING
+        try:
+            process = self._process = await self._start_worker(job, progress_path)
+            communicate = asyncio.ensure_future(process.communicate())
+            while True:
+                done, _ = await asyncio.wait({communicate}, timeout=EXPORT_PROGRESS_POLL_SECONDS)
+                self._read_progress(job, progress_path)
+                if done:
+                    break
+            stdout, stderr = communicate.result()
+            if process.returncode != 0:
+                lines = stderr.decode(errors="replace").strip().splitlines()
+                raise RuntimeError(lines[-1] if lines else f"export worker exited with {process.returncode}")
+            job.rows = int(stdout.decode().split()[-1])
+            job.status = DONE
+            logger.info("Export job %s done: %s rows -> %s", job.id, job.rows, job.path)
+        except Exception as exc:
+            job.status = FAILED
+            job.error = str(exc) or exc.__class__.__name__
+            logger.exception("Export job %s failed", job.id)
+        finally:
+            self._process = None
+            job.finished_at = datetime.utcnow()
+            Path(progress_path).unlink(missing_ok=True)
+            self._prune()
+
+    @staticmethod
+    def _read_progress(job: ExportJob, progress_path: str) -> None:
+        try:
+            with open(progress_path, encoding="utf-8") as fh:
+                progress = json.load(fh)
+        except (OSError, ValueError):
+            return
+        job.table = progress.get("table")
+        job.rows = int(progress.get("rows") or 0)
+
+    def _prune(self) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished),
+            key=lambda job: job.created_at,
+            reverse=True,
+        )
+        for job in finished[self.keep_artifacts:]:
+            Path(job.path).unlink(missing_ok=True)
+            self._jobs.pop(job.id, None)
+
+    async def shutdown(self) -> None:
+        process, self._process = self._process, None
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+export_jobs = ExportJobManager()
@@ -0,0 +1,47 @@
+"""Export worker process: ``python -m services.export_worker <path> <progress_path>``.
+
+Imports nothing of the bot or the dashboard, so starting it never re-runs their
+entry points. Prints the number of exported rows on success.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+_PROGRESS_WRITE_EVERY_SECONDS = 0.5
+
+
+def run_export(path: str, progress_path: str) -> int:
+    """Run the streaming exporter in a fresh event loop, reporting progress to a file."""
+    from services.excel_export import export_registry
+
+    last_write = 0.0
+
+    def report(table: str, rows: int) -> None:
+        nonlocal last_write
+        now = time.monotonic()
+        if now - last_write < _PROGRESS_WRITE_EVERY_SECONDS:
+            return
+        last_write = now
+        tmp_path = f"{progress_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"table": table, "rows": rows}, fh)
+        os.replace(tmp_path, progress_path)
+
+    return asyncio.run(export_registry(path, progress=report))
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) != 2:
+        print("usage: python -m services.export_worker <path> <progress_path>", file=sys.stderr)
+        return 2
+    print(run_export(*argv))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 20
+# Shorter than the usual server-side idle timeout, so we drop a connection before the
+# server does and a request never lands on a socket that is being closed.
+HTTP_KEEPALIVE_SECONDS = 30.0
+HTTP_DNS_CACHE_SECONDS = 300
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=20, connect=5, sock_read=15)
+HTTP_RETRIES = 2
+HTTP_BACKOFF_BASE_SECONDS = 0.2
+HTTP_BACKOFF_MAX_SECONDS = 2.0
+
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# The server did not act on the request: safe to repeat even a POST.
+_RETRY_ANY_STATUSES = frozenset({429, 503})
+_RETRY_IDEMPOTENT_STATUSES = frozenset({500, 502, 504})
+
+
+@dataclass(frozen=True, slots=True)
+class HttpResponse:
+    status: int
+    text: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+
+class HttpClient:
+    """One long-lived ``aiohttp`` session for all outbound HTTP of the process.
+
+    Connections are kept alive and reused per host (bounded by ``limit_per_host``), so
+    a message turn talks to warm connections instead of paying TCP and TLS handshakes.
+    Failed attempts are retried with full-jitter exponential backoff, but only where a
+    repeat cannot duplicate a side effect: connection failures and 429/503 for any
+    method; timeouts, dropped connections and other 5xx only for idempotent methods.
+    """
+
+    def __init__(
+        self,
+        timeout: aiohttp.ClientTimeout = HTTP_TIMEOUT,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        retries: int = HTTP_RETRIES,
+        backoff_base: float = HTTP_BACKOFF_BASE_SECONDS,
+        backoff_max: float = HTTP_BACKOFF_MAX_SECONDS,
+    ) -> None:
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.requests = 0
+        self.retried = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Created lazily: a session is bound to the loop it was made on.
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._loop = loop
+        return self._session
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _should_retry(self, method: str, status: int | None, exc: BaseException | None) -> bool:
+        if isinstance(exc, aiohttp.ClientConnectorError):
+            return True
+        if status in _RETRY_ANY_STATUSES:
+            return True
+        if method not in _IDEMPOTENT_METHODS:
+            return False
+        return status in _RETRY_IDEMPOTENT_STATUSES or isinstance(
+            exc, (asyncio.TimeoutError, aiohttp.ServerDisconnectedError, aiohttp.ClientOSError)
+        )
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: dict[str, Any] | None = None,
+        json: Any = None,
+        headers: dict[str, str] | None = None,
+        timeout: aiohttp.ClientTimeout | None = None,
+        retries: int | None = None,
+    ) -> HttpResponse:
+        """Send a request; raises ``aiohttp.ClientError`` / ``asyncio.TimeoutError`` once retries run out."""
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                async with self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    json=json,
+                    headers=headers,
+                    timeout=timeout or self.timeout,
+                ) as response:
+                    result = HttpResponse(response.status, await response.text(errors="replace"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if attempt >= retries or not self._should_retry(method, None, exc):
+                    raise
+                logger.info("%s %s failed (%r), retrying", method, url, exc)
+            else:
+                if attempt >= retries or not self._should_retry(method, result.status, None):
+                    return result
+                logger.info("%s %s answered %s, retrying", method, url, result.status)
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+            self.retried += 1
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+IDEMPOTENCY_TTL_SECONDS = 600.0
+IDEMPOTENCY_MAX_ENTRIES = 10_000
+
+
+def _consume(future: asyncio.Future) -> None:
+    # Nobody may be waiting on a failed call; do not let asyncio log it as unretrieved.
+    if not future.cancelled():
+        future.exception()
+
+
+async def _lead(future: asyncio.Future, func: Callable[[], Awaitable[T]]) -> T:
+    try:
+        result = await func()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    future.set_result(result)
+    return result
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution.
+
+    The first caller runs the work, callers arriving while it is in flight wait
+    for its result (or its exception). Nothing is kept once it finishes.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        self._calls[key] = future
+        try:
+            return await _lead(future, func)
+        finally:
+            del self._calls[key]
+
+
+@dataclass(slots=True)
+class _Delivery:
+    future: asyncio.Future
+    created_at: float
+
+
+class IdempotencyCache:
+    """Results of recent deliveries by key, so a redelivery is not processed twice.
+
+    A repeat of a key that is still being processed waits for that run; a repeat of
+    one that finished within ``ttl`` gets the stored result. Failed runs are not
+    kept: the next delivery processes the update again. Bounded by ``max_entries``,
+    oldest first.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, _Delivery] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _prune(self, now: float) -> None:
+        entries = self._entries
+        while entries:
+            delivery = next(iter(entries.values()))
+            if len(entries) < self.max_entries and now - delivery.created_at < self.ttl:
+                break
+            entries.popitem(last=False)
+
+    def _lookup(self, key: Hashable, now: float) -> _Delivery | None:
+        self._prune(now)
+        delivery = self._entries.get(key)
+        if delivery is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return delivery
+
+    def seen(self, key: Hashable) -> bool:
+        """Record ``key``; True if it was already recorded within the window."""
+        now = time.monotonic()
+        if self._lookup(key, now) is not None:
+            return True
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        self._entries[key] = _Delivery(future, now)
+        return False
+
+    async def run(self, key: Hashable | None, func: Callable[[], Awaitable[T]]) -> T:
+        if key is None:
+            return await func()
+        now = time.monotonic()
+        delivery = self._lookup(key, now)
+        if delivery is not None:
+            return await asyncio.shield(delivery.future)
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        delivery = self._entries[key] = _Delivery(future, now)
+        try:
+            return await _lead(future, func)
+        except BaseException:
+            if self._entries.get(key) is delivery:
+                del self._entries[key]
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
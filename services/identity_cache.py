@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from itertools import chain
+from typing import Any
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import RegistryCounter, User, UserIdentity, User_volunteer, VolunteerIdentity
+from services.data_revision import revision_counters
+from services.platform import _normalize_external_user_id, is_schema_unavailable_error
+from services.stats import _increment_statement
+from services.write_coordinator import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+VOLUNTEER = "volunteer"
+
+IDENTITY_CACHE_TTL_SECONDS = 300.0
+IDENTITY_CACHE_NEGATIVE_TTL_SECONDS = 30.0
+IDENTITY_CACHE_MAX_SIZE = 50_000
+# How soon a change made by the other process (bot or dashboard) reaches this cache.
+IDENTITY_REVISION_POLL_SECONDS = 5.0
+# registry_counter rows "identity:<kind>:<provider>", one revision per scope of the cache.
+IDENTITY_REVISION_PREFIX = "identity:"
+# Scope of a deleted user or volunteer: entries of every provider may point at it.
+ANY_PROVIDER = "*"
+LAST_SEEN_FLUSH_SECONDS = 30.0
+_LAST_SEEN_CHUNK_SIZE = 500
+
+_IDENTITY_MODELS = {
+    USER: UserIdentity,
+    VOLUNTEER: VolunteerIdentity,
+}
+
+MISSING = object()
+
+_CHANGED_SCOPES = "identity_scopes_changed"
+_BUMPED_REVISIONS = "identity_revisions_bumped"
+
+
+def identity_revision_name(kind: str, provider: str) -> str:
+    return f"{IDENTITY_REVISION_PREFIX}{kind}:{provider}"
+
+
+def _changed_scopes(session: Session) -> set[tuple[str, str]]:
+    """(kind, provider) scopes whose cached lookups this flush can make wrong."""
+    scopes: set[tuple[str, str]] = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        # Loaded values only: a hook must not lazy-load.
+        state = inspect(obj)
+        if isinstance(obj, UserIdentity):
+            scopes.add((USER, state.dict.get("provider", ANY_PROVIDER)))
+        elif isinstance(obj, VolunteerIdentity):
+            scopes.add((VOLUNTEER, state.dict.get("provider", ANY_PROVIDER)))
+        elif isinstance(obj, (User, User_volunteer)):
+            kind = USER if isinstance(obj, User) else VOLUNTEER
+            if obj in session.deleted:
+                scopes.add((kind, ANY_PROVIDER))
+            elif obj in session.new:
+                if state.dict.get("tg_id") is not None:
+                    scopes.add((kind, "telegram"))
+            elif state.attrs.tg_id.history.has_changes():
+                # The legacy Telegram lookup still goes through tg_id.
+                scopes.add((kind, "telegram"))
+    return scopes
+
+
+class IdentityCache:
+    """TTL cache of ``(kind, provider, external_user_id) -> user/volunteer id``.
+
+    A cached ``None`` marks a known-unlinked identity and expires sooner. Writes in
+    this process invalidate their keys directly. Changes made by the other process
+    arrive through per-scope revisions: every commit that touches identity links,
+    ``tg_id`` or deletes a user / volunteer bumps ``identity:<kind>:<provider>``,
+    and ``sync_revision`` drops just the scopes whose revision moved because of
+    someone else's commit. Revisions this process produced are remembered and
+    skipped, so its own registrations do not empty the cache.
+    """
+
+    def __init__(
+        self,
+        ttl: float = IDENTITY_CACHE_TTL_SECONDS,
+        negative_ttl: float = IDENTITY_CACHE_NEGATIVE_TTL_SECONDS,
+        max_size: int = IDENTITY_CACHE_MAX_SIZE,
+    ) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple[str, str, str], tuple[float, int | None]] = OrderedDict()
+        self._revisions: dict[str, int] | None = None
+        self._own_revisions: dict[str, set[int]] = {}
+        self._tracking = False
+
+    @staticmethod
+    def _key(kind: str, provider: str, external_user_id: Any) -> tuple[str, str, str] | None:
+        normalized = _normalize_external_user_id(external_user_id)
+        if not normalized:
+            return None
+        return kind, provider, normalized
+
+    def get(self, kind: str, provider: str, external_user_id: Any):
+        key = self._key(kind, provider, external_user_id)
+        if key is None:
+            return MISSING
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, target_id = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return MISSING
+        self._entries.move_to_end(key)
+        return target_id
+
+    def set(self, kind: str, provider: str, external_user_id: Any, target_id: int | None) -> None:
+        key = self._key(kind, provider, external_user_id)
+        if key is None:
+            return
+        ttl = self.ttl if target_id is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, target_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, kind: str, provider: str, external_user_id: Any) -> None:
+        key = self._key(kind, provider, external_user_id)
+        if key is not None:
+            self._entries.pop(key, None)
+
+    def invalidate_target(self, kind: str, target_id: int) -> None:
+        stale = [
+            key for key, (_, cached_id) in self._entries.items()
+            if key[0] == kind and cached_id == target_id
+        ]
+        for key in stale:
+            self._entries.pop(key, None)
+
+    def invalidate_scope(self, kind: str, provider: str) -> None:
+        stale = [
+            key for key in self._entries
+            if key[0] == kind and (provider == ANY_PROVIDER or key[1] == provider)
+        ]
+        for key in stale:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def install_tracking(self) -> None:
+        """Bump the scope revisions on every ORM commit of this process."""
+        if self._tracking:
+            return
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "before_commit", self._before_commit)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        self._tracking = True
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        scopes = _changed_scopes(session)
+        if scopes:
+            session.info.setdefault(_CHANGED_SCOPES, set()).update(scopes)
+
+    def _before_commit(self, session: Session) -> None:
+        session.flush()
+        scopes = session.info.pop(_CHANGED_SCOPES, None)
+        if not scopes:
+            return
+        connection = session.connection()
+        stmt = _increment_statement(connection, {identity_revision_name(*scope): 1 for scope in scopes})
+        if not connection.dialect.insert_returning:
+            # Old SQLite: the bump still counts, it just reads as another process's.
+            connection.execute(stmt)
+            return
+        table = RegistryCounter.__table__
+        session.info[_BUMPED_REVISIONS] = connection.execute(stmt.returning(table.c.name, table.c.value)).all()
+
+    def _after_commit(self, session: Session) -> None:
+        for name, value in session.info.pop(_BUMPED_REVISIONS, ()):
+            self._own_revisions.setdefault(name, set()).add(value)
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop(_CHANGED_SCOPES, None)
+        session.info.pop(_BUMPED_REVISIONS, None)
+
+    async def sync_revision(self, session_factory=SessionLocal) -> int:
+        """Drop the scopes another process changed since the last call; returns how many."""
+        try:
+            revisions = await revision_counters(IDENTITY_REVISION_PREFIX, session_factory)
+        except SQLAlchemyError:
+            return 0
+        # On the first call there is nothing to compare with; after it a new counter started at 0.
+        previous, self._revisions = self._revisions, revisions
+        dropped = 0
+        for name, revision in revisions.items():
+            own = self._own_revisions.get(name, set())
+            mine = {value for value in own if value <= revision}
+            own -= mine
+            if previous is None:
+                continue
+            last = previous.get(name, 0)
+            if revision == last:
+                continue
+            if revision < last or len({value for value in mine if value > last}) < revision - last:
+                kind, provider = name[len(IDENTITY_REVISION_PREFIX):].split(":", 1)
+                self.invalidate_scope(kind, provider)
+                dropped += 1
+        return dropped
+
+
+class LastSeenUpdater:
+    """Coalesces identity touches into one batched ``last_seen_at`` UPDATE per group."""
+
+    def __init__(self, writer=write_coordinator) -> None:
+        self.writer = writer
+        self._pending: dict[tuple[str, str], dict[str, datetime]] = {}
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(group) for group in self._pending.values())
+
+    def touch(self, kind: str, provider: str, external_user_id: Any, seen_at: datetime | None = None) -> None:
+        normalized = _normalize_external_user_id(external_user_id)
+        if not normalized:
+            return
+        self._pending.setdefault((kind, provider), {})[normalized] = seen_at or datetime.utcnow()
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+
+        async def write(session) -> int:
+            flushed = 0
+            for (kind, provider), touches in pending.items():
+                model = _IDENTITY_MODELS[kind]
+                seen_at = max(touches.values())
+                external_ids = list(touches)
+                for start in range(0, len(external_ids), _LAST_SEEN_CHUNK_SIZE):
+                    chunk = external_ids[start:start + _LAST_SEEN_CHUNK_SIZE]
+                    await session.execute(
+                        update(model)
+                        .where(model.provider == provider)
+                        .where(model.external_user_id.in_(chunk))
+                        .values(last_seen_at=seen_at)
+                    )
+                flushed += len(external_ids)
+            return flushed
+
+        try:
+            return await self.writer.submit(write)
+        except SQLAlchemyError as exc:
+            if is_schema_unavailable_error(exc):
+                logger.info("last_seen_at flush skipped: platform schema is unavailable")
+                return 0
+            # Put the touches back so the next flush retries them.
+            for group_key, touches in pending.items():
+                current = self._pending.setdefault(group_key, {})
+                for external_id, seen_at in touches.items():
+                    if external_id not in current or current[external_id] < seen_at:
+                        current[external_id] = seen_at
+            logger.exception("last_seen_at flush failed, will retry")
+            return 0
+
+
+identity_cache = IdentityCache()
+last_seen_updater = LastSeenUpdater()
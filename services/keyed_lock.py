@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from typing import Hashable
+
+
+class KeyedLock:
+    """One ``asyncio.Lock`` per key, kept only while someone holds or waits on it.
+
+    Work on different keys runs concurrently, work on the same key stays ordered.
+    Locks live in a weak map: once the last ``async with`` for a key exits nothing
+    references the lock and it disappears, so the map is bounded by the number of
+    keys currently in use rather than by every key ever seen.
+    """
+
+    def __init__(self) -> None:
+        self._locks: weakref.WeakValueDictionary[Hashable, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def __call__(self, key: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def locked(self, key: Hashable) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, Sequence
+
+from sqlalchemy import Select, select, tuple_
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_SECONDS = 30.0
+COUNT_CACHE_MAX_ENTRIES = 1024
+
+_AFTER = "n"
+_BEFORE = "p"
+_LAST = "l"
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _b36(value: int) -> str:
+    if value == 0:
+        return "0"
+    digits = []
+    while value:
+        value, rem = divmod(value, 36)
+        digits.append(_DIGITS[rem])
+    return "".join(reversed(digits))
+
+
+@dataclass(frozen=True, slots=True)
+class Cursor:
+    """Position in a keyset-ordered list: rows after / before ``anchor_id``.
+
+    ``anchor_id=None`` with ``backward=True`` means the last page. ``page`` is only
+    carried along for the "N / M" indicator.
+    """
+
+    anchor_id: int | None
+    backward: bool = False
+    page: int = 0
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    # Short and free of "_" so it fits inside the existing callback_data formats.
+    if cursor.anchor_id is None:
+        return f"{_LAST}.{_b36(cursor.page)}"
+    kind = _BEFORE if cursor.backward else _AFTER
+    return f"{kind}{_b36(cursor.anchor_id)}.{_b36(cursor.page)}"
+
+
+def decode_cursor(token: str | None) -> Cursor | None:
+    """Parse a cursor token; anything malformed means "first page"."""
+    if not token:
+        return None
+    try:
+        head, page = token.split(".", 1)
+        kind, anchor = head[:1], head[1:]
+        page_index = int(page, 36)
+        if kind == _LAST and not anchor:
+            return Cursor(None, True, page_index)
+        if kind in (_AFTER, _BEFORE) and anchor:
+            return Cursor(int(anchor, 36), kind == _BEFORE, page_index)
+    except ValueError:
+        pass
+    return None
+
+
+def total_pages(total: int, per_page: int) -> int:
+    return max(1, (total + per_page - 1) // per_page)
+
+
+def last_page_cursor(total: int, per_page: int) -> str | None:
+    pages = total_pages(total, per_page)
+    return encode_cursor(Cursor(None, True, pages - 1)) if pages > 1 else None
+
+
+@dataclass(slots=True)
+class KeysetPage:
+    rows: list[Any] = field(default_factory=list)
+    page: int = 0
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+
+async def fetch_keyset_page(
+    session,
+    stmt: Select,
+    keys: Sequence[Any],
+    cursor: str | Cursor | None,
+    per_page: int,
+    *,
+    descending: bool = False,
+    scalars: bool = False,
+    total: int | None = None,
+    row_id: Callable[[Any], int] = lambda row: row.id,
+) -> KeysetPage:
+    """One page of ``stmt`` ordered by ``keys`` (the last key must be the unique id).
+
+    Instead of OFFSET the query seeks past the anchor row with a row-value comparison,
+    so every page costs the same regardless of depth. ``total`` sizes the last page so
+    page boundaries line up with page numbers.
+    """
+    if isinstance(cursor, str) or cursor is None:
+        cursor = decode_cursor(cursor)
+
+    backward = cursor is not None and cursor.backward
+    limit = per_page
+    query = stmt
+
+    if cursor is not None and cursor.anchor_id is not None:
+        if len(keys) == 1:
+            anchor_values: tuple[Any, ...] | None = (cursor.anchor_id,)
+        else:
+            row = (await session.execute(select(*keys[:-1]).where(keys[-1] == cursor.anchor_id))).first()
+            anchor_values = (*row, cursor.anchor_id) if row is not None else None
+        if anchor_values is None:
+            # The anchor row is gone; start over.
+            return await fetch_keyset_page(
+                session, stmt, keys, None, per_page,
+                descending=descending, scalars=scalars, total=total, row_id=row_id,
+            )
+        left = keys[0] if len(keys) == 1 else tuple_(*keys)
+        right = anchor_values[0] if len(keys) == 1 else tuple_(*anchor_values)
+        query = query.where(left < right if descending != backward else left > right)
+    elif cursor is not None and total is not None:
+        # Last page: only the remainder after the full pages.
+        limit = max(1, min(per_page, total - cursor.page * per_page))
+
+    reverse = descending != backward
+    query = query.order_by(*(key.desc() if reverse else key.asc() for key in keys)).limit(limit + 1)
+    result = await session.execute(query)
+    rows = list(result.scalars().all() if scalars else result.all())
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+        if cursor.anchor_id is not None and not has_more and cursor.page > 0:
+            # Ran into the start earlier than the page number says: show the real first page.
+            return await fetch_keyset_page(
+                session, stmt, keys, None, per_page,
+                descending=descending, scalars=scalars, total=total, row_id=row_id,
+            )
+
+    if cursor is None:
+        page_index = 0
+        has_prev = False
+        has_next = has_more
+    elif backward:
+        page_index = cursor.page
+        has_prev = has_more if cursor.anchor_id is not None else page_index > 0
+        has_next = cursor.anchor_id is not None
+    else:
+        page_index = cursor.page
+        has_prev = True
+        has_next = has_more
+
+    page = KeysetPage(rows=rows, page=page_index)
+    if rows and has_next:
+        page.next_cursor = encode_cursor(Cursor(row_id(rows[-1]), False, page_index + 1))
+    if rows and has_prev and page_index > 0:
+        page.prev_cursor = encode_cursor(Cursor(row_id(rows[0]), True, page_index - 1))
+    return page
+
+
+class CountCache:
+    """Short-lived cache for list totals so page turns don't re-run COUNT(*)."""
+
+    def __init__(self, ttl: float = COUNT_CACHE_SECONDS, max_entries: int = COUNT_CACHE_MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[float, int]] = OrderedDict()
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[int]]) -> int:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        value = int(await compute() or 0)
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+count_cache = CountCache()
@@ -2,7 +2,7 @@
 
 import logging
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterable
 
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
@@ -321,6 +321,50 @@ class RoleService:
         except SQLAlchemyError as exc:
             _raise_schema_unavailable(exc, "platform role grant")
 
+    @classmethod
+    async def grant_roles(
+        cls,
+        session,
+        provider: str,
+        role_map: dict[str, Iterable[Any]],
+    ) -> int:
+        """Grant missing roles with one SELECT and one flush; returns the number of new rows."""
+        wanted = {
+            (normalized, role)
+            for role, external_user_ids in role_map.items()
+            for normalized in map(_normalize_external_user_id, external_user_ids)
+            if normalized
+        }
+        if not wanted:
+            return 0
+
+        try:
+            existing = set(
+                (
+                    await session.execute(
+                        select(PlatformRole.external_user_id, PlatformRole.role)
+                        .where(PlatformRole.provider == provider)
+                        .where(PlatformRole.role.in_({role for _, role in wanted}))
+                    )
+                ).all()
+            )
+            now = datetime.utcnow()
+            missing = sorted(wanted - existing)
+            session.add_all(
+                PlatformRole(
+                    provider=provider,
+                    external_user_id=external_user_id,
+                    role=role,
+                    granted_at=now,
+                    updated_at=now,
+                )
+                for external_user_id, role in missing
+            )
+            await session.flush()
+            return len(missing)
+        except SQLAlchemyError as exc:
+            _raise_schema_unavailable(exc, "platform role grant")
+
 
 async def sync_telegram_platform_data(
     admin_ids: list[int],
@@ -352,21 +396,15 @@ async def sync_telegram_platform_data(
                 if linked is not None:
                     summary["volunteer_identities"] += 1
 
-            role_map = {
-                "admin": set(admin_ids),
-                "superadmin": set(superadmin_ids),
-                "developer": set(developer_ids),
-            }
-            for role_name, role_ids in role_map.items():
-                for external_user_id in role_ids:
-                    granted = await RoleService.grant_role(
-                        session=session,
-                        provider="telegram",
-                        external_user_id=external_user_id,
-                        role=role_name,
-                    )
-                    if granted is not None:
-                        summary["roles"] += 1
+            summary["roles"] = await RoleService.grant_roles(
+                session=session,
+                provider="telegram",
+                role_map={
+                    "admin": admin_ids,
+                    "superadmin": superadmin_ids,
+                    "developer": developer_ids,
+                },
+            )
 
             await session.commit()
             return summary
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import event, func, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import SessionLocal, engine
+from models import ConversationState, PlatformRole, User, UserIdentity, User_volunteer
+from services.read_models import user_profile_query, user_row_query, user_summary_query
+from services.search_index import search_index
+
+logger = logging.getLogger(__name__)
+
+# "SCAN user" is a full table scan; "SCAN user USING INDEX ..." walks an index in
+# order (bounded by LIMIT or a partial index) and is fine.
+_FULL_SCAN = re.compile(r"^SCAN \w+(?!\w| USING| VIRTUAL TABLE)")
+
+QueryBuilder = Callable[[], Awaitable[object]]
+HOT_QUERIES: dict[str, QueryBuilder] = {}
+
+
+def hot_query(name: str):
+    """Register a representative statement for a query that runs on every request."""
+    def register(build: QueryBuilder) -> QueryBuilder:
+        HOT_QUERIES[name] = build
+        return build
+    return register
+
+
+@dataclass(frozen=True, slots=True)
+class PlanViolation:
+    query: str
+    detail: str
+
+    def __str__(self) -> str:
+        return f"{self.query}: {self.detail}"
+
+
+class PlanRecorder:
+    """Runs ``EXPLAIN QUERY PLAN`` for every SELECT the engine executes while active.
+
+    The plan is taken on the same cursor with the same bound parameters, just before
+    the real statement, so it matches what SQLite actually does for that query.
+    """
+
+    def __init__(self, target=engine) -> None:
+        self.target = target.sync_engine if hasattr(target, "sync_engine") else target
+        self.plans: list[tuple[str, list[str]]] = []
+
+    def __enter__(self) -> "PlanRecorder":
+        event.listen(self.target, "before_cursor_execute", self._explain)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(self.target, "before_cursor_execute", self._explain)
+
+    def _explain(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        self.plans.append((statement, [row[-1] for row in cursor.fetchall()]))
+
+    def full_scans(self) -> list[str]:
+        return [detail for _, details in self.plans for detail in details if _FULL_SCAN.match(detail)]
+
+
+@hot_query("user by tg_id")
+async def _user_by_tg_id():
+    return select(User).where(User.tg_id == 1)
+
+
+@hot_query("volunteer by tg_id")
+async def _volunteer_by_tg_id():
+    return select(User_volunteer).where(User_volunteer.tg_id == 1)
+
+
+@hot_query("user profile")
+async def _user_profile():
+    return user_profile_query().where(User.id == 1)
+
+
+@hot_query("user by identity")
+async def _user_by_identity():
+    return (
+        select(User)
+        .join(UserIdentity, UserIdentity.user_id == User.id)
+        .where(UserIdentity.provider == "max", UserIdentity.external_user_id == "1")
+    )
+
+
+@hot_query("identities of user")
+async def _identities_of_user():
+    return select(UserIdentity).where(UserIdentity.user_id == 1)
+
+
+@hot_query("platform role")
+async def _platform_role():
+    return select(PlatformRole).where(
+        PlatformRole.provider == "telegram", PlatformRole.external_user_id == "1", PlatformRole.role == "admin"
+    )
+
+
+@hot_query("conversation state")
+async def _conversation_state():
+    return select(ConversationState).where(ConversationState.storage_key == "telegram:1:1")
+
+
+@hot_query("expired conversation states")
+async def _expired_conversation_states():
+    return (
+        select(ConversationState.id)
+        .where(ConversationState.provider == "telegram", ConversationState.updated_at < datetime.utcnow())
+        .limit(500)
+    )
+
+
+@hot_query("users by status, next page")
+async def _users_by_status():
+    return (
+        user_summary_query()
+        .where(User.status == "registered", User.id > 1)
+        .order_by(User.id)
+        .limit(11)
+    )
+
+
+@hot_query("dashboard users by status, next page")
+async def _dashboard_users_by_status():
+    return (
+        user_row_query()
+        .where(User.status == "registered", User.id < 1_000_000)
+        .order_by(User.id.desc())
+        .limit(21)
+    )
+
+
+@hot_query("company staff, next page")
+async def _company_staff():
+    keys = (User.last_name, User.first_name, User.id)
+    return (
+        user_summary_query()
+        .where(User.company_id == 1, tuple_(*keys) > tuple_("А", "А", 1))
+        .order_by(*keys)
+        .limit(11)
+    )
+
+
+@hot_query("company status counts")
+async def _company_status_counts():
+    return select(User.status, func.count(User.id)).where(User.company_id == 1).group_by(User.status)
+
+
+@hot_query("volunteer registrations")
+async def _volunteer_registrations():
+    return (
+        select(User.volunteer_id, func.count(User.id))
+        .where(User.volunteer_id.isnot(None), User.status == "registered")
+        .group_by(User.volunteer_id)
+    )
+
+
+@hot_query("registration windows")
+async def _registration_windows():
+    since = datetime.utcnow() - timedelta(days=30)
+    return select(func.count(User.id)).where(User.status == "registered", User.registered_at >= since)
+
+
+@hot_query("user search")
+async def _user_search():
+    return select(User.id).where(await search_index.user_condition("Иванов")).order_by(User.id).limit(11)
+
+
+async def check_query_plans(session_factory=SessionLocal) -> list[PlanViolation]:
+    """Full table scans in the plans of ``HOT_QUERIES``; empty if every one uses an index."""
+    violations: list[PlanViolation] = []
+    async with session_factory() as session:
+        if session.bind.dialect.name != "sqlite":
+            return violations
+        for name, build in HOT_QUERIES.items():
+            stmt = await build()
+            with PlanRecorder(session.bind) as recorder:
+                await session.execute(stmt)
+            violations.extend(PlanViolation(name, detail) for detail in recorder.full_scans())
+    return violations
+
+
+async def log_query_plan_violations() -> None:
+    try:
+        violations = await check_query_plans()
+    except SQLAlchemyError:
+        logger.warning("Query plan check failed", exc_info=True)
+        return
+    for violation in violations:
+        logger.warning("Hot query does a full table scan: %s", violation)
+
+
+async def _main() -> int:
+    violations = await check_query_plans()
+    for violation in violations:
+        print(f"FULL SCAN  {violation}")
+    print(f"{len(HOT_QUERIES)} hot queries checked, {len(violations)} full scans")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    # python -m services.query_plans: exits 1 if any hot query scans a whole table.
+    sys.exit(asyncio.run(_main()))
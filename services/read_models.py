@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from sqlalchemy import Select, String, cast, func, literal, select
+
+from services.unit_of_work import read_session
+from models import Company, User, User_volunteer
+
+
+@dataclass(frozen=True, slots=True)
+class UserSummary:
+    """One row of a bot list: what a list button shows."""
+
+    id: int
+    last_name: str | None
+    first_name: str | None
+    father_name: str | None
+    status: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    """One row of the dashboard users table."""
+
+    id: int
+    last_name: str | None
+    first_name: str | None
+    father_name: str | None
+    phone_number: str | None
+    date_of_birth: date | None
+    address: str | None
+    status: str | None
+    company_id: int | None
+    company_name: str | None
+    registered_at: datetime | None
+    tg_id: int | None
+
+
+@dataclass(frozen=True, slots=True)
+class UserProfile:
+    """A user with company and volunteer names, for cards and profile screens."""
+
+    id: int
+    last_name: str | None
+    first_name: str | None
+    father_name: str | None
+    passport_number: str | None
+    date_of_birth: date | None
+    phone_number: str | None
+    address: str | None
+    status: str | None
+    tg_id: int | None
+    registered_at: datetime | None
+    blocked_at: datetime | None
+    sms_code: str | None
+    sms_confirmed_at: datetime | None
+    company_id: int | None
+    company_name: str | None
+    volunteer_id: int | None
+    volunteer_name: str | None
+
+
+_SUMMARY_COLUMNS = (
+    User.id,
+    User.last_name,
+    User.first_name,
+    User.father_name,
+    User.status,
+)
+
+_ROW_COLUMNS = (
+    User.id,
+    User.last_name,
+    User.first_name,
+    User.father_name,
+    User.phone_number,
+    User.date_of_birth,
+    User.address,
+    User.status,
+    User.company_id,
+    Company.name.label("company_name"),
+    User.registered_at,
+    User.tg_id,
+)
+
+_PROFILE_COLUMNS = (
+    User.id,
+    User.last_name,
+    User.first_name,
+    User.father_name,
+    User.passport_number,
+    User.date_of_birth,
+    User.phone_number,
+    User.address,
+    User.status,
+    User.tg_id,
+    User.registered_at,
+    User.blocked_at,
+    User.sms_code,
+    User.sms_confirmed_at,
+    User.company_id,
+    Company.name.label("company_name"),
+    User.volunteer_id,
+    # Volunteer name, "#<id>" if it has none, NULL if the volunteer row is gone.
+    func.coalesce(
+        User_volunteer.name, literal("#", String) + cast(User_volunteer.id, String)
+    ).label("volunteer_name"),
+)
+
+
+def user_summary_query() -> Select:
+    """Column projection for bot lists; add filters and turn the rows into DTOs with ``to_summaries``."""
+    return select(*_SUMMARY_COLUMNS)
+
+
+def user_row_query() -> Select:
+    return select(*_ROW_COLUMNS).outerjoin(Company, Company.id == User.company_id)
+
+
+def user_profile_query() -> Select:
+    return (
+        select(*_PROFILE_COLUMNS)
+        .outerjoin(Company, Company.id == User.company_id)
+        .outerjoin(User_volunteer, User_volunteer.id == User.volunteer_id)
+    )
+
+
+def to_summaries(rows) -> list[UserSummary]:
+    return [UserSummary(*row) for row in rows]
+
+
+def to_user_rows(rows) -> list[UserRow]:
+    return [UserRow(*row) for row in rows]
+
+
+async def load_user_profile(user_id: int, session=None) -> UserProfile | None:
+    """User, company and volunteer in one joined query."""
+    stmt = user_profile_query().where(User.id == user_id)
+    if session is not None:
+        row = (await session.execute(stmt)).first()
+    else:
+        async with read_session() as own_session:
+            row = (await own_session.execute(stmt)).first()
+    return UserProfile(*row) if row is not None else None
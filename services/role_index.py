@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import SessionLocal
+from models import PlatformRole
+from services.platform import _normalize_external_user_id, _raise_schema_unavailable
+
+logger = logging.getLogger(__name__)
+
+ROLE_INDEX_POLL_SECONDS = 15.0
+
+_EMPTY: frozenset[str] = frozenset()
+
+
+class RoleIndex:
+    """In-memory view of ``platform_role``: identity -> role set and role -> identities."""
+
+    def __init__(self, session_factory=SessionLocal) -> None:
+        self.session_factory = session_factory
+        self._roles: dict[tuple[str, str], frozenset[str]] = {}
+        self._members: dict[tuple[str, str], frozenset[str]] = {}
+        self._fingerprint: tuple[Any, ...] | None = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    async def _read_fingerprint(self, session) -> tuple[Any, ...]:
+        row = (
+            await session.execute(
+                select(
+                    func.count(PlatformRole.id),
+                    func.max(PlatformRole.id),
+                    func.max(PlatformRole.updated_at),
+                )
+            )
+        ).one()
+        return tuple(row)
+
+    async def load(self) -> None:
+        async with self._lock:
+            try:
+                async with self.session_factory() as session:
+                    fingerprint = await self._read_fingerprint(session)
+                    rows = (
+                        await session.execute(
+                            select(PlatformRole.provider, PlatformRole.external_user_id, PlatformRole.role)
+                        )
+                    ).all()
+            except SQLAlchemyError as exc:
+                _raise_schema_unavailable(exc, "platform role index")
+
+            roles: dict[tuple[str, str], set[str]] = {}
+            members: dict[tuple[str, str], set[str]] = {}
+            for provider, external_user_id, role in rows:
+                roles.setdefault((provider, external_user_id), set()).add(role)
+                members.setdefault((provider, role), set()).add(external_user_id)
+
+            self._roles = {key: frozenset(value) for key, value in roles.items()}
+            self._members = {key: frozenset(value) for key, value in members.items()}
+            self._fingerprint = fingerprint
+            self._loaded = True
+            logger.info("Role index loaded: %s role grants", len(rows))
+
+    async def refresh(self) -> bool:
+        """Reload if ``platform_role`` changed since the last load."""
+        try:
+            async with self.session_factory() as session:
+                fingerprint = await self._read_fingerprint(session)
+        except SQLAlchemyError as exc:
+            _raise_schema_unavailable(exc, "platform role index")
+        if self._loaded and fingerprint == self._fingerprint:
+            return False
+        await self.load()
+        return True
+
+    def roles_for(self, external_user_id: Any, provider: str = "telegram") -> frozenset[str]:
+        normalized = _normalize_external_user_id(external_user_id)
+        if not normalized:
+            return _EMPTY
+        return self._roles.get((provider, normalized), _EMPTY)
+
+    def has_role(self, external_user_id: Any, role: str, provider: str = "telegram") -> bool:
+        return role in self.roles_for(external_user_id, provider)
+
+    def members(self, role: str, provider: str = "telegram") -> frozenset[str]:
+        return self._members.get((provider, role), _EMPTY)
+
+
+role_index = RoleIndex()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select
+
+from db import SessionLocal
+from models import User
+from services.unit_of_work import read_session
+
+logger = logging.getLogger(__name__)
+
+ROSTER_REFRESH_SECONDS = 300.0
+
+
+def normalize_surname(value: str | None) -> str:
+    if not value:
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+
+@dataclass(frozen=True, slots=True)
+class RosterEntry:
+    id: int
+    date_of_birth: date
+    status: Optional[str]
+
+
+class RosterIndex:
+    """In-memory ``surname -> [(dob day number, user id, status)]`` roster for registration lookups."""
+
+    def __init__(self, session_factory=SessionLocal) -> None:
+        self.session_factory = session_factory
+        self._by_surname: dict[str, list[tuple[int, int, Optional[str]]]] = {}
+        self._surname_by_id: dict[int, str] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._surname_by_id)
+
+    async def load(self) -> None:
+        stmt = select(User.id, User.last_name, User.date_of_birth, User.status)
+        by_surname: dict[str, list[tuple[int, int, Optional[str]]]] = {}
+        surname_by_id: dict[int, str] = {}
+
+        async with self.session_factory() as session:
+            result = await session.execute(stmt)
+            for user_id, last_name, date_of_birth, status in result:
+                key = self._key(last_name)
+                if not key or date_of_birth is None:
+                    continue
+                by_surname.setdefault(key, []).append(
+                    (date_of_birth.toordinal(), user_id, self._intern(status))
+                )
+                surname_by_id[user_id] = key
+
+        # Swap whole dicts so concurrent readers never see a half-built index.
+        self._by_surname = by_surname
+        self._surname_by_id = surname_by_id
+        self._loaded = True
+        logger.info("Roster index loaded: %s users, %s surnames", len(surname_by_id), len(by_surname))
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.load()
+
+    async def surname_exists(self, surname: str | None) -> bool:
+        await self.ensure_loaded()
+        return normalize_surname(surname) in self._by_surname
+
+    async def find(self, surname: str | None, date_of_birth: date) -> RosterEntry | None:
+        """The matching person, with ``status`` read from the DB rather than the snapshot.
+
+        The index only narrows the lookup down to an id: it is refreshed every
+        ``ROSTER_REFRESH_SECONDS``, and the other process (bot or dashboard) may have
+        registered the person since.
+        """
+        await self.ensure_loaded()
+        bucket = self._by_surname.get(normalize_surname(surname))
+        if not bucket:
+            return None
+        day = date_of_birth.toordinal()
+        user_id = next((entry_id for entry_day, entry_id, _ in bucket if entry_day == day), None)
+        if user_id is None:
+            return None
+        return await self._confirmed(user_id, date_of_birth)
+
+    async def get(self, user_id: int) -> RosterEntry | None:
+        """The person by id, with ``status`` read from the DB as in ``find``."""
+        await self.ensure_loaded()
+        key = self._surname_by_id.get(user_id)
+        if key is None:
+            return None
+        for day, entry_id, _ in self._by_surname.get(key, ()):
+            if entry_id == user_id:
+                return await self._confirmed(user_id, date.fromordinal(day))
+        return None
+
+    async def _confirmed(self, user_id: int, date_of_birth: date) -> RosterEntry | None:
+        async with read_session() as session:
+            found = (await session.execute(select(User.id, User.status).where(User.id == user_id))).one_or_none()
+        if found is None:
+            self.discard(user_id)
+            return None
+        self.set_status(user_id, found.status)
+        return RosterEntry(id=user_id, date_of_birth=date_of_birth, status=found.status)
+
+    def upsert(self, user_id: int, last_name: str | None, date_of_birth: date | None, status: str | None) -> None:
+        if not self._loaded:
+            return
+        self.discard(user_id)
+        key = self._key(last_name)
+        if not key or date_of_birth is None:
+            return
+        self._by_surname.setdefault(key, []).append(
+            (date_of_birth.toordinal(), user_id, self._intern(status))
+        )
+        self._surname_by_id[user_id] = key
+
+    def set_status(self, user_id: int, status: str | None) -> None:
+        key = self._surname_by_id.get(user_id)
+        if key is None:
+            return
+        bucket = self._by_surname.get(key, [])
+        for position, (day, entry_id, _) in enumerate(bucket):
+            if entry_id == user_id:
+                bucket[position] = (day, entry_id, self._intern(status))
+                return
+
+    def discard(self, user_id: int) -> None:
+        key = self._surname_by_id.pop(user_id, None)
+        if key is None:
+            return
+        bucket = self._by_surname.get(key)
+        if not bucket:
+            return
+        bucket[:] = [item for item in bucket if item[1] != user_id]
+        if not bucket:
+            del self._by_surname[key]
+
+    @staticmethod
+    def _key(last_name: str | None) -> str:
+        key = normalize_surname(last_name)
+        return sys.intern(key) if key else key
+
+    @staticmethod
+    def _intern(value: str | None) -> Optional[str]:
+        return sys.intern(value) if value else value
+
+
+roster_index = RosterIndex()
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+
+from sqlalchemy import false, func, or_, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import SessionLocal
+from models import Company, User
+
+logger = logging.getLogger(__name__)
+
+# The trigram tokenizer needs at least three characters to use the index.
+MIN_INDEXED_QUERY_LENGTH = 3
+_TRIGRAM_MIN_SQLITE = (3, 34, 0)
+
+
+def _fold_sql(expr: str) -> str:
+    # Case folding is done by the tokenizer (case_sensitive 0); ё/Ё are folded here.
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+_USER_NAME_SQL = _fold_sql(
+    "trim(coalesce({t}.last_name, '') || ' ' || coalesce({t}.first_name, '') || ' ' || coalesce({t}.father_name, ''))"
+)
+_USER_PHONE_SQL = "coalesce({t}.phone_number, '')"
+_COMPANY_NAME_SQL = _fold_sql("coalesce({t}.name, '')")
+
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(name, phone, tokenize = 'trigram case_sensitive 0')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS company_search USING fts5(name, tokenize = 'trigram case_sensitive 0')",
+    f"""CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_search(rowid, name, phone)
+        VALUES (new.id, {_USER_NAME_SQL.format(t='new')}, {_USER_PHONE_SQL.format(t='new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON "user" BEGIN
+        DELETE FROM user_search WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_search_au
+    AFTER UPDATE OF last_name, first_name, father_name, phone_number ON "user" BEGIN
+        DELETE FROM user_search WHERE rowid = old.id;
+        INSERT INTO user_search(rowid, name, phone)
+        VALUES (new.id, {_USER_NAME_SQL.format(t='new')}, {_USER_PHONE_SQL.format(t='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS company_search_ai AFTER INSERT ON company BEGIN
+        INSERT INTO company_search(rowid, name) VALUES (new.id, {_COMPANY_NAME_SQL.format(t='new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS company_search_ad AFTER DELETE ON company BEGIN
+        DELETE FROM company_search WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS company_search_au AFTER UPDATE OF name ON company BEGIN
+        DELETE FROM company_search WHERE rowid = old.id;
+        INSERT INTO company_search(rowid, name) VALUES (new.id, {_COMPANY_NAME_SQL.format(t='new')});
+    END""",
+)
+
+SEARCH_INDEX_FILL = (
+    "DELETE FROM user_search",
+    f"""INSERT INTO user_search(rowid, name, phone)
+    SELECT u.id, {_USER_NAME_SQL.format(t='u')}, {_USER_PHONE_SQL.format(t='u')} FROM "user" AS u""",
+    "DELETE FROM company_search",
+    f"""INSERT INTO company_search(rowid, name)
+    SELECT c.id, {_COMPANY_NAME_SQL.format(t='c')} FROM company AS c""",
+)
+
+SEARCH_TABLES = ("user_search", "company_search")
+
+
+def ensure_search_index(connection) -> bool:
+    """Create the SQLite FTS5 search tables and triggers if missing (sync, for ``run_sync``)."""
+    if connection.dialect.name != "sqlite" or sqlite3.sqlite_version_info < _TRIGRAM_MIN_SQLITE:
+        return False
+
+    existing = {
+        row[0]
+        for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('user_search', 'company_search')")
+        )
+    }
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    if existing != set(SEARCH_TABLES):
+        for statement in SEARCH_INDEX_FILL:
+            connection.execute(text(statement))
+        logger.info("Search index built")
+    return True
+
+
+def normalize_query(query: str) -> str:
+    return query.replace("ё", "е").replace("Ё", "Е")
+
+
+def _match_phrase(query: str) -> str:
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _folded(column):
+    return func.replace(func.replace(column, "ё", "е"), "Ё", "Е")
+
+
+def _like_variants(column, query: str):
+    # SQLite LIKE folds ASCII only, so Cyrillic needs explicit case variants.
+    patterns = {f"%{variant}%" for variant in (query, query.lower(), query.upper(), query.capitalize())}
+    return [column.like(pattern) for pattern in patterns]
+
+
+class SearchIndex:
+    """Substring search over users and companies.
+
+    On SQLite the trigram FTS5 tables ``user_search`` / ``company_search`` are used
+    (kept in sync by triggers); PostgreSQL uses ILIKE, and queries shorter than a
+    trigram fall back to LIKE. ё is matched as е everywhere, as the index does.
+    """
+
+    def __init__(self, session_factory=SessionLocal) -> None:
+        self.session_factory = session_factory
+        self._dialect: str | None = None
+        self._indexed: bool | None = None
+
+    async def _detect(self) -> None:
+        if self._indexed is not None:
+            return
+        async with self.session_factory() as session:
+            self._dialect = session.bind.dialect.name
+            self._indexed = False
+            if self._dialect == "sqlite":
+                try:
+                    rows = await session.execute(
+                        text("SELECT name FROM sqlite_master WHERE name IN ('user_search', 'company_search')")
+                    )
+                    self._indexed = {row[0] for row in rows} == set(SEARCH_TABLES)
+                except SQLAlchemyError:
+                    logger.warning("Search index lookup failed, using LIKE search", exc_info=True)
+
+    async def user_condition(self, query: str):
+        """WHERE clause for ``User`` matching ФИО / phone, or the exact ID for numeric queries."""
+        await self._detect()
+        query = normalize_query(" ".join(query.split()))
+        if not query:
+            return false()
+
+        if self._indexed and len(query) >= MIN_INDEXED_QUERY_LENGTH:
+            matched = select(text("rowid")).select_from(text("user_search")).where(
+                text("user_search MATCH :user_query").bindparams(user_query=_match_phrase(query))
+            )
+            condition = User.id.in_(matched)
+        elif self._dialect == "postgresql":
+            pattern = f"%{query}%"
+            condition = or_(
+                _folded(User.last_name).ilike(pattern),
+                _folded(User.first_name).ilike(pattern),
+                _folded(User.father_name).ilike(pattern),
+                User.phone_number.ilike(pattern),
+            )
+        else:
+            condition = or_(
+                *_like_variants(_folded(User.last_name), query),
+                *_like_variants(_folded(User.first_name), query),
+                *_like_variants(_folded(User.father_name), query),
+                User.phone_number.like(f"%{query}%"),
+            )
+
+        if query.isdigit():
+            condition = condition | (User.id == int(query))
+        return condition
+
+    async def company_condition(self, query: str):
+        """WHERE clause for ``Company`` matching the name, or the exact ID for numeric queries."""
+        await self._detect()
+        query = normalize_query(" ".join(query.split()))
+        if not query:
+            return false()
+
+        if self._indexed and len(query) >= MIN_INDEXED_QUERY_LENGTH:
+            matched = select(text("rowid")).select_from(text("company_search")).where(
+                text("company_search MATCH :company_query").bindparams(company_query=_match_phrase(query))
+            )
+            condition = Company.id.in_(matched)
+        elif self._dialect == "postgresql":
+            condition = _folded(Company.name).ilike(f"%{query}%")
+        else:
+            condition = or_(*_like_variants(_folded(Company.name), query))
+
+        if query.isdigit():
+            condition = condition | (Company.id == int(query))
+        return condition
+
+
+search_index = SearchIndex()
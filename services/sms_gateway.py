@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from random import randint
+from typing import Any, Protocol
+
+import aiohttp
+
+from services.http_client import HttpClient, http_client
+from services.keyed_lock import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+SMSC_SEND_URL = "https://smsc.ru/sys/send.php"
+SMSC_STATUS_URL = "https://smsc.ru/sys/status.php"
+SMSC_LOGIN = os.environ.get("SMSC_LOGIN", "lgjt")
+SMSC_PASSWORD = os.environ.get("SMSC_PASSWORD", "123456")
+SMSC_SENDER = os.environ.get("SMSC_SENDER", "kotelnikiru")
+SMS_TRANSPORT = os.environ.get("SMS_TRANSPORT", "smsc")
+SMS_API_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5, sock_read=10)
+
+SMS_CODE_MESSAGE = "Ваш код для подтверждения: {code}"
+# A repeated "send code" inside this window gets the code already on its way.
+SMS_RESEND_COOLDOWN_SECONDS = 60.0
+# Paid sends per phone within SMS_SEND_LIMIT_WINDOW_SECONDS; further requests are refused.
+SMS_SEND_LIMIT = 5
+SMS_SEND_LIMIT_WINDOW_SECONDS = 3600.0
+SMS_STATUS_POLL_SECONDS = 30.0
+SMS_STATUS_BATCH_SIZE = 50
+SMS_STATUS_GIVE_UP_SECONDS = 1800.0
+SMS_LATENCY_SAMPLES = 200
+
+# smsc.ru status codes: -1 queued, 0 handed to the operator, 1 delivered, the rest are final failures.
+SMSC_DELIVERED = 1
+_SMSC_PENDING_STATUSES = frozenset({-1, 0})
+
+
+class SmsError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class SmsStatus:
+    code: int
+    final: bool
+    delivered: bool
+    error: str | None = None
+
+
+class SmsTransport(Protocol):
+    async def send(self, phone: str, message: str) -> str:
+        """Send one message; returns the provider message id, raises ``SmsError`` on failure."""
+
+    async def statuses(self, messages: list[tuple[str, str]]) -> dict[str, SmsStatus]:
+        """Statuses for ``(message_id, phone)`` pairs; unknown ids may be left out."""
+
+
+def _smsc_status(code: int, error: Any = None) -> SmsStatus:
+    return SmsStatus(
+        code=code,
+        final=code not in _SMSC_PENDING_STATUSES,
+        delivered=code == SMSC_DELIVERED,
+        error=str(error) if error not in (None, 0, "0") else None,
+    )
+
+
+class SmscTransport:
+    """smsc.ru over the shared HTTP client, JSON answers (``fmt=3``)."""
+
+    def __init__(
+        self,
+        login: str = SMSC_LOGIN,
+        password: str = SMSC_PASSWORD,
+        sender: str = SMSC_SENDER,
+        http: HttpClient = http_client,
+        timeout: aiohttp.ClientTimeout = SMS_API_TIMEOUT,
+    ) -> None:
+        self.login = login
+        self.password = password
+        self.sender = sender
+        self.http = http
+        self.timeout = timeout
+
+    async def _call(self, url: str, params: dict[str, Any]) -> Any:
+        params = {"login": self.login, "psw": self.password, "fmt": 3, **params}
+        try:
+            response = await self.http.request("POST", url, params=params, timeout=self.timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise SmsError(f"smsc.ru request failed: {exc!r}") from exc
+        if not response.ok:
+            raise SmsError(f"smsc.ru HTTP {response.status}: {response.text.strip()}")
+        try:
+            payload = json.loads(response.text)
+        except ValueError as exc:
+            raise SmsError(f"smsc.ru answered non-JSON: {response.text.strip()!r}") from exc
+        if isinstance(payload, dict) and "error" in payload:
+            raise SmsError(f"smsc.ru error {payload.get('error_code')}: {payload['error']}")
+        return payload
+
+    async def send(self, phone: str, message: str) -> str:
+        payload = await self._call(
+            SMSC_SEND_URL, {"phones": phone, "mes": message, "sender": self.sender}
+        )
+        if not isinstance(payload, dict) or "id" not in payload:
+            raise SmsError(f"smsc.ru answered without a message id: {payload!r}")
+        return str(payload["id"])
+
+    async def statuses(self, messages: list[tuple[str, str]]) -> dict[str, SmsStatus]:
+        if not messages:
+            return {}
+        # One request for the whole batch: comma-separated ids and phones, pairwise.
+        payload = await self._call(
+            SMSC_STATUS_URL,
+            {
+                "id": ",".join(message_id for message_id, _ in messages),
+                "phone": ",".join(phone for _, phone in messages),
+            },
+        )
+        items = payload if isinstance(payload, list) else [payload]
+        result: dict[str, SmsStatus] = {}
+        for (message_id, _), item in zip(messages, items):
+            if not isinstance(item, dict) or "status" not in item:
+                continue
+            result[str(item.get("id", message_id))] = _smsc_status(int(item["status"]), item.get("err"))
+        return result
+
+
+class FakeSmsTransport:
+    """Sends nothing: keeps messages in memory and reports them delivered. For local runs."""
+
+    def __init__(self) -> None:
+        self.sent: list[tuple[str, str, str]] = []
+        self._ids = itertools.count(1)
+
+    async def send(self, phone: str, message: str) -> str:
+        message_id = str(next(self._ids))
+        self.sent.append((message_id, phone, message))
+        logger.info("Fake SMS %s to %s: %s", message_id, phone, message)
+        return message_id
+
+    async def statuses(self, messages: list[tuple[str, str]]) -> dict[str, SmsStatus]:
+        return {message_id: _smsc_status(SMSC_DELIVERED) for message_id, _ in messages}
+
+
+@dataclass(slots=True)
+class _PhoneHistory:
+    code: str
+    sent_at: float
+    sends: list[float]
+
+
+@dataclass(slots=True)
+class _SentMessage:
+    message_id: str
+    phone: str
+    sent_at: float
+
+
+class SmsGateway:
+    """Confirmation codes over a pluggable transport.
+
+    Per phone it remembers the last code and recent paid sends (in memory, per
+    process): a repeated request inside the cooldown returns the code already sent
+    instead of paying for another SMS, concurrent taps for one phone are serialized
+    so only the first one sends, and more than ``send_limit`` sends per window are
+    refused. Sent messages are tracked by id; ``poll_statuses`` checks them in
+    batches from a background task and records delivery latency.
+    """
+
+    def __init__(
+        self,
+        transport: SmsTransport,
+        cooldown: float = SMS_RESEND_COOLDOWN_SECONDS,
+        send_limit: int = SMS_SEND_LIMIT,
+        send_limit_window: float = SMS_SEND_LIMIT_WINDOW_SECONDS,
+        status_batch_size: int = SMS_STATUS_BATCH_SIZE,
+        status_give_up: float = SMS_STATUS_GIVE_UP_SECONDS,
+    ) -> None:
+        self.transport = transport
+        self.cooldown = cooldown
+        self.send_limit = send_limit
+        self.send_limit_window = send_limit_window
+        self.status_batch_size = status_batch_size
+        self.status_give_up = status_give_up
+        self._phones: OrderedDict[str, _PhoneHistory] = OrderedDict()
+        self._phone_locks = KeyedLock()
+        self._tracking: OrderedDict[str, _SentMessage] = OrderedDict()
+        self._latencies: list[float] = []
+        self.sent = 0
+        self.deduplicated = 0
+        self.limited = 0
+        self.failed = 0
+        self.delivered = 0
+        self.undelivered = 0
+        self.unconfirmed = 0
+
+    async def send_code(self, phone: str) -> str | None:
+        async with self._phone_locks(phone):
+            now = time.monotonic()
+            self._forget_stale(now)
+            history = self._phones.get(phone)
+            if history is not None and now - history.sent_at < self.cooldown:
+                self.deduplicated += 1
+                logger.info("SMS code for %s sent %.0fs ago, reusing it", phone, now - history.sent_at)
+                return history.code
+            recent = [at for at in history.sends if now - at < self.send_limit_window] if history else []
+            if len(recent) >= self.send_limit:
+                self.limited += 1
+                logger.warning("SMS send limit reached for %s", phone)
+                return None
+
+            code = str(randint(10, 99))
+            try:
+                message_id = await self.transport.send(phone, SMS_CODE_MESSAGE.format(code=code))
+            except SmsError as exc:
+                self.failed += 1
+                logger.error("SMS code for %s not sent: %s", phone, exc)
+                return None
+            except Exception:
+                self.failed += 1
+                logger.exception("SMS code for %s not sent", phone)
+                return None
+
+            sent_at = time.monotonic()
+            recent.append(sent_at)
+            # Re-inserted at the end: the map stays ordered by last send for _forget_stale.
+            self._phones.pop(phone, None)
+            self._phones[phone] = _PhoneHistory(code, sent_at, recent)
+            self._tracking[message_id] = _SentMessage(message_id, phone, sent_at)
+            self.sent += 1
+            logger.info("SMS code sent to %s, message id %s", phone, message_id)
+            return code
+
+    def _forget_stale(self, now: float) -> None:
+        horizon = max(self.cooldown, self.send_limit_window)
+        while self._phones:
+            phone, history = next(iter(self._phones.items()))
+            if now - history.sent_at < horizon:
+                break
+            del self._phones[phone]
+
+    async def poll_statuses(self) -> None:
+        now = time.monotonic()
+        for message_id in [m for m, sent in self._tracking.items() if now - sent.sent_at > self.status_give_up]:
+            sent = self._tracking.pop(message_id)
+            self.unconfirmed += 1
+            logger.warning("SMS %s to %s: no final status after %.0fs", message_id, sent.phone, now - sent.sent_at)
+
+        pending = list(self._tracking.values())
+        for start in range(0, len(pending), self.status_batch_size):
+            batch = pending[start:start + self.status_batch_size]
+            try:
+                statuses = await self.transport.statuses([(sent.message_id, sent.phone) for sent in batch])
+            except SmsError as exc:
+                logger.warning("SMS status lookup failed: %s", exc)
+                return
+            checked_at = time.monotonic()
+            for sent in batch:
+                status = statuses.get(sent.message_id)
+                if status is None or not status.final:
+                    continue
+                self._tracking.pop(sent.message_id, None)
+                latency = checked_at - sent.sent_at
+                if status.delivered:
+                    self.delivered += 1
+                    self._latencies.append(latency)
+                    del self._latencies[:-SMS_LATENCY_SAMPLES]
+                    logger.info("SMS %s to %s delivered within %.1fs", sent.message_id, sent.phone, latency)
+                else:
+                    self.undelivered += 1
+                    logger.warning(
+                        "SMS %s to %s not delivered: status %s, error %s",
+                        sent.message_id, sent.phone, status.code, status.error,
+                    )
+
+    def stats(self) -> dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "sent": self.sent,
+            "deduplicated": self.deduplicated,
+            "limited": self.limited,
+            "failed": self.failed,
+            "awaiting_status": len(self._tracking),
+            "delivered": self.delivered,
+            "undelivered": self.undelivered,
+            "unconfirmed": self.unconfirmed,
+            # Upper bound: a message is seen delivered at the first poll after it was.
+            "delivery_p50_s": round(latencies[len(latencies) // 2], 1) if latencies else None,
+            "delivery_max_s": round(latencies[-1], 1) if latencies else None,
+        }
+
+
+def _default_transport() -> SmsTransport:
+    if SMS_TRANSPORT == "fake":
+        return FakeSmsTransport()
+    return SmscTransport()
+
+
+sms_gateway = SmsGateway(_default_transport())
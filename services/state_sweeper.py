@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterable
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import ConversationState
+from services.platform import is_schema_unavailable_error
+from services.write_coordinator import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+STATE_SWEEP_SECONDS = 3600.0
+STATE_SWEEP_BATCH_SIZE = 500
+# Upper bound per run so a large backlog is worked off over several runs.
+STATE_SWEEP_MAX_BATCHES = 20
+
+
+@dataclass(frozen=True, slots=True)
+class StateTtl:
+    """Conversations of ``provider`` untouched for ``ttl`` are dropped.
+
+    ``state=None`` is the provider default; a rule for a specific state wins over it.
+    """
+
+    provider: str
+    state: str | None
+    ttl: timedelta
+
+
+DEFAULT_STATE_TTLS = (
+    StateTtl("telegram", None, timedelta(days=30)),
+    # An SMS code is useless the next day: restart the flow instead.
+    StateTtl("telegram", "MyStates:check_sms", timedelta(days=1)),
+    StateTtl("max", None, timedelta(days=14)),
+    StateTtl("max", "wait_sms", timedelta(days=1)),
+    StateTtl("max", "wait_link_sms", timedelta(days=1)),
+)
+
+
+class ConversationStateSweeper:
+    """Deletes abandoned ``conversation_state`` rows in bounded batches.
+
+    Every statement walks ``ix_conversation_state_provider_updated_at``, so a sweep
+    touches only expired rows. Listeners get the deleted storage keys so in-memory
+    tiers can forget them.
+    """
+
+    def __init__(
+        self,
+        policies: Iterable[StateTtl] = DEFAULT_STATE_TTLS,
+        writer=write_coordinator,
+        batch_size: int = STATE_SWEEP_BATCH_SIZE,
+        max_batches: int = STATE_SWEEP_MAX_BATCHES,
+    ) -> None:
+        self.policies = tuple(policies)
+        self.writer = writer
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._listeners: list[Callable[[list[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[list[str]], None]) -> None:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _expired_condition(self, policy: StateTtl, now: datetime):
+        condition = (ConversationState.provider == policy.provider) & (
+            ConversationState.updated_at < now - policy.ttl
+        )
+        if policy.state is not None:
+            return condition & (ConversationState.state == policy.state)
+        # States that have their own rule are left to it.
+        own_states = [p.state for p in self.policies if p.provider == policy.provider and p.state is not None]
+        if own_states:
+            condition = condition & (
+                ConversationState.state.is_(None) | ConversationState.state.notin_(own_states)
+            )
+        return condition
+
+    async def _delete_batch(self, condition) -> list[str]:
+        table = ConversationState.__table__
+        expired_ids = select(table.c.id).where(condition).limit(self.batch_size)
+        stmt = delete(table).where(table.c.id.in_(expired_ids)).returning(table.c.storage_key)
+
+        async def write(session) -> list[str]:
+            return list((await session.execute(stmt)).scalars())
+
+        return await self.writer.submit(write)
+
+    async def sweep(self, now: datetime | None = None) -> int:
+        now = now or datetime.utcnow()
+        deleted = 0
+        batches = 0
+        try:
+            for policy in self.policies:
+                condition = self._expired_condition(policy, now)
+                while batches < self.max_batches:
+                    keys = await self._delete_batch(condition)
+                    batches += 1
+                    deleted += len(keys)
+                    if keys:
+                        for listener in self._listeners:
+                            listener(keys)
+                    if len(keys) < self.batch_size:
+                        break
+        except SQLAlchemyError as exc:
+            if is_schema_unavailable_error(exc):
+                logger.info("Conversation state sweep skipped: platform schema is unavailable")
+                return deleted
+            raise
+        if deleted:
+            logger.info("Removed %s expired conversation states", deleted)
+        return deleted
+
+
+state_sweeper = ConversationStateSweeper()
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, event, func, inspect, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Company, RegistryCounter, User, User_volunteer
+from services.write_coordinator import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+STATS_REBUILD_SECONDS = 3600.0
+
+USER_STATUSES = ("registered", "not registered", "blocked", "deleted")
+DEFAULT_USER_STATUS = "not registered"
+
+# registry_counter names; every stats counter shares the "stats." prefix.
+STATS_PREFIX = "stats."
+USERS_TOTAL = "stats.users"
+COMPANIES_TOTAL = "stats.companies"
+VOLUNTEERS_TOTAL = "stats.volunteers"
+_STATUS_PREFIX = "stats.status:"
+_COMPANY_USERS_PREFIX = "stats.company_users:"
+_COMPANY_REGISTERED_PREFIX = "stats.company_registered:"
+
+
+def status_counter(status: str) -> str:
+    return f"{_STATUS_PREFIX}{status}"
+
+
+def company_users_counter(company_id: int) -> str:
+    return f"{_COMPANY_USERS_PREFIX}{company_id}"
+
+
+def company_registered_counter(company_id: int) -> str:
+    return f"{_COMPANY_REGISTERED_PREFIX}{company_id}"
+
+
+@dataclass(slots=True)
+class RegistrationWindows:
+    today: int = 0
+    last_24h: int = 0
+    last_7d: int = 0
+    last_30d: int = 0
+
+
+@dataclass(slots=True)
+class RegistryStats:
+    users: int = 0
+    companies: int = 0
+    volunteers: int = 0
+    by_status: dict[str, int] = field(default_factory=dict)
+    company_users: dict[int, int] = field(default_factory=dict)
+    company_registered: dict[int, int] = field(default_factory=dict)
+
+    def status(self, status: str) -> int:
+        return self.by_status.get(status, 0)
+
+    @classmethod
+    def from_counters(cls, counters: dict[str, int]) -> "RegistryStats":
+        stats = cls(
+            users=counters.get(USERS_TOTAL, 0),
+            companies=counters.get(COMPANIES_TOTAL, 0),
+            volunteers=counters.get(VOLUNTEERS_TOTAL, 0),
+        )
+        for name, value in counters.items():
+            if name.startswith(_STATUS_PREFIX):
+                stats.by_status[name[len(_STATUS_PREFIX):]] = value
+            elif name.startswith(_COMPANY_USERS_PREFIX):
+                stats.company_users[int(name[len(_COMPANY_USERS_PREFIX):])] = value
+            elif name.startswith(_COMPANY_REGISTERED_PREFIX):
+                stats.company_registered[int(name[len(_COMPANY_REGISTERED_PREFIX):])] = value
+        return stats
+
+
+_UNKNOWN = object()
+
+
+def _old_new(state, attr: str, default=None):
+    """(value before this flush, value after it); the old value is _UNKNOWN if it was never loaded."""
+    history = state.attrs[attr].history
+    if not history.has_changes():
+        value = history.unchanged[0] if history.unchanged else _UNKNOWN
+        return value, value
+    old = history.deleted[0] if history.deleted else _UNKNOWN
+    new = history.added[0] if history.added else None
+    return old, new if new is not None else default
+
+
+def _user_contribution(status, company_id) -> Counter:
+    status = status or DEFAULT_USER_STATUS
+    deltas = Counter({USERS_TOTAL: 1, status_counter(status): 1})
+    if company_id is not None:
+        deltas[company_users_counter(company_id)] += 1
+        if status == "registered":
+            deltas[company_registered_counter(company_id)] += 1
+    return deltas
+
+
+def _subtract(deltas: Counter, other: Counter) -> None:
+    for name, value in other.items():
+        deltas[name] -= value
+
+
+def _increment_statement(connection, deltas: dict[str, int]):
+    table = RegistryCounter.__table__
+    dialect_insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    now = datetime.utcnow()
+    stmt = dialect_insert(table).values(
+        [{"name": name, "value": value, "updated_at": now} for name, value in deltas.items()]
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={"value": table.c.value + stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+    )
+
+
+class StatsService:
+    """Registry statistics kept as counters in ``registry_counter``.
+
+    Counters are adjusted by a session ``after_flush`` hook, so they are written in the
+    same transaction as the status / company change that caused them. Writers that bypass
+    the ORM (import scripts, raw SQL) are reconciled by ``rebuild``.
+    """
+
+    def __init__(self, session_factory=SessionLocal, writer=write_coordinator) -> None:
+        self.session_factory = session_factory
+        self.writer = writer
+        self._installed = False
+
+    @property
+    def installed(self) -> bool:
+        return self._installed
+
+    async def start(self) -> bool:
+        """Rebuild the counters and start maintaining them; False if ``registry_counter`` is missing."""
+        try:
+            await self.rebuild()
+        except SQLAlchemyError:
+            logger.warning("registry_counter is unavailable, stats counters disabled", exc_info=True)
+            return False
+        if not self._installed:
+            event.listen(Session, "after_flush", self._after_flush)
+            self._installed = True
+        return True
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        deltas: Counter = Counter()
+        unknown = False
+
+        for obj in session.new:
+            if isinstance(obj, User):
+                deltas.update(_user_contribution(obj.status, obj.company_id))
+            elif isinstance(obj, Company):
+                deltas[COMPANIES_TOTAL] += 1
+            elif isinstance(obj, User_volunteer):
+                deltas[VOLUNTEERS_TOTAL] += 1
+
+        for obj in session.deleted:
+            if isinstance(obj, User):
+                state = inspect(obj)
+                status, _ = _old_new(state, "status")
+                company_id, _ = _old_new(state, "company_id")
+                if status is _UNKNOWN or company_id is _UNKNOWN:
+                    unknown = True
+                    continue
+                _subtract(deltas, _user_contribution(status, company_id))
+            elif isinstance(obj, Company):
+                deltas[COMPANIES_TOTAL] -= 1
+            elif isinstance(obj, User_volunteer):
+                deltas[VOLUNTEERS_TOTAL] -= 1
+
+        for obj in session.dirty:
+            if not isinstance(obj, User) or obj in session.deleted:
+                continue
+            state = inspect(obj)
+            old_status, new_status = _old_new(state, "status", DEFAULT_USER_STATUS)
+            old_company, new_company = _old_new(state, "company_id")
+            if old_status == new_status and old_company == new_company:
+                continue
+            if old_status is _UNKNOWN or old_company is _UNKNOWN:
+                unknown = True
+                continue
+            _subtract(deltas, _user_contribution(old_status, old_company))
+            deltas.update(_user_contribution(new_status, new_company))
+
+        if unknown:
+            logger.warning("Stats counters skipped a change with an unloaded previous value; next rebuild fixes it")
+
+        deltas = {name: value for name, value in deltas.items() if value}
+        if deltas:
+            connection = session.connection()
+            connection.execute(_increment_statement(connection, deltas))
+
+    @staticmethod
+    async def _recount(session) -> Counter:
+        """Every counter from one conditional-aggregation pass over ``user``."""
+        user_stmt = select(
+            User.company_id,
+            func.count(User.id),
+            *(func.sum(case((User.status == status, 1), else_=0)) for status in USER_STATUSES),
+        ).group_by(User.company_id)
+        totals_stmt = select(
+            select(func.count(Company.id)).scalar_subquery(),
+            select(func.count(User_volunteer.id)).scalar_subquery(),
+        )
+
+        counters: Counter = Counter()
+        for company_id, total, *by_status in (await session.execute(user_stmt)).all():
+            counters[USERS_TOTAL] += total
+            for status, value in zip(USER_STATUSES, by_status):
+                counters[status_counter(status)] += value or 0
+            if company_id is not None:
+                counters[company_users_counter(company_id)] = total
+                counters[company_registered_counter(company_id)] = by_status[0] or 0
+        companies, volunteers = (await session.execute(totals_stmt)).one()
+        counters[COMPANIES_TOTAL] = companies
+        counters[VOLUNTEERS_TOTAL] = volunteers
+        for status in USER_STATUSES:
+            counters.setdefault(status_counter(status), 0)
+        return counters
+
+    async def rebuild(self) -> RegistryStats:
+        """Recount everything and replace the stored counters.
+
+        Recount and replacement are one write operation, so no change can land in
+        between: on SQLite the writer holds the write lock from ``BEGIN IMMEDIATE``,
+        on PostgreSQL concurrent counter increments wait on the table lock taken
+        before the recount.
+        """
+        async def write(session) -> Counter:
+            if session.bind.dialect.name == "postgresql":
+                await session.execute(text("LOCK TABLE registry_counter IN SHARE ROW EXCLUSIVE MODE"))
+            counters = await self._recount(session)
+            now = datetime.utcnow()
+            await session.execute(delete(RegistryCounter).where(RegistryCounter.name.startswith(STATS_PREFIX)))
+            await session.execute(
+                insert(RegistryCounter),
+                [{"name": name, "value": value, "updated_at": now} for name, value in counters.items()],
+            )
+            return counters
+
+        counters = await self.writer.submit(write)
+
+        logger.info("Stats counters rebuilt: %s users, %s companies", counters[USERS_TOTAL], counters[COMPANIES_TOTAL])
+        return RegistryStats.from_counters(dict(counters))
+
+    async def snapshot(self) -> RegistryStats:
+        """All counters in one read of ``registry_counter`` (a live recount until ``start`` succeeded)."""
+        async with self.session_factory() as session:
+            if not self._installed:
+                return RegistryStats.from_counters(dict(await self._recount(session)))
+            rows = (
+                await session.execute(
+                    select(RegistryCounter.name, RegistryCounter.value)
+                    .where(RegistryCounter.name.startswith(STATS_PREFIX))
+                )
+            ).all()
+        return RegistryStats.from_counters({name: value for name, value in rows})
+
+    async def registration_windows(self, now: datetime | None = None) -> RegistrationWindows:
+        """Registrations for today / 24h / 7d / 30d in a single conditional-aggregation query."""
+        now = now or datetime.utcnow()
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        since_24h = now - timedelta(hours=24)
+        since_7d = now - timedelta(days=7)
+        since_30d = now - timedelta(days=30)
+        oldest = min(today_start, since_30d)
+
+        def since(moment: datetime):
+            return func.sum(case((User.registered_at >= moment, 1), else_=0))
+
+        stmt = select(since(today_start), since(since_24h), since(since_7d), since(since_30d)).where(
+            User.status == "registered",
+            User.registered_at >= oldest,
+        )
+        async with self.session_factory() as session:
+            today, last_24h, last_7d, last_30d = (await session.execute(stmt)).one()
+        return RegistrationWindows(
+            today=today or 0,
+            last_24h=last_24h or 0,
+            last_7d=last_7d or 0,
+            last_30d=last_30d or 0,
+        )
+
+
+registry_stats = StatsService()
+
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar, Token
+from typing import AsyncIterator, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import ReadSessionLocal
+from services.write_coordinator import WriteOp, write_coordinator
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_current_unit: ContextVar[UnitOfWork | None] = ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    """Database work of one incoming update.
+
+    Lookups share one read session. It takes a pooled connection on the first query
+    of a ``read_session()`` block and gives it back when the block ends, so the
+    handler's network calls do not hold a connection. Writes still go through the
+    single writer instead of a transaction held open across the handler: ``write`` is
+    for results the handler needs right away, ``write_later`` for bookkeeping
+    (identity links, names) that is queued together with the next ``write`` or once
+    at the end of the update. Each deferred write is its own writer operation, so a
+    failing ``write`` does not roll it back; a failing deferred write is logged.
+    Deferred writes of an update that failed are dropped.
+    """
+
+    def __init__(self, session_factory=ReadSessionLocal, writer=write_coordinator) -> None:
+        self.session_factory = session_factory
+        self.writer = writer
+        self._session: AsyncSession | None = None
+        self._session_depth = 0
+        self._deferred: list[WriteOp] = []
+        self._token: Token | None = None
+        self.closed = False
+        self.sessions_opened = 0
+        self.commits = 0
+
+    def enter(self) -> UnitOfWork:
+        self._token = _current_unit.set(self)
+        return self
+
+    async def exit(self, error: BaseException | None = None) -> None:
+        try:
+            if error is None and self._deferred:
+                try:
+                    await self._commit(None)
+                except Exception:
+                    logger.exception("Deferred writes of an update failed")
+        finally:
+            self.closed = True
+            self._deferred.clear()
+            if self._session is not None:
+                session, self._session = self._session, None
+                await session.close()
+            if self._token is not None:
+                _current_unit.reset(self._token)
+                self._token = None
+
+    async def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self.session_factory()
+            self.sessions_opened += 1
+        return self._session
+
+    @asynccontextmanager
+    async def reading(self) -> AsyncIterator[AsyncSession]:
+        session = await self.session()
+        self._session_depth += 1
+        try:
+            yield session
+        finally:
+            self._session_depth -= 1
+            if self._session_depth == 0:
+                # Returns the connection to the pool and drops the identity map;
+                # the next lookup checks a connection out again.
+                await session.close()
+
+    def write_later(self, operation: WriteOp) -> None:
+        self._deferred.append(operation)
+
+    async def write(self, operation: WriteOp[T]) -> T:
+        return await self._commit(operation)
+
+    async def _commit(self, operation: WriteOp[T] | None) -> T | None:
+        deferred, self._deferred = self._deferred, []
+        # Queued in one go, so they still share the writer's batch and commit.
+        futures = [self.writer.enqueue(op) for op in deferred]
+        if operation is not None:
+            futures.append(self.writer.enqueue(operation))
+        outcomes = await asyncio.gather(*futures, return_exceptions=True)
+        self.commits += 1
+        for outcome in outcomes[:len(deferred)]:
+            if isinstance(outcome, BaseException):
+                logger.error("Deferred write dropped", exc_info=outcome)
+        if operation is None:
+            return None
+        if isinstance(outcomes[-1], BaseException):
+            raise outcomes[-1]
+        return outcomes[-1]
+
+
+def current_unit() -> UnitOfWork | None:
+    unit = _current_unit.get()
+    # Tasks spawned by a handler inherit the context and may outlive the update.
+    return unit if unit is not None and not unit.closed else None
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    unit = UnitOfWork().enter()
+    try:
+        yield unit
+    except BaseException as exc:
+        await unit.exit(exc)
+        raise
+    else:
+        await unit.exit()
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """The update's read session, or a short-lived one outside of an update."""
+    unit = current_unit()
+    if unit is None:
+        async with ReadSessionLocal() as session:
+            yield session
+        return
+    async with unit.reading() as session:
+        yield session
+
+
+async def submit_write(operation: WriteOp[T]) -> T:
+    unit = current_unit()
+    if unit is None:
+        return await write_coordinator.submit(operation)
+    return await unit.write(operation)
+
+
+async def defer_write(operation: WriteOp) -> None:
+    unit = current_unit()
+    if unit is None:
+        await write_coordinator.submit(operation)
+    else:
+        unit.write_later(operation)
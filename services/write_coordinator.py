@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from db import create_app_engine, engine
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_MAX_OPS = 64
+# How long the writer waits for more operations after the first one of a batch.
+WRITE_BATCH_WINDOW_SECONDS = 0.002
+
+T = TypeVar("T")
+WriteOp = Callable[[AsyncSession], Awaitable[T]]
+
+
+@dataclass(slots=True)
+class _PendingWrite:
+    operation: WriteOp
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+def create_writer_engine(base=engine):
+    """One connection to ``base``'s database, ``BEGIN IMMEDIATE`` transactions and working SAVEPOINTs.
+
+    pysqlite opens transactions lazily and does not emit SAVEPOINT properly, so the
+    driver's own transaction handling is switched off and SQLAlchemy's ``begin``
+    takes the write lock up front instead of upgrading a read lock mid-transaction.
+    A server database allows concurrent writers, so there ``base`` itself is reused.
+    """
+    if base.dialect.name != "sqlite":
+        return base
+    writer = create_app_engine(
+        base.url.render_as_string(hide_password=False),
+        poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0,
+    )
+
+    @event.listens_for(writer.sync_engine, "connect")
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer.sync_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return writer
+
+
+class WriteCoordinator:
+    """Single writer that drains a queue of write operations and commits them in groups.
+
+    ``submit`` hands over an ``async def op(session)`` that only stages changes (no
+    commit). Operations that arrive together share one transaction and one fsync; each
+    runs inside its own SAVEPOINT, so a failing one is rolled back and reported to its
+    caller without affecting the rest of the batch. The awaited result is available
+    only after the batch commit has succeeded.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        max_batch: int = WRITE_BATCH_MAX_OPS,
+        batch_window: float = WRITE_BATCH_WINDOW_SECONDS,
+    ) -> None:
+        self._session_factory = session_factory
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._queue: asyncio.Queue[_PendingWrite] | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.batches = 0
+        self.operations = 0
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            # Built lazily so importing the module does not open a second engine.
+            self._session_factory = async_sessionmaker(
+                bind=create_writer_engine(),
+                expire_on_commit=False,
+                class_=AsyncSession,
+            )
+        return self._session_factory
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.running and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run(), name="write_coordinator")
+
+    async def stop(self) -> None:
+        """Commit whatever is still queued, then stop the writer task."""
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.join()
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def enqueue(self, operation: WriteOp[T]) -> asyncio.Future[T]:
+        """Queue an operation without waiting; operations queued together land in one batch."""
+        self.start()
+        future = self._loop.create_future()
+        self._queue.put_nowait(_PendingWrite(operation, future))
+        return future
+
+    async def submit(self, operation: WriteOp[T]) -> T:
+        return await self.enqueue(operation)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            try:
+                if self.batch_window and queue.empty():
+                    await asyncio.sleep(self.batch_window)
+                while len(batch) < self.max_batch and not queue.empty():
+                    batch.append(queue.get_nowait())
+                await self._commit_batch(batch)
+            except asyncio.CancelledError:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.cancel()
+                raise
+            except Exception as exc:
+                logger.exception("Write batch of %s operations failed", len(batch))
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(exc)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _commit_batch(self, batch: list[_PendingWrite]) -> None:
+        outcomes: list[tuple[_PendingWrite, bool, Any]] = []
+        async with self.session_factory() as session:
+            async with session.begin():
+                for item in batch:
+                    if item.future.cancelled():
+                        continue
+                    try:
+                        async with session.begin_nested():
+                            value = await item.operation(session)
+                    except Exception as exc:
+                        outcomes.append((item, False, exc))
+                    else:
+                        outcomes.append((item, True, value))
+
+        self.batches += 1
+        self.operations += len(batch)
+        logger.debug(
+            "Committed %s writes, oldest waited %.1f ms",
+            len(batch), (time.monotonic() - batch[0].enqueued_at) * 1000,
+        )
+        for item, ok, value in outcomes:
+            if item.future.done():
+                continue
+            if ok:
+                item.future.set_result(value)
+            else:
+                item.future.set_exception(value)
+
+
+write_coordinator = WriteCoordinator()
@@ -0,0 +1,47 @@
+import pytest
+
+from services.conversation_state_cache import ConversationStateCache, StateAddress
+from services.platform import PlatformSchemaUnavailable
+
+pytestmark = pytest.mark.anyio
+
+
+class SchemaMissingService:
+    """Conversation state storage before the platform migration has run."""
+
+    def __init__(self) -> None:
+        self.available = False
+        self.stored: dict[tuple[int, int], tuple] = {}
+
+    async def load(self, chat_id, user_id, **address):
+        if not self.available:
+            raise PlatformSchemaUnavailable("conversation_state is missing")
+        return self.stored.get((chat_id, user_id))
+
+    async def store(self, chat_id, user_id, state, data, **address):
+        if not self.available:
+            raise PlatformSchemaUnavailable("conversation_state is missing")
+        self.stored[(chat_id, user_id)] = (state, data)
+
+    async def delete_state(self, chat_id, user_id, **address):
+        self.stored.pop((chat_id, user_id), None)
+
+
+async def test_unwritten_states_are_pinned_until_schema_exists():
+    service = SchemaMissingService()
+    cache = ConversationStateCache(service, max_entries=2)
+
+    await cache.set_state("1", StateAddress(1, 1), "asking_name")
+    # Lookups of other users push the LRU past its size.
+    for user_id in range(2, 6):
+        assert await cache.get_state(str(user_id), StateAddress(user_id, user_id)) is None
+
+    assert await cache.get_state("1", StateAddress(1, 1)) == "asking_name"
+    assert cache.dirty_count == 1
+    assert cache.dropped == 0
+
+    service.available = True
+    cache._entries["1"].retry_at = 0.0
+    assert await cache.flush() == 1
+    assert service.stored[(1, 1)] == ("asking_name", {})
+    assert cache.dirty_count == 0
@@ -0,0 +1,236 @@
+import asyncio
+from datetime import date
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+import db
+from db import sync_database_url
+from models import Company, ConversationState, User, UserIdentity
+from services import data_revision
+from services.conversation_state_service import ConversationStateService
+from services.identity_cache import ANY_PROVIDER, MISSING, USER, VOLUNTEER, IdentityCache, identity_revision_name
+from services.search_index import SearchIndex
+from services.stats import StatsService, _increment_statement
+
+pytestmark = pytest.mark.anyio
+
+ALEMBIC_DIR = Path(__file__).resolve().parent.parent / "alembic"
+# Last revision before the ones that added registry_counter, rollups, search and indexes.
+PRE_COUNTER_REVISION = "6f0f3d0d8d6a"
+
+
+def person(last_name: str, first_name: str, **fields) -> User:
+    fields.setdefault("date_of_birth", date(1990, 1, 1))
+    fields.setdefault("counter", 0)
+    return User(last_name=last_name, first_name=first_name, **fields)
+
+
+async def add(database, *objects) -> None:
+    async def write(session):
+        session.add_all(objects)
+
+    await database.writer.submit(write)
+
+
+@pytest.fixture
+async def stats(database):
+    service = StatsService(database.session_factory, writer=database.writer)
+    assert await service.start()
+    yield service
+    event.remove(Session, "after_flush", service._after_flush)
+
+
+@pytest.fixture
+async def revision_tracking(database):
+    assert await data_revision.install_revision_tracking(database.writer)
+    yield
+    event.remove(Session, "after_flush", data_revision._mark_dirty)
+    event.remove(Session, "before_commit", data_revision._bump_on_commit)
+    event.remove(Session, "after_rollback", data_revision._clear_on_rollback)
+    data_revision._installed = False
+
+
+@pytest.fixture
+async def identity_cache(database):
+    cache = IdentityCache()
+    cache.install_tracking()
+    yield cache
+    event.remove(Session, "after_flush", cache._after_flush)
+    event.remove(Session, "before_commit", cache._before_commit)
+    event.remove(Session, "after_commit", cache._after_commit)
+    event.remove(Session, "after_rollback", cache._after_rollback)
+
+
+async def bump_elsewhere(database, kind: str, provider: str) -> None:
+    """A revision bump as the other process would commit it."""
+    async def write(session):
+        connection = await session.connection()
+        await session.execute(_increment_statement(connection, {identity_revision_name(kind, provider): 1}))
+
+    await database.writer.submit(write)
+
+
+async def test_conversation_state_upserts(database):
+    service = ConversationStateService(session_factory=database.session_factory, writer=database.writer)
+
+    assert await service.load(10, 20) is None
+    await service.store(10, 20, "asking_name", {"step": 1})
+    assert await service.load(10, 20) == ("asking_name", {"step": 1})
+
+    # The same key again is an update of the one row, not a second insert.
+    await service.store(10, 20, "asking_phone", {"step": 2})
+    await service.set_state(10, 20, "confirming")
+    assert await service.load(10, 20) == ("confirming", {"step": 2})
+
+    await service.set_data(10, 20, "phone", "+79990000000")
+    assert await service.get_data(10, 20) == {"step": 2, "phone": "+79990000000"}
+
+    async with database.session_factory() as session:
+        assert len((await session.scalars(select(ConversationState))).all()) == 1
+
+    assert await service.delete_state(10, 20)
+    assert await service.load(10, 20) is None
+
+
+async def test_stats_counters_follow_orm_writes(database, stats):
+    company = Company(name="Завод")
+    await add(database, company)
+    user = person("Иванов", "Иван", company_id=company.id)
+    await add(database, user, person("Петров", "Пётр"))
+
+    snapshot = await stats.snapshot()
+    assert (snapshot.users, snapshot.companies) == (2, 1)
+    assert snapshot.status("not registered") == 2
+    assert snapshot.company_users == {company.id: 1}
+
+    async def register(session):
+        (await session.get(User, user.id)).status = "registered"
+
+    await database.writer.submit(register)
+
+    snapshot = await stats.snapshot()
+    assert snapshot.status("registered") == 1
+    assert snapshot.status("not registered") == 1
+    assert snapshot.company_registered == {company.id: 1}
+    assert await stats.rebuild() == snapshot
+
+
+async def test_stats_rebuild_keeps_concurrent_writes(database, stats):
+    await add(database, *(person(f"Сидоров{n}", "Сидор") for n in range(10)))
+
+    async def register_all(session):
+        for user in (await session.scalars(select(User))).all():
+            user.status = "registered"
+
+    await asyncio.gather(stats.rebuild(), database.writer.submit(register_all), stats.rebuild())
+
+    snapshot = await stats.snapshot()
+    assert snapshot.status("registered") == 10
+    assert snapshot.status("not registered") == 0
+    assert await stats.rebuild() == snapshot
+
+
+async def test_data_revision_counts_registry_commits(database, revision_tracking):
+    assert await data_revision.revision_counter(database.session_factory) == 0
+
+    await add(database, Company(name="Завод"))
+    assert await data_revision.revision_counter(database.session_factory) == 1
+
+    # Conversation state is not registry data.
+    service = ConversationStateService(session_factory=database.session_factory, writer=database.writer)
+    await service.store(10, 20, "asking_name", {})
+    assert await data_revision.revision_counter(database.session_factory) == 1
+
+
+async def test_identity_cache_drops_only_foreign_scopes(database, identity_cache):
+    assert await identity_cache.sync_revision(database.session_factory) == 0
+    identity_cache.set(USER, "telegram", 1, 10)
+    identity_cache.set(USER, "max", 2, 20)
+    identity_cache.set(VOLUNTEER, "telegram", 3, 30)
+
+    # This process's own registrations bump the revisions but keep the cache.
+    user = person("Иванов", "Иван", tg_id=1001)
+    await add(database, user)
+    await add(database, UserIdentity(user_id=user.id, provider="max", external_user_id="2001"))
+    assert await identity_cache.sync_revision(database.session_factory) == 0
+    assert identity_cache.get(USER, "max", 2) == 20
+
+    await bump_elsewhere(database, USER, "max")
+    assert await identity_cache.sync_revision(database.session_factory) == 1
+    assert identity_cache.get(USER, "max", 2) is MISSING
+    assert identity_cache.get(USER, "telegram", 1) == 10
+
+    # A deletion elsewhere may have unlinked any provider of that kind.
+    await bump_elsewhere(database, USER, ANY_PROVIDER)
+    assert await identity_cache.sync_revision(database.session_factory) == 1
+    assert identity_cache.get(USER, "telegram", 1) is MISSING
+    assert identity_cache.get(VOLUNTEER, "telegram", 3) == 30
+
+
+async def test_identity_cache_tracks_deletions(database, identity_cache):
+    user = person("Петров", "Пётр")
+    await add(database, user)
+
+    async def delete(session):
+        await session.delete(await session.get(User, user.id))
+
+    await database.writer.submit(delete)
+    revisions = await data_revision.revision_counters("identity:", database.session_factory)
+    assert revisions == {identity_revision_name(USER, ANY_PROVIDER): 1}
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("иванов", {"Иванов"}),
+        ("ИВАН", {"Иванов"}),
+        ("елкин", {"Ёлкин"}),
+        ("Ив", {"Иванов"}),
+        ("ел", {"Ёлкин"}),
+        ("7999", {"Петров"}),
+        ("нет такого", set()),
+    ],
+)
+async def test_user_search(database, query, expected):
+    await add(
+        database,
+        person("Иванов", "Иван", phone_number="+70000000000"),
+        person("Петров", "Пётр", phone_number="+79990001122"),
+        person("Ёлкин", "Семён"),
+    )
+    search = SearchIndex(database.session_factory)
+
+    async with database.session_factory() as session:
+        found = await session.scalars(select(User.last_name).where(await search.user_condition(query)))
+        assert set(found) == expected
+
+
+async def test_company_search(database):
+    await add(database, Company(name="Завод Ёлка"), Company(name="Фабрика"))
+    search = SearchIndex(database.session_factory)
+
+    async with database.session_factory() as session:
+        found = await session.scalars(select(Company.name).where(await search.company_condition("елка")))
+        assert set(found) == {"Завод Ёлка"}
+
+
+async def test_migrations_downgrade_and_upgrade(database, monkeypatch):
+    alembic_config = pytest.importorskip("alembic.config")
+    command = pytest.importorskip("alembic.command")
+    if database.dialect == "postgresql":
+        pytest.importorskip("psycopg")
+
+    # alembic/env.py takes the URL from db when DATABASE_URL is set, as it is for the tests.
+    monkeypatch.setattr(db, "SYNC_DATABASE_URI", sync_database_url(database.url))
+    config = alembic_config.Config()
+    config.set_main_option("script_location", str(ALEMBIC_DIR))
+    config.set_main_option("sqlalchemy.url", db.SYNC_DATABASE_URI.replace("%", "%%"))
+
+    command.stamp(config, "head")
+    command.downgrade(config, PRE_COUNTER_REVISION)
+    command.upgrade(config, "head")
+
+    assert await data_revision.revision_counter(database.session_factory) == 0
@@ -0,0 +1,39 @@
+import pytest
+
+from db import SessionLocal, engine, read_engine
+from services.query_plans import HOT_QUERIES, PlanRecorder
+
+pytestmark = pytest.mark.anyio
+
+# Tables that grow with the registry; a full scan of any of them on a hot path fails.
+GUARDED_TABLES = {"user", "user_volunteer", "user_identity", "volunteer_identity"}
+
+
+def guarded_scans(recorder: PlanRecorder) -> list[str]:
+    return [detail for detail in recorder.full_scans() if detail.split()[1] in GUARDED_TABLES]
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_query_uses_an_index(app_schema, name):
+    stmt = await HOT_QUERIES[name]()
+    async with SessionLocal() as session:
+        with PlanRecorder(session.bind) as recorder:
+            await session.execute(stmt)
+
+    assert recorder.plans
+    assert guarded_scans(recorder) == []
+
+
+async def test_bot_lookups_use_indexes(app_schema):
+    import functions
+
+    with PlanRecorder(engine) as writes, PlanRecorder(read_engine) as reads:
+        assert await functions.find_user_by_tg_id(1001) is False
+        assert await functions.is_volunteer(1001) is False
+        assert await functions.check_volunteer_exists(1) is False
+        assert await functions.prepare_user_info_for_admin(1) is None
+        await functions.get_user_stats()
+
+    assert reads.plans
+    assert guarded_scans(reads) == []
+    assert guarded_scans(writes) == []
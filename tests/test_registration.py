@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+from models import User
+from services.roster_index import roster_index
+from services.write_coordinator import write_coordinator
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def app_writer(app_schema):
+    yield write_coordinator
+    await write_coordinator.stop()
+    await write_coordinator.session_factory.kw["bind"].dispose()
+
+
+async def add_user(last_name: str, status: str) -> int:
+    async def write(session) -> int:
+        user = User(
+            last_name=last_name, first_name="Анна", date_of_birth=date(1985, 5, 5), counter=0, status=status,
+        )
+        session.add(user)
+        await session.flush()
+        return user.id
+
+    return await write_coordinator.submit(write)
+
+
+async def set_status(user_id: int, status: str) -> None:
+    async def write(session) -> None:
+        (await session.get(User, user_id)).status = status
+
+    await write_coordinator.submit(write)
+
+
+async def user_status(user_id: int) -> str:
+    async def read(session) -> str:
+        return (await session.get(User, user_id)).status
+
+    return await write_coordinator.submit(read)
+
+
+@pytest.mark.parametrize("status", ["blocked", "registered"])
+async def test_register_user_refuses_blocked_and_registered(app_writer, status):
+    from functions import register_user
+
+    user_id = await add_user(f"Анна-{status}", status)
+    registered = await register_user({
+        "id": user_id,
+        "name": "Анна",
+        "father_name": "",
+        "phone_number": "+70000000000",
+        "home_address": "",
+        "user_tg_id": 555,
+    })
+
+    assert registered is False
+    assert await user_status(user_id) == status
+
+
+async def test_roster_get_reads_status_from_db(app_writer):
+    user_id = await add_user("Снимкова", "not registered")
+    await roster_index.load()
+
+    # Registered by the other process after the snapshot was taken.
+    await set_status(user_id, "registered")
+    entry = await roster_index.get(user_id)
+
+    assert entry.status == "registered"
+    assert entry.date_of_birth == date(1985, 5, 5)
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from services.sms_gateway import FakeSmsTransport, SmsError, SmsGateway
+
+pytestmark = pytest.mark.anyio
+
+PHONE = "+79990000000"
+
+
+class CountingTransport(FakeSmsTransport):
+    """The fake transport, recording every status lookup and able to fail sends."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.status_calls: list[list[str]] = []
+        self.failures = 0
+
+    async def send(self, phone: str, message: str) -> str:
+        if self.failures:
+            self.failures -= 1
+            raise SmsError("smsc.ru error 9: too many requests")
+        return await super().send(phone, message)
+
+    async def statuses(self, messages):
+        self.status_calls.append([message_id for message_id, _ in messages])
+        return await super().statuses(messages)
+
+
+@pytest.fixture
+def transport():
+    return CountingTransport()
+
+
+async def test_repeat_within_cooldown_is_deduplicated(transport):
+    gateway = SmsGateway(transport)
+
+    codes = await asyncio.gather(*(gateway.send_code(PHONE) for _ in range(3)))
+    assert await gateway.send_code(PHONE) == codes[0]
+
+    assert len(set(codes)) == 1
+    assert len(transport.sent) == 1
+    assert (gateway.sent, gateway.deduplicated) == (1, 3)
+
+
+async def test_send_after_cooldown_pays_again(transport):
+    gateway = SmsGateway(transport, cooldown=0.0)
+
+    await gateway.send_code(PHONE)
+    await gateway.send_code(PHONE)
+
+    assert len(transport.sent) == 2
+    assert gateway.deduplicated == 0
+
+
+async def test_poller_batches_status_lookups(transport):
+    gateway = SmsGateway(transport, status_batch_size=3)
+    for number in range(7):
+        await gateway.send_code(f"+7999000000{number}")
+
+    await gateway.poll_statuses()
+
+    assert [len(batch) for batch in transport.status_calls] == [3, 3, 1]
+    assert gateway.delivered == 7
+    assert gateway.stats()["awaiting_status"] == 0
+
+    # Delivered messages are not asked about again.
+    await gateway.poll_statuses()
+    assert len(transport.status_calls) == 3
+
+
+async def test_transport_failure_does_not_start_cooldown(transport):
+    gateway = SmsGateway(transport)
+    transport.failures = 1
+
+    assert await gateway.send_code(PHONE) is None
+    assert gateway.failed == 1
+
+    # The next tap tries again instead of "reusing" a code that never went out.
+    code = await gateway.send_code(PHONE)
+    assert code is not None
+    assert [phone for _, phone, _ in transport.sent] == [PHONE]
+    assert gateway.deduplicated == 0
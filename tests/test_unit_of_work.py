@@ -0,0 +1,88 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event, func, select
+
+from models import Company, User
+from services.unit_of_work import UnitOfWork, read_session
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def unit(database):
+    unit = UnitOfWork(session_factory=database.session_factory, writer=database.writer).enter()
+    yield unit
+    await unit.exit()
+
+
+@pytest.fixture
+def connections(database):
+    """Connections of the read engine currently checked out of the pool."""
+    checked_out = []
+
+    def checkout(dbapi_connection, record, proxy):
+        checked_out.append(record)
+
+    def checkin(dbapi_connection, record):
+        checked_out.remove(record)
+
+    pool = database.engine.sync_engine.pool
+    event.listen(pool, "checkout", checkout)
+    event.listen(pool, "checkin", checkin)
+    yield checked_out
+    event.remove(pool, "checkout", checkout)
+    event.remove(pool, "checkin", checkin)
+
+
+async def count(database, model) -> int:
+    async with database.session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model))
+
+
+async def test_read_session_returns_connection_between_lookups(database, unit, connections):
+    async with read_session() as session:
+        await session.scalar(select(func.count()).select_from(User))
+        assert len(connections) == 1
+        # A nested block keeps using the same session and connection.
+        async with read_session() as inner:
+            assert inner is session
+            await inner.scalar(select(func.count()).select_from(Company))
+        assert len(connections) == 1
+    assert not connections
+
+    async with read_session() as session:
+        await session.scalar(select(func.count()).select_from(User))
+    assert not connections
+    assert unit.sessions_opened == 1
+
+
+async def test_deferred_writes_survive_failing_write(database, unit):
+    async def add_company(session):
+        session.add(Company(name="Завод"))
+
+    async def failing(session):
+        session.add(User(last_name="Иванов", first_name="Иван", date_of_birth=date(1990, 1, 1), counter=0))
+        await session.flush()
+        raise ValueError("handler failed")
+
+    unit.write_later(add_company)
+    with pytest.raises(ValueError):
+        await unit.write(failing)
+
+    assert await count(database, Company) == 1
+    assert await count(database, User) == 0
+
+
+async def test_failing_deferred_write_does_not_block_others(database, unit):
+    async def broken(session):
+        raise ValueError("bad bookkeeping")
+
+    async def add_company(session):
+        session.add(Company(name="Фабрика"))
+
+    unit.write_later(broken)
+    unit.write_later(add_company)
+    await unit.exit()
+
+    assert await count(database, Company) == 1
@@ -4,9 +4,11 @@ from dotenv import load_dotenv
 import os
 from pathlib import Path
 import shutil
-from telebot import async_telebot, asyncio_filters
+from telebot import async_telebot
 from emoji import emojize
 from modules.db_state_storage import DbStateStorage
+from modules.update_context import ContextStateFilter, UpdateContextMiddleware
+from modules.update_middleware import DuplicateUpdateMiddleware, UnitOfWorkMiddleware
 
 # Автоматическое создание .env из example.env если .env не существует
 env_path = Path('.env')
@@ -87,7 +89,13 @@ markup_default_volunteer.add(types.KeyboardButton("Регистрация"))
 markup_default = types.ReplyKeyboardMarkup(resize_keyboard=True)
 markup_default.add(types.KeyboardButton("Регистрация"),types.KeyboardButton("Мой профиль"))
 
-bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+# Первым: повторная доставка отменяется до остальных middleware
+bot.setup_middleware(DuplicateUpdateMiddleware(bot))
+# Состояние читается один раз на обновление (UpdateContextMiddleware), фильтр берёт его оттуда
+bot.add_custom_filter(ContextStateFilter(bot))
+bot.setup_middleware(UpdateContextMiddleware(bot))
+# Одна сессия чтения и один коммит отложенных записей на обновление
+bot.setup_middleware(UnitOfWorkMiddleware())
 
 # Режим продакшн - скрывает кнопки переключения режимов для разработчика
 PRODUCTION_MODE = True